@@ -1,2 +1 @@
-
-default_app_config = 'ai_collection.apps.AeyeCollectionConfig'
\ No newline at end of file
+default_app_config = 'ai_collection.apps.AeyeCollectionConfig'
@@ -1,4 +1,5 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.utils import unquote
 
 from .models import Paper, AuthorPaper
 from .models import Keyword, Method, AzureKey
@@ -8,13 +9,20 @@ from .models import ExperimentalStudy
 from .models import PATHOLOGY_CATEGORY_DEFAULT_DISPLAY
 from .models import _display_badge
 from .models import Topic
+from .models import Job, JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED, MANUAL_ENTRY
+from .models import CRAWL_PENDING, CRAWL_DONE, CRAWL_FAILED
 
 from django.conf import settings
-from ai_collection.azure_api import get_azurekeys
+from .jobs import enqueue, enqueue_paper_import, retry_jobs
 
-from .forms import PaperCreationForm, PaperChangeForm
+from .forms import PaperCreationForm, PaperChangeForm, PaperImportForm
 from .forms import BadgeClassForm
+from .templatetags.sizify import sizify
 from django.contrib.admin.options import IS_POPUP_VAR
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 
 from markdownx.widgets import AdminMarkdownxWidget
 from django.db import models
@@ -63,7 +71,7 @@ class AzureKeyAdmin(admin.ModelAdmin):
     def show_papers(self, azurekey):
         #papers = azurekey.papers.order_by('-publication_date')
         papers = azurekey.papers.all()
-        n_papers = papers.count()
+        n_papers = azurekey.paper_count
 
         tag = '''
                     <b>Total: </b> {count}
@@ -81,12 +89,13 @@ class AzureKeyAdmin(admin.ModelAdmin):
                           list_papers=list_papers)
 
     show_papers.short_description = "Papers"
+    show_papers.admin_order_field = 'paper_count'
 
     @mark_safe
     def show_datasets(self, azurekey):
         # papers = azurekey.papers.order_by('-publication_date')
         datasets = azurekey.datasets.all()
-        n_datasets = datasets.count()
+        n_datasets = azurekey.dataset_count
 
         tag = '''
                         <b>Total: </b> {d_count}
@@ -104,6 +113,7 @@ class AzureKeyAdmin(admin.ModelAdmin):
                           list_datasets=list_datasets)
 
     show_datasets.short_description = "Datasets"
+    show_datasets.admin_order_field = 'dataset_count'
 
 
 class MethodAdmin(ResourceTagAdmin):
@@ -113,7 +123,7 @@ class MethodAdmin(ResourceTagAdmin):
     @mark_safe
     def show_studies(self, method):
         studies = method.studies.order_by('-paper__publication_date')
-        n_studies = studies.count()
+        n_studies = method.study_count
         tag = '''
             <b>Total: </b> {count}
             <br>
@@ -140,6 +150,7 @@ class MethodAdmin(ResourceTagAdmin):
                           list_studies=list_study)
 
     show_studies.short_description = "Experimental Studies"
+    show_studies.admin_order_field = 'study_count'
 
 
 class KeywordAdmin(ResourceTagAdmin):
@@ -149,7 +160,7 @@ class KeywordAdmin(ResourceTagAdmin):
     @mark_safe
     def show_papers(self, keyword):
         papers = keyword.papers.order_by('-publication_date')
-        n_papers = papers.count()
+        n_papers = keyword.paper_count
 
         tag = '''
                 <b>Total: </b> {count}
@@ -167,11 +178,12 @@ class KeywordAdmin(ResourceTagAdmin):
                           list_papers=list_papers)
 
     show_papers.short_description = "Papers"
+    show_papers.admin_order_field = 'paper_count'
 
     @mark_safe
     def show_datasets(self, keyword):
         datasets = keyword.datasets.order_by('-release_year')
-        n_datasets = datasets.count()
+        n_datasets = keyword.dataset_count
         tag = '''
                         <b>Total: </b> {count}
                         <br>
@@ -188,6 +200,7 @@ class KeywordAdmin(ResourceTagAdmin):
                           list_datasets=list_datasets)
 
     show_datasets.short_description = "Datasets"
+    show_datasets.admin_order_field = 'dataset_count'
 
 
 class PathologyCategoryAdmin(ResourceTagAdmin):
@@ -220,7 +233,7 @@ class PathologyAdmin(ResourceTagAdmin):
     list_display = ['show_badge', 'show_pathology_category', 'show_papers', 'show_datasets']
     list_display_links = ['show_pathology_category', 'show_badge']
     list_filter = ['category', ]
-    sortable_by = ['show_pathology_category', 'show_badge']
+    sortable_by = ['show_pathology_category', 'show_badge', 'show_papers', 'show_datasets']
     autocomplete_fields = ['category']
     fieldsets = (
         (None, {
@@ -238,7 +251,7 @@ class PathologyAdmin(ResourceTagAdmin):
     @mark_safe
     def show_papers(self, pathology):
         papers = pathology.papers.order_by('-publication_date')
-        n_papers = papers.count()
+        n_papers = pathology.paper_count
 
         tag = '''
             <b>Total: </b> {count}
@@ -256,11 +269,12 @@ class PathologyAdmin(ResourceTagAdmin):
         return tag.format(count=n_papers,
                           list_papers=list_papers)
     show_papers.short_description = "Papers"
+    show_papers.admin_order_field = 'paper_count'
 
     @mark_safe
     def show_datasets(self, pathology):
         datasets = pathology.datasets.order_by('-release_year')
-        n_datasets = datasets.count()
+        n_datasets = pathology.dataset_count
         tag = '''
                             <b>Total: </b> {count}
                             <br>
@@ -277,6 +291,7 @@ class PathologyAdmin(ResourceTagAdmin):
                           list_datasets=list_datasets)
 
     show_datasets.short_description = "Datasets"
+    show_datasets.admin_order_field = 'dataset_count'
 
 
 # ====================
@@ -289,14 +304,22 @@ class InlineAuthorPaper(admin.StackedInline):
     filter_horizontal = ['affiliations', ]
 
 
+CRAWL_STATUS_BADGES = {
+    CRAWL_PENDING: 'badge-secondary',
+    CRAWL_DONE: 'badge-success',
+    CRAWL_FAILED: 'badge-danger',
+}
+
+
 class PaperAdmin(admin.ModelAdmin):
     # ChangeList view
     # ---------------
-    change_list_template = 'ai_collection/admin/change_list.html'
+    change_list_template = 'ai_collection/admin/paper/change_list.html'
     date_hierarchy = 'publication_date'
-    list_display = ('title', 'show_pathology', 'show_pathology_category','Topic','show_paper_file')
+    list_display = ('title', 'show_pathology', 'show_pathology_category','Topic','show_paper_file',
+                    'show_crawl_status')
     list_display_links = ('title',)
-    list_filter = ('pathology__category', 'pathology', 'metadata_reference', 'terms','topic')
+    list_filter = ('pathology__category', 'pathology', 'metadata_reference', 'terms','topic', 'crawl_status')
     list_select_related = ['pathology']
     search_fields = ('title', 'authors__name','azure_keys__name','topic__name')
     sortable_by = ['title', 'show_pathology', 'show_pathology_category']
@@ -329,7 +352,13 @@ class PaperAdmin(admin.ModelAdmin):
             'classes': ('wide',),
         }),
 
+        ('Metadata Download', {
+            'fields': ('crawl_status', 'crawl_error'),
+            'classes': ('collapse',),
+        }),
+
     )
+    readonly_fields = ('crawl_status', 'crawl_error')
     add_fieldsets = (
         (None, {
             'classes': ('wide',),
@@ -340,34 +369,39 @@ class PaperAdmin(admin.ModelAdmin):
         models.TextField: {'widget': AdminMarkdownxWidget},
     }
     autocomplete_fields = ['terms', 'pathology','topic','azure_keys']
+    actions = ['recrawl_metadata', 'extract_azure_keys']
 
     @mark_safe
     def azure_keys_list(self,paper):
         return [k.name for k in paper.azure_keys.all()]
 
-    def save_related(self, request,form, formsets, change):
+    def save_related(self, request, form, formsets, change):
         super(PaperAdmin, self).save_related(request, form, formsets, change)
-        print(form.instance.azure_keys.all())
-        try:
-            if not form.instance.update_azure_keys:
-                return
-            keys = get_azurekeys(form.instance.abstract)
-            print(keys)
-            for key in keys:
-                if len(key) >= 50:
-                    continue
-                key = key.lower()
-                if len(AzureKey.objects.filter(name=key)) == 0:     #If it does not exist
-                    k = AzureKey.objects.create(name=key)
-                    k.save()
-                    form.instance.azure_keys.add(k)
-                else:                                               #If it does exist
-                    if len(form.instance.azure_keys.filter(name=key)) == 0:          #If it is not in the keys
-                        k = AzureKey.objects.get(name=key)
-                        form.instance.azure_keys.add(k)
-        except Exception as e:
-            print(e)
-
+        paper = form.instance
+        # Remote APIs are called in background (see `ai_collection.jobs`)
+        if not change and paper.metadata_reference != MANUAL_ENTRY:
+            enqueue('crawl_paper', label=paper.reference_id, paper_id=paper.pk)
+            self.message_user(request, 'Paper metadata will be downloaded in background', messages.INFO)
+        elif paper.update_azure_keys and (not change or {'abstract', 'update_azure_keys'} & set(form.changed_data)):
+            # Key phrases are extracted again only when the abstract changed
+            enqueue('extract_azure_keys', label=paper.title, paper_id=paper.pk)
+
+    def recrawl_metadata(self, request, queryset):
+        papers = queryset.exclude(metadata_reference=MANUAL_ENTRY)
+        papers.filter(crawl_status=CRAWL_FAILED).update(crawl_status=CRAWL_PENDING)
+        for paper in papers:
+            enqueue('crawl_paper', label=paper.title, paper_id=paper.pk)
+        self.message_user(request, '{} Papers queued for metadata download'.format(len(papers)), messages.INFO)
+
+    recrawl_metadata.short_description = 'Download metadata again (in background)'
+
+    def extract_azure_keys(self, request, queryset):
+        for paper in queryset:
+            enqueue('extract_azure_keys', label=paper.title, paper_id=paper.pk)
+        self.message_user(request, '{} Papers queued for keyphrases extraction'.format(len(queryset)),
+                          messages.INFO)
+
+    extract_azure_keys.short_description = 'Extract Azure keyphrases (in background)'
 
     @mark_safe
     def show_paper_file(self, obj):
@@ -380,6 +414,14 @@ class PaperAdmin(admin.ModelAdmin):
 
     show_paper_file.short_description = 'Paper File'
 
+    @mark_safe
+    def show_crawl_status(self, paper):
+        return _display_badge(color_class=CRAWL_STATUS_BADGES[paper.crawl_status],
+                              text=paper.get_crawl_status_display())
+
+    show_crawl_status.short_description = 'Metadata'
+    show_crawl_status.admin_order_field = 'crawl_status'
+
     @mark_safe
     def Topic(self,paper):
         #return paper.topic.badge #_display_badge(paper.topic.badge_class,paper.topic.name.title())
@@ -438,13 +480,52 @@ class PaperAdmin(admin.ModelAdmin):
 
     def save_form(self, request, form, change):
         if not change:
-            # this is the case of form add. So, go ahead with
-            # Metadata download from engine
-            if form.crawler is not None:
-                form.crawler.crawl_paper(paper_instance=form.instance)
-            return form.save(commit=False)
+            # this is the case of form add: metadata are downloaded
+            # from the engine in background (see `save_related`)
+            paper = form.save(commit=False)
+            if not paper.title:
+                paper.title = paper.reference_id
+            if paper.metadata_reference != MANUAL_ENTRY:
+                # not listed in the collection until its metadata are downloaded
+                paper.crawl_status = CRAWL_PENDING
+            return paper
         return super().save_form(request, form, change)
 
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        paper = self.get_object(request, unquote(object_id))
+        if request.method == 'GET' and paper is not None and paper.crawl_status == CRAWL_FAILED:
+            self.message_user(request, 'The download of the Paper metadata failed ({}): the Paper is not shown '
+                                       'in the collection'.format(paper.crawl_error), messages.ERROR)
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    # ===========
+    # Bulk Import
+    # ===========
+
+    def get_urls(self):
+        urls = [path('import/', self.admin_site.admin_view(self.import_view),
+                     name='ai_collection_paper_import')]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Import Papers from a list of (Metadata Engine, Paper ID) pairs (in background, by batches)"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST':
+            form = PaperImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                entries = form.cleaned_data['import_entries']
+                jobs = enqueue_paper_import(entries)
+                self.message_user(request, '{} Papers queued for import ({} Background Jobs)'.format(
+                    len(entries), len(jobs)), messages.SUCCESS)
+                return HttpResponseRedirect('{}?task=import_papers'.format(
+                    reverse('admin:ai_collection_job_changelist')))
+        else:
+            form = PaperImportForm()
+        context = dict(self.admin_site.each_context(request),
+                       title='Import Papers', opts=self.model._meta, form=form)
+        return TemplateResponse(request, 'ai_collection/admin/paper/import_form.html', context)
+
     def response_add(self, request, obj, post_url_continue=None):
         """
         Determine the HttpResponse for the add_view stage. It mostly defers to
@@ -523,13 +604,14 @@ class AuthorAdmin(admin.ModelAdmin):
 class DataInlineAdmin(admin.StackedInline):
     model = DataArchive
     extra = 1
+    readonly_fields = ('file_size', 'sha256', 'md5')
 
     fieldsets = (
         (None, {
             'fields': (
                 'name',
                 'archive_type', 'archive_format',
-                'archive_file'),
+                'archive_file', 'file_size', 'sha256', 'md5'),
         }),
         ('Notes', {
             'fields': ('notes',),
@@ -557,7 +639,7 @@ class TopicAdmin(ResourceTagAdmin):
     list_display = ['show_badge','show_papers']
     list_display_links = ['show_badge']
     #list_filter = ['category', ]
-    sortable_by = ['show_badge']
+    sortable_by = ['show_badge', 'show_papers']
     #autocomplete_fields = ['category']
     fieldsets = (
         (None, {
@@ -575,7 +657,7 @@ class TopicAdmin(ResourceTagAdmin):
     @mark_safe
     def show_papers(self, pathology):
         papers = pathology.papers.order_by('-publication_date')
-        n_papers = papers.count()
+        n_papers = pathology.paper_count
 
         tag = '''
             <b>Total: </b> {count}
@@ -593,6 +675,7 @@ class TopicAdmin(ResourceTagAdmin):
         return tag.format(count=n_papers,
                           list_papers=list_papers)
     show_papers.short_description = "Papers"
+    show_papers.admin_order_field = 'paper_count'
 
     @mark_safe
     def show_datasets(self, pathology):
@@ -671,31 +754,20 @@ class DatasetAdmin(admin.ModelAdmin):
 
     def save_related(self, request, form, formsets, change):
         super(DatasetAdmin, self).save_related(request, form, formsets, change)
-        if not form.instance.update_azure_keys:
-            return
-        try:
-            form.instance.azure_keys.set(form.instance.reference_paper.azure_keys.all())
-        except Exception as e:
-            print(e)
-
-        #print(form.instance.azure_keys.all())
-        #try:
-        #    if not form.instance.update_azure_keys:
-        #        return
-        #    keys = get_azurekeys(form.instance.reference_paper.abstract)
-        #    print(keys)
-        #    for key in keys:
-        #        key = key.lower()
-        #        if len(AzureKey.objects.filter(name=key)) == 0:     #If it does not exist
-        #            k = AzureKey.objects.create(name=key)
-        #            k.save()
-        #            form.instance.azure_keys.add(k)
-        #        else:                                               #If it does exist
-        #            if len(form.instance.azure_keys.filter(name=key)) == 0:          #If it is not in the keys
-        #                k = AzureKey.objects.get(name=key)
-        #                form.instance.azure_keys.add(k)
-        #except Exception as e:
-        #    print(e)
+        dataset = form.instance
+        # Key phrases are extracted in background, and again only when the text changed
+        changed = {'description', 'reference_paper', 'update_azure_keys'} & set(form.changed_data)
+        if dataset.update_azure_keys and (not change or changed):
+            enqueue('extract_azure_keys', label=dataset.short_name, dataset_id=dataset.pk)
+        # Contents of the new (or replaced) archive files are listed in background
+        for formset in formsets:
+            if formset.model is not DataArchive:
+                continue
+            for archive_form in formset.forms:
+                archive = archive_form.instance
+                if archive.pk and archive.archive_file and 'archive_file' in archive_form.changed_data \
+                        and archive_form not in formset.deleted_forms:
+                    enqueue('index_archive', label=str(archive), archive_id=archive.pk)
 
     @mark_safe
     def show_attachments(self, obj):
@@ -706,11 +778,15 @@ class DatasetAdmin(admin.ModelAdmin):
                 {list_tag}
             </ul>
         '''
-        list_item_tag = '<li><span>{name}:</span> <a href="{url}" title="{name}" target="_blank">{label}</a></li>'
+        list_item_tag = '<li><span>{name}:</span> <a href="{url}" title="{name}" target="_blank">{label}</a>' \
+                        '{size}</li>'
+        # sizes are the ones recorded on upload: the storage is never accessed
         archives = obj.data_archives.all()
-        attachments = ' '.join([list_item_tag.format(name=a.label, url=a.archive_file.url,
-                                                     label='Download') for a in archives])
-        return tag.format(list_tag=attachments, count=archives.count())
+        attachments = ' '.join([list_item_tag.format(name=a.label, url=a.get_download_url(), label='Download',
+                                                     size=' ({})'.format(sizify(a.file_size))
+                                                     if a.file_size is not None else '')
+                                for a in archives])
+        return tag.format(list_tag=attachments, count=len(archives))
 
     show_attachments.short_description = 'Attachments'
 
@@ -805,6 +881,51 @@ class DatasetAdmin(admin.ModelAdmin):
         }
 
 
+# =============================
+# Background Jobs Admin Section
+# =============================
+
+JOB_STATUS_BADGES = {
+    JOB_PENDING: 'badge-secondary',
+    JOB_RUNNING: 'badge-primary',
+    JOB_DONE: 'badge-success',
+    JOB_FAILED: 'badge-danger',
+}
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Admin Manager of the background jobs (read only)"""
+    list_display = ('task', 'label', 'show_status', 'attempts', 'created_at',
+                    'started_at', 'finished_at', 'worker')
+    list_filter = ('status', 'task')
+    search_fields = ('label', 'task')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('task', 'payload', 'label', 'status', 'attempts', 'max_attempts', 'error',
+                       'worker', 'created_at', 'run_after', 'started_at', 'finished_at')
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry(self, request, queryset):
+        count = retry_jobs(queryset)
+        self.message_user(request, '{} Jobs queued again'.format(count), messages.INFO)
+
+    retry.short_description = 'Retry selected Jobs'
+
+    @mark_safe
+    def show_status(self, job):
+        return _display_badge(color_class=JOB_STATUS_BADGES[job.status], text=job.get_status_display())
+
+    show_status.short_description = 'Status'
+    show_status.admin_order_field = 'status'
+
+    class Media:
+        css = {
+            'all': ('css/badges.css',)
+        }
+
+
 admin.site.site_title = settings.ADMIN_SITE_TITLE
 admin.site.index_title = settings.ADMIN_INDEX_TITLE
 admin.site.site_header = settings.ADMIN_SITE_HEADER
@@ -826,3 +947,6 @@ admin.site.register(Dataset, DatasetAdmin)
 admin.site.register(Topic, TopicAdmin)
 
 admin.site.register(AzureKey, AzureKeyAdmin)
+
+# Background Jobs
+admin.site.register(Job, JobAdmin)
@@ -5,3 +5,5 @@ class AeyeCollectionConfig(AppConfig):
     name = 'ai_collection'
     verbose_name = 'SurvAI'
 
+    def ready(self):
+        from . import signals  # noqa: F401 (connect signal handlers)
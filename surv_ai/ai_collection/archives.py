@@ -0,0 +1,249 @@
+"""
+Indexer of the contents of Data Archives (zip, and tar, possibly compressed).
+
+Archives are never extracted: the members of zip archives are read from the
+central directory (seeking to it, with no need of the whole archive), and
+the members of tar archives from their headers (compressed tars are
+decompressed as a stream). Members are processed one at a time, so memory
+is bounded regardless of the size (or number of members) of the archive:
+the manifest keeps the first ARCHIVE_MANIFEST_MAX_MEMBERS members only,
+along with the number of files, their total (uncompressed) size, and the
+number of files per extension.
+
+Checksums of the archives are computed while they are uploaded (see
+`django_resumable.files`): the archives are read back (at a bounded rate)
+only to fill in the checksums of the archives uploaded before, by the
+`backfill_checksums` command.
+"""
+import json
+import os
+import struct
+import tarfile
+from collections import Counter
+
+from django.conf import settings
+
+from django_resumable.files import file_checksums, get_checksum_algorithms
+from .models import ArchiveManifest, DataArchive
+
+# Max number of members listed in the manifest (all members are counted)
+ARCHIVE_MANIFEST_MAX_MEMBERS = getattr(settings, 'ARCHIVE_MANIFEST_MAX_MEMBERS', 1000)
+# Max number of distinct extensions (others are counted as `OTHER_EXTENSION`)
+MAX_EXTENSIONS = 100
+OTHER_EXTENSION = 'other'
+# Suffixes of compressed files (e.g. .nii.gz is an extension of its own)
+COMPRESSION_SUFFIXES = {'gz', 'bz2', 'xz', 'zst', 'z'}
+
+FORMAT_ZIP = 'zip'
+FORMAT_TAR = 'tar'
+
+
+class UnsupportedArchive(ValueError):
+    pass
+
+
+# ===========
+# Zip Members
+# ===========
+
+# Records of the zip format (see APPNOTE.TXT, and the `zipfile` module)
+ZIP_END_RECORD = struct.Struct('<4s4H2LH')
+ZIP_END_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR = struct.Struct('<4sLQL')
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+ZIP64_END_SIGNATURE = b'PK\x06\x06'
+ZIP_CENTRAL_DIR = struct.Struct('<4s4B4HL2L5H2L')
+ZIP_CENTRAL_DIR_SIGNATURE = b'PK\x01\x02'
+ZIP_MAX_COMMENT = 65535
+ZIP64_EXTRA = 0x0001
+ZIP_UTF8_FLAG = 0x800
+
+
+def _zip_central_directory(f):
+    """Offset, and size of the central directory of the zip archive"""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    tail_size = min(file_size, ZIP_END_RECORD.size + ZIP_MAX_COMMENT)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(ZIP_END_SIGNATURE)
+    if position < 0 or position + ZIP_END_RECORD.size > len(tail):
+        raise UnsupportedArchive('Not a zip archive')
+    end_record = ZIP_END_RECORD.unpack_from(tail, position)
+    size, offset = end_record[5], end_record[6]
+    if 0xFFFFFFFF not in (size, offset) and 0xFFFF not in end_record[3:5]:
+        return offset, size
+
+    # Zip64: the locator precedes the end record
+    locator_position = file_size - tail_size + position - ZIP64_LOCATOR.size
+    f.seek(locator_position)
+    locator = ZIP64_LOCATOR.unpack(f.read(ZIP64_LOCATOR.size))
+    if locator[0] != ZIP64_LOCATOR_SIGNATURE:
+        return offset, size
+    f.seek(locator[2])
+    end_record = ZIP64_END_RECORD.unpack(f.read(ZIP64_END_RECORD.size))
+    if end_record[0] != ZIP64_END_SIGNATURE:
+        raise UnsupportedArchive('Corrupted zip64 archive')
+    return end_record[9], end_record[8]
+
+
+def _zip64_size(extra, size):
+    """Uncompressed size of the member, from its zip64 extra field"""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, data_size = struct.unpack_from('<2H', extra, position)
+        if header_id == ZIP64_EXTRA and data_size >= 8:
+            return struct.unpack_from('<Q', extra, position + 4)[0]
+        position += 4 + data_size
+    return size
+
+
+def iter_zip_members(path):
+    """Iterates over the (name, size, is_dir) of the members of the zip archive"""
+    with open(path, 'rb') as f:
+        offset, size = _zip_central_directory(f)
+        f.seek(offset)
+        read = 0
+        while read < size:
+            header = f.read(ZIP_CENTRAL_DIR.size)
+            if len(header) < ZIP_CENTRAL_DIR.size or header[:4] != ZIP_CENTRAL_DIR_SIGNATURE:
+                raise UnsupportedArchive('Corrupted zip central directory')
+            fields = ZIP_CENTRAL_DIR.unpack(header)
+            flags, file_size = fields[5], fields[11]
+            name_length, extra_length, comment_length = fields[12:15]
+            name = f.read(name_length).decode('utf-8' if flags & ZIP_UTF8_FLAG else 'cp437', errors='replace')
+            extra = f.read(extra_length)
+            f.seek(comment_length, os.SEEK_CUR)
+            if file_size == 0xFFFFFFFF:
+                file_size = _zip64_size(extra, file_size)
+            read += ZIP_CENTRAL_DIR.size + name_length + extra_length + comment_length
+            yield name, file_size, name.endswith('/')
+
+
+# ===========
+# Tar Members
+# ===========
+
+def iter_tar_members(path):
+    """Iterates over the (name, size, is_dir) of the members of the tar archive"""
+    try:
+        tar = tarfile.open(path, 'r:*')
+    except tarfile.ReadError as e:
+        raise UnsupportedArchive(str(e))
+    with tar:
+        while True:
+            member = tar.next()
+            if member is None:
+                break
+            # members are not kept (i.e. memory is bounded)
+            tar.members = []
+            yield member.name, member.size if member.isfile() else 0, member.isdir()
+
+
+# ========
+# Manifest
+# ========
+
+def archive_format(path):
+    if _is_zip(path):
+        return FORMAT_ZIP
+    if tarfile.is_tarfile(path):
+        return FORMAT_TAR
+    raise UnsupportedArchive('Not a zip, nor a tar archive')
+
+
+def _is_zip(path):
+    with open(path, 'rb') as f:
+        try:
+            offset, size = _zip_central_directory(f)
+        except (UnsupportedArchive, struct.error):
+            return False
+        f.seek(offset)
+        return size == 0 or f.read(4) == ZIP_CENTRAL_DIR_SIGNATURE
+
+
+def file_extension(name):
+    """Lowercase extension of the file name (including the compression suffix, if any)"""
+    parts = os.path.basename(name).lower().split('.')[1:]
+    if not parts:
+        return ''
+    if len(parts) > 1 and parts[-1] in COMPRESSION_SUFFIXES:
+        return '.'.join(parts[-2:])
+    return parts[-1]
+
+
+def build_manifest(path, max_members=ARCHIVE_MANIFEST_MAX_MEMBERS):
+    """Manifest of the archive: format, number of files, total (uncompressed) size,
+    number of files per extension, and (name, size) of the first max_members members"""
+    fmt = archive_format(path)
+    members = iter_zip_members(path) if fmt == FORMAT_ZIP else iter_tar_members(path)
+    n_files, total_size, extensions, listed, truncated = 0, 0, Counter(), list(), False
+    for name, size, is_dir in members:
+        if len(listed) < max_members:
+            listed.append((name, size))
+        else:
+            truncated = True
+        if is_dir:
+            continue
+        n_files += 1
+        total_size += size
+        extension = file_extension(name)
+        if extension not in extensions and len(extensions) >= MAX_EXTENSIONS:
+            extension = OTHER_EXTENSION
+        extensions[extension] += 1
+    return {'archive_format': fmt, 'n_files': n_files, 'total_size': total_size,
+            'extensions': dict(extensions), 'members': listed, 'truncated': truncated}
+
+
+def _search_text(manifest):
+    """Text of the manifest matched by the search: extensions, and names of the listed members"""
+    texts = [e for e in manifest['extensions'] if e and e != OTHER_EXTENSION]
+    texts.extend(name for name, _ in manifest['members'])
+    return '\n'.join(texts)
+
+
+def index_archive(archive):
+    """Build (and save) the manifest of the Data Archive.
+    Archives in formats other than zip and tar get an empty manifest, with the error."""
+    try:
+        manifest = build_manifest(archive.archive_file.path)
+    except UnsupportedArchive as e:
+        manifest = {'archive_format': '', 'n_files': 0, 'total_size': 0, 'extensions': dict(),
+                    'members': list(), 'truncated': False, 'error': str(e)}
+    defaults = {'archive_format': manifest['archive_format'],
+                'n_files': manifest['n_files'],
+                'total_size': manifest['total_size'],
+                'extensions': json.dumps(manifest['extensions']),
+                'members': json.dumps(manifest['members']),
+                'truncated': manifest['truncated'],
+                'search_text': _search_text(manifest),
+                'error': manifest.get('error', '')}
+    archive_manifest, _ = ArchiveManifest.objects.update_or_create(archive=archive, defaults=defaults)
+    return archive_manifest
+
+
+# =========
+# Checksums
+# =========
+
+# Checksums stored in the fields of the Data Archives
+CHECKSUM_ALGORITHMS = ('sha256', 'md5')
+# Max read bandwidth (in MB/s), not to starve the uploads and downloads of the archives
+CHECKSUM_MAX_RATE = getattr(settings, 'CHECKSUM_MAX_RATE', 50)
+
+
+def checksum_algorithms():
+    """Checksums of the Data Archives (RESUMABLE_CHECKSUMS, among CHECKSUM_ALGORITHMS)"""
+    return [algorithm for algorithm in get_checksum_algorithms() if algorithm in CHECKSUM_ALGORITHMS]
+
+
+def update_checksums(archive, algorithms=None, max_rate=CHECKSUM_MAX_RATE):
+    """Compute (and save) the checksums of the Data Archive, reading the file at most at max_rate MB/s.
+    Returns whether they have been saved (i.e. the file has not been replaced meanwhile)."""
+    algorithms = checksum_algorithms() if algorithms is None else algorithms
+    hashers = file_checksums(archive.archive_file.path, algorithms,
+                             max_rate=max_rate * 1024 * 1024 if max_rate else None)
+    # update(): the last change of the archive is left untouched
+    updated = DataArchive.objects.filter(pk=archive.pk, archive_file=archive.archive_file.name)
+    return updated.update(**{hasher.name: hasher.hexdigest() for hasher in hashers}) > 0
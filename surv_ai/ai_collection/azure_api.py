@@ -1,16 +1,123 @@
-import requests
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.utils import timezone
+
+from .crawlers import transport
+from .models import CachedKeyphrases
+
+logger = logging.getLogger(__name__)
 
 subscription_key = "39e34da1cca34fa1a7b123c127993502"
 text_analytics_base_url = "https://westcentralus.api.cognitive.microsoft.com/text/analytics/v2.1/"
 keyphrase_url = text_analytics_base_url + "keyPhrases"
 
-def get_azurekeys(doc):
-    documents = {"documents": [
-        {"id": "1", "language": "en", "text": doc},
-    ]}
+# Text Analytics limits: documents per request, characters per document, and bytes per request
+AZURE_MAX_DOCUMENTS = getattr(settings, 'AZURE_MAX_DOCUMENTS', 1000)
+AZURE_MAX_DOCUMENT_SIZE = 5120
+AZURE_MAX_REQUEST_SIZE = 1024 * 1024
+# Max number of concurrent requests
+AZURE_WORKERS = getattr(settings, 'AZURE_WORKERS', 4)
+
+# Key phrases are stored in the database by hash of the (normalised) text, shared by the web and
+# job workers: unchanged texts are never sent again. Seconds after which they are requested again (None: never)
+KEYPHRASE_CACHE_TIMEOUT = getattr(settings, 'KEYPHRASE_CACHE_TIMEOUT', None)
+# Max number of hashes per lookup query
+KEYPHRASE_CACHE_QUERY_SIZE = 500
+
+
+def normalise_text(text):
+    """Text as sent to the API (whitespace collapsed, and truncated to the max document size)"""
+    return ' '.join(text.split())[:AZURE_MAX_DOCUMENT_SIZE]
+
+
+def _cache_key(text):
+    return sha256(text.encode('utf-8')).hexdigest()
+
+
+def _cached_phrases(keys):
+    """Map of text hash -> key phrases stored for the (unexpired) hashes"""
+    keys, cached = list(keys), dict()
+    entries = CachedKeyphrases.objects.all()
+    if KEYPHRASE_CACHE_TIMEOUT is not None:
+        entries = entries.filter(created_at__gte=timezone.now() - timedelta(seconds=KEYPHRASE_CACHE_TIMEOUT))
+    for start in range(0, len(keys), KEYPHRASE_CACHE_QUERY_SIZE):
+        batch = entries.filter(text_hash__in=keys[start:start + KEYPHRASE_CACHE_QUERY_SIZE])
+        cached.update((key, json.loads(phrases)) for key, phrases in batch.values_list('text_hash', 'key_phrases'))
+    return cached
+
+
+def _store_phrases(key_phrases):
+    """Store the map of text hash -> key phrases (replacing expired entries)"""
+    keys = list(key_phrases)
+    for start in range(0, len(keys), KEYPHRASE_CACHE_QUERY_SIZE):
+        CachedKeyphrases.objects.filter(text_hash__in=keys[start:start + KEYPHRASE_CACHE_QUERY_SIZE]).delete()
+    # entries stored concurrently (e.g. by other workers) are skipped by the unique hash
+    CachedKeyphrases.objects.bulk_create([CachedKeyphrases(text_hash=key, key_phrases=json.dumps(phrases))
+                                          for key, phrases in key_phrases.items()], ignore_conflicts=True)
+
+
+def _post_documents(documents, url=None):
+    """Send a single keyPhrases request. Returns the map of document id -> key phrases"""
     headers = {"Ocp-Apim-Subscription-Key": '39e34da1cca34fa1a7b123c127993502'}  # subscription_key
-    response = requests.post(keyphrase_url, headers=headers, json=documents)
+    response = transport.post(url or keyphrase_url, headers=headers, json={"documents": documents})
     key_phrases = response.json()
-    api_phrases = key_phrases['documents'][0]['keyPhrases']
-    print(api_phrases)
-    return api_phrases
\ No newline at end of file
+    for error in key_phrases.get('errors', []):
+        logger.warning('Azure keyphrases of document %s failed: %s', error.get('id'), error.get('message'))
+    return {d['id']: d['keyPhrases'] for d in key_phrases['documents']}
+
+
+def get_azurekeys(doc):
+    doc = normalise_text(doc)
+    key = _cache_key(doc)
+    api_phrases = _cached_phrases([key]).get(key)
+    if api_phrases is None:
+        api_phrases = _post_documents([{"id": "1", "language": "en", "text": doc}])['1']
+        _store_phrases({key: api_phrases})
+    return api_phrases
+
+
+def _batches(documents, max_documents=AZURE_MAX_DOCUMENTS):
+    """Pack the documents into requests within the API limits"""
+    batch, batch_size = list(), 0
+    for doc_id, text in documents.items():
+        document = {"id": str(doc_id), "language": "en", "text": text}
+        # JSON size upper bound: text may double in size when escaped
+        size = 2 * len(document['text'].encode('utf-8')) + len(document['id']) + 50
+        if batch and (len(batch) >= max_documents or batch_size + size > AZURE_MAX_REQUEST_SIZE):
+            yield batch
+            batch, batch_size = list(), 0
+        batch.append(document)
+        batch_size += size
+    if batch:
+        yield batch
+
+
+def get_azurekeys_batch(documents, max_documents=AZURE_MAX_DOCUMENTS, workers=AZURE_WORKERS,
+                        url=None, use_cache=True):
+    """Key phrases of many documents (map of id -> text), packed in as few requests as possible,
+    sent concurrently. Texts already stored (or repeated) are not sent.
+    Returns the map of id -> key phrases (documents in error are missing)."""
+    texts = {str(doc_id): normalise_text(text) for doc_id, text in documents.items() if text and text.strip()}
+    cached = _cached_phrases({_cache_key(t) for t in texts.values()}) if use_cache else dict()
+    # Each text not in cache is sent once (identified by its position)
+    missing = sorted({t for t in texts.values() if _cache_key(t) not in cached})
+    batches = list(_batches(dict(enumerate(missing)), max_documents=max_documents))
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as executor:
+            futures = [executor.submit(_post_documents, batch, url) for batch in batches]
+            for future in futures:
+                try:
+                    key_phrases = future.result()
+                except Exception as e:
+                    logger.error('Azure keyphrases request failed: %s', e)
+                else:
+                    key_phrases = {_cache_key(missing[int(i)]): phrases for i, phrases in key_phrases.items()}
+                    if use_cache:
+                        _store_phrases(key_phrases)
+                    cached.update(key_phrases)
+    return {doc_id: cached[_cache_key(text)] for doc_id, text in texts.items() if _cache_key(text) in cached}
@@ -0,0 +1,83 @@
+"""
+Denormalised usage counters (e.g. `paper_count`, `dataset_count`, `study_count`)
+of the tags in the collection (Keywords, Azure Keyphrases, Pathologies, Topics,
+and Methods).
+
+Counters are kept up to date by model signals (see `signals.py`) whenever
+the counted relations change. Each refresh re-computes the counters of the
+affected tags in a single `UPDATE` (with one correlated sub-query per counter),
+so that updates are atomic and idempotent, and never drift with concurrent
+changes. The `reconcile_usage_counters` management command re-computes all
+the counters, e.g. after bulk updates by-passing model signals.
+"""
+from django.apps import apps as global_apps
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+APP_LABEL = 'ai_collection'
+
+# Tag Model -> counter field -> (counted Model, lookup to the tag [, counted field])
+COUNTERS = {
+    'Keyword': {'paper_count': ('Paper', 'terms'),
+                'dataset_count': ('Dataset', 'tags')},
+    'AzureKey': {'paper_count': ('Paper', 'azure_keys'),
+                 'dataset_count': ('Dataset', 'azure_keys')},
+    'Pathology': {'paper_count': ('Paper', 'pathology'),
+                  'dataset_count': ('Dataset', 'pathology')},
+    'Topic': {'paper_count': ('Paper', 'topic')},
+    'Method': {'paper_count': ('ExperimentalStudy', 'method', 'paper'),
+               'dataset_count': ('ExperimentalStudy', 'method', 'dataset'),
+               'study_count': ('ExperimentalStudy', 'method')},
+}
+
+
+def counted_relations(related_model):
+    """Return the set of (tag model, lookup) of the relations of the input
+    (counted) model, which are tracked by usage counters."""
+    relations = set()
+    for model_name, counters in COUNTERS.items():
+        for spec in counters.values():
+            if spec[0] == related_model.__name__:
+                relations.add((global_apps.get_model(APP_LABEL, model_name), spec[1]))
+    return relations
+
+
+def counted_fields(related_model):
+    """Return the mapping (tag model, lookup) -> set of the counted fields (other than
+    the pk) of the input (counted) model: counters depend on their values as well."""
+    fields = dict()
+    for model_name, counters in COUNTERS.items():
+        for spec in counters.values():
+            if spec[0] == related_model.__name__:
+                relation = (global_apps.get_model(APP_LABEL, model_name), spec[1])
+                fields.setdefault(relation, set()).update(spec[2:])
+    return fields
+
+
+def _counter_expression(related_model, lookup, counted='pk'):
+    counts = related_model.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+    counts = counts.annotate(n=Count(counted, distinct=True)).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def refresh_counters(model, pks=None, apps=global_apps):
+    """Re-compute the usage counters of the selected tags (all, by default).
+    Returns the number of updated tags."""
+    model_name = model if isinstance(model, str) else model.__name__
+    model = apps.get_model(APP_LABEL, model_name)
+    tags = model.objects.all()
+    if pks is not None:
+        pks = set(pks)
+        if not pks:
+            return 0
+        tags = tags.filter(pk__in=pks)
+    counters = dict()
+    for counter, spec in COUNTERS[model_name].items():
+        related_model = apps.get_model(APP_LABEL, spec[0])
+        counters[counter] = _counter_expression(related_model, *spec[1:])
+    return tags.update(**counters)
+
+
+def refresh_all_counters(apps=global_apps):
+    """Re-compute the usage counters of all the tags (of all types)"""
+    return {model_name: refresh_counters(model_name, apps=apps) for model_name in COUNTERS}
@@ -2,6 +2,11 @@
 """
 from abc import ABC, abstractmethod
 
+from django.db import transaction
+
+from . import transport
+from .response_cache import RESPONSE_CACHE
+
 # ==================
 # Crawler Exceptions
 # ==================
@@ -56,7 +61,9 @@ class MetadataCrawler(ABC):
         if not self._paper_metadata:
             self.retrieve_paper_metadata()
 
-        paper = self._collect_paper_data(paper_instance)
+        # Paper, authors and terms are saved altogether (or not at all)
+        with transaction.atomic():
+            paper = self._collect_paper_data(paper_instance)
         return paper
 
     @abstractmethod
@@ -67,6 +74,17 @@ class MetadataCrawler(ABC):
     # Private API
     # -----------
 
+    def _cached_get(self, resource, url, paper_id=None):
+        """GET the url, unless the response of the lookup of the paper
+        (by default, the one of the crawler) is in the response cache"""
+        paper_id = self._id if paper_id is None else paper_id
+        return RESPONSE_CACHE.get_response(self._engine, paper_id, resource,
+                                           lambda: transport.get(url))
+
+    def _cached_data(self, resource, compute):
+        """Return the (JSON) data of the lookup of the paper, from the response cache if available"""
+        return RESPONSE_CACHE.get_data(self._engine, self._id, resource, compute)
+
     @staticmethod
     def _to_list(x):
         if x is None or isinstance(x, list):
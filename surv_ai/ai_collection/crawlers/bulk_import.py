@@ -0,0 +1,195 @@
+"""
+Bulk import of Papers from a list of (Metadata Engine, Paper ID) pairs,
+e.g. the bibliography of a survey.
+
+Paper metadata are fetched concurrently (i.e. network bound), with a bounded
+number of parallel requests per Metadata Engine, whereas Papers are persisted
+in the calling thread, in batches (i.e. one transaction per batch).
+"""
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import Paper, ARXIV_ENGINE, SCOPUS_ENGINE, SEMANTIC_SCHOLAR_ENGINE
+from .base import PaperIDNotFoundError, ArticleMetadataError
+from . import instantiate_crawler
+
+# Max number of concurrent metadata requests, per Metadata Engine
+IMPORT_WORKERS = getattr(settings, 'PAPER_IMPORT_WORKERS', 4)
+# Number of Papers persisted per transaction
+IMPORT_BATCH_SIZE = getattr(settings, 'PAPER_IMPORT_BATCH_SIZE', 50)
+
+# Names of Metadata Engines accepted in import files (case insensitive)
+ENGINE_ALIASES = {
+    'scopus': SCOPUS_ENGINE,
+    'pubmed': SCOPUS_ENGINE,
+    'crossref': SCOPUS_ENGINE,
+    'doi': SCOPUS_ENGINE,
+    'arxiv': ARXIV_ENGINE,
+    'semscl': SEMANTIC_SCHOLAR_ENGINE,
+    'semanticscholar': SEMANTIC_SCHOLAR_ENGINE,
+    'semantic_scholar': SEMANTIC_SCHOLAR_ENGINE,
+}
+
+STATUS_CREATED = 'created'
+STATUS_EXISTING = 'existing'
+STATUS_FAILED = 'failed'
+
+
+# ==============
+# Import Entries
+# ==============
+
+ImportEntry = namedtuple('ImportEntry', ['engine', 'reference_id'])
+
+
+class InvalidImportEntry(ValueError):
+    pass
+
+
+def normalise_engine(name):
+    """Return the Metadata Engine corresponding to the input name (or alias)"""
+    engine = ENGINE_ALIASES.get(name.strip().lower())
+    if engine is None:
+        raise InvalidImportEntry('Metadata Engine "{}" is not supported'.format(name))
+    return engine
+
+
+def parse_import_entries(lines, default_engine=None):
+    """Parse (Metadata Engine, Paper ID) pairs, one per line.
+
+    Engine and ID are separated by a comma, a tab, or spaces; lines with
+    the ID only use the `default_engine`. Blank lines and comments (`#`)
+    are skipped. Returns the list of (unique) entries, in order,
+    and the list of (line number, error message) of invalid lines.
+    """
+    entries, errors, seen = list(), list(), set()
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [p.strip() for p in line.replace(',', ' ').split(None, 1)]
+        try:
+            if len(parts) == 1:
+                if default_engine is None:
+                    raise InvalidImportEntry('Metadata Engine is missing')
+                engine, reference_id = default_engine, parts[0]
+            else:
+                engine, reference_id = normalise_engine(parts[0]), parts[1]
+        except InvalidImportEntry as e:
+            errors.append((line_no, str(e)))
+            continue
+        entry = ImportEntry(engine, reference_id)
+        if entry not in seen:
+            seen.add(entry)
+            entries.append(entry)
+    return entries, errors
+
+
+class ImportResult:
+    """Outcome of the import of a single entry"""
+
+    def __init__(self, entry, status, paper=None, error=''):
+        self.entry = entry
+        self.status = status
+        self.paper = paper
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.status != STATUS_FAILED
+
+    def __str__(self):
+        outcome = self.error if self.status == STATUS_FAILED else getattr(self.paper, 'title', '')
+        return '[{}] {} {}: {}'.format(self.status, self.entry.engine,
+                                       self.entry.reference_id, outcome)
+
+
+def _error_message(error):
+    if isinstance(error, (PaperIDNotFoundError, ArticleMetadataError)):
+        return error.args[0]
+    return '{}: {}'.format(error.__class__.__name__, error)
+
+
+# =============
+# Bulk Importer
+# =============
+
+class BulkPaperImporter:
+    """Import Papers, fetching their metadata concurrently.
+
+    `progress` (optional) is called with the ImportResult of each
+    entry, as soon as it is available.
+    """
+
+    def __init__(self, workers=IMPORT_WORKERS, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.progress = progress
+        self.elapsed = 0.0
+
+    def run(self, entries):
+        """Import the input entries, returning their results (in input order)"""
+        start = time.time()
+        results = dict()
+        existing = set(Paper.objects.filter(reference_id__in=[e.reference_id for e in entries])
+                       .values_list('reference_id', flat=True))
+        to_fetch = list()
+        for entry in entries:
+            if entry.reference_id in existing:
+                self._report(results, ImportResult(entry, STATUS_EXISTING))
+            else:
+                to_fetch.append(entry)
+
+        engines = sorted({e.engine for e in to_fetch})
+        executors = {engine: ThreadPoolExecutor(max_workers=self.workers) for engine in engines}
+        try:
+            futures = dict()
+            for entry in to_fetch:
+                futures[executors[entry.engine].submit(self._fetch, entry)] = entry
+            batch = list()
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    batch.append((entry, future.result()))
+                except Exception as e:
+                    self._report(results, ImportResult(entry, STATUS_FAILED, error=_error_message(e)))
+                if len(batch) >= self.batch_size:
+                    self._persist(batch, results)
+                    batch = list()
+            if batch:
+                self._persist(batch, results)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        self.elapsed = time.time() - start
+        return [results[entry] for entry in entries]
+
+    def _report(self, results, result):
+        results[result.entry] = result
+        if self.progress is not None:
+            self.progress(result)
+
+    @staticmethod
+    def _fetch(entry):
+        """Download paper metadata (worker threads: no database access)"""
+        crawler = instantiate_crawler(entry.reference_id, entry.engine)
+        crawler.retrieve_paper_metadata()
+        return crawler
+
+    def _persist(self, batch, results):
+        """Create the Papers of a batch of crawlers in a single transaction"""
+        with transaction.atomic():
+            for entry, crawler in batch:
+                try:
+                    with transaction.atomic():  # failures only roll back the single paper
+                        paper = crawler.crawl_paper()
+                except Exception as e:
+                    result = ImportResult(entry, STATUS_FAILED, error=_error_message(e))
+                else:
+                    result = ImportResult(entry, STATUS_CREATED, paper=paper)
+                self._report(results, result)
@@ -0,0 +1,85 @@
+"""
+Set-based persistence of the data collected by the crawlers.
+
+Related objects (Keywords, Authors, Affiliations) are looked up with a single
+query per model, and the missing ones are created with `bulk_create`, so that
+saving a paper costs a constant number of queries, regardless of the number
+of its authors and terms.
+Note: bulk operations do not send model signals.
+"""
+from django.db.models.functions import Lower
+
+from ..models import Keyword, Author, AuthorPaper, Affiliation
+
+
+def _unique(values):
+    seen = set()
+    return [v for v in values if v and not (v in seen or seen.add(v))]
+
+
+def get_or_create_keywords(names):
+    """Return the Keywords of the input names (in order, without duplicates)"""
+    names = _unique(Keyword.normalise_name(n.strip()) for n in names)
+    if not names:
+        return list()
+    keywords = {k.name: k for k in Keyword.objects.filter(name__in=names)}
+    missing = [n for n in names if n not in keywords]
+    if missing:
+        Keyword.objects.bulk_create([Keyword(name=n) for n in missing], ignore_conflicts=True)
+        keywords.update({k.name: k for k in Keyword.objects.filter(name__in=missing)})
+    return [keywords[n] for n in names]
+
+
+def get_or_create_authors(names):
+    """Return the map of (lower case) name -> Author of the input names.
+    Names are matched case insensitive."""
+    spellings = dict()
+    for name in names:
+        spellings.setdefault(name.lower(), name)
+    if not spellings:
+        return dict()
+
+    def lookup(lower_names):
+        authors = Author.objects.annotate(lower_name=Lower('name'))
+        return authors.filter(lower_name__in=lower_names).order_by('pk')
+
+    authors = dict()
+    for author in lookup(list(spellings)):
+        authors.setdefault(author.lower_name, author)
+    missing = [n for n in spellings if n not in authors]
+    if missing:
+        Author.objects.bulk_create([Author(name=spellings[n]) for n in missing])
+        for author in lookup(missing):
+            authors.setdefault(author.lower_name, author)
+    return authors
+
+
+def add_paper_authors(paper, authors):
+    """Add the (ordered) list of Authors to the paper.
+    Returns all the AuthorPaper of the paper (sorted by author order)."""
+    AuthorPaper.objects.bulk_create([AuthorPaper(paper=paper, author=author, author_order=order)
+                                     for order, author in enumerate(authors, start=1)])
+    return list(AuthorPaper.objects.filter(paper=paper).select_related('author').order_by('author_order'))
+
+
+def get_or_create_affiliations(affiliations):
+    """Return the map of name -> Affiliation of the input map of name -> (city, country).
+    City and Country are set on newly created Affiliations only."""
+    affiliations = {name: info for name, info in affiliations.items() if name}
+    if not affiliations:
+        return dict()
+    instances = {a.name: a for a in Affiliation.objects.filter(name__in=list(affiliations))}
+    missing = [n for n in affiliations if n not in instances]
+    if missing:
+        Affiliation.objects.bulk_create([Affiliation(name=n, city=affiliations[n][0],
+                                                     country=affiliations[n][1])
+                                         for n in missing], ignore_conflicts=True)
+        instances.update({a.name: a for a in Affiliation.objects.filter(name__in=missing)})
+    return instances
+
+
+def add_authors_affiliations(links):
+    """Bulk insert the input (AuthorPaper, Affiliation) pairs"""
+    through = AuthorPaper.affiliations.through
+    through.objects.bulk_create([through(authorpaper=author_paper, affiliation=affiliation)
+                                 for author_paper, affiliation in links], ignore_conflicts=True)
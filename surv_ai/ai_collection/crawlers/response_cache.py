@@ -0,0 +1,245 @@
+"""
+Persistent (on-disk) cache of the raw responses of the metadata engines.
+
+Entries are keyed by (Metadata Engine, normalised Paper ID, resource), where
+the resource identifies the lookup (e.g. `validate`, or `semanticscholar`
+metadata), and stored as JSON files named after the hash of the key.
+Entries expire after `CRAWLER_CACHE_TTL` seconds (`CRAWLER_CACHE_NEGATIVE_TTL`
+for "not found" responses, as papers may become available later), and the
+least recently used ones are evicted whenever the cache exceeds
+`CRAWLER_CACHE_MAX_SIZE` bytes.
+
+With `CRAWLER_CACHE_OFFLINE = True`, recorded responses are replayed
+regardless of their age, and cache misses raise `ResponseCacheMiss`
+instead of accessing the network (e.g. in tests).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from ..models import ARXIV_ENGINE, SCOPUS_ENGINE
+
+CRAWLER_CACHE_DIR = getattr(settings, 'CRAWLER_CACHE_DIR',
+                            os.path.join(settings.BASE_DIR, 'crawler_cache'))
+CRAWLER_CACHE_TTL = getattr(settings, 'CRAWLER_CACHE_TTL', 7 * 24 * 60 * 60)
+CRAWLER_CACHE_NEGATIVE_TTL = getattr(settings, 'CRAWLER_CACHE_NEGATIVE_TTL', 60 * 60)
+CRAWLER_CACHE_MAX_SIZE = getattr(settings, 'CRAWLER_CACHE_MAX_SIZE', 256 * 1024 * 1024)
+CRAWLER_CACHE_OFFLINE = getattr(settings, 'CRAWLER_CACHE_OFFLINE', False)
+
+# Responses worth caching: found, and not found (negative, i.e. with a shorter TTL)
+CACHEABLE_STATUS_CODES = frozenset([200, 404])
+NEGATIVE_STATUS_CODES = frozenset([404])
+# Number of writes between two checks of the size of the cache
+EVICTION_INTERVAL = 100
+
+DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/', 'doi:')
+ARXIV_PREFIXES = ('https://arxiv.org/abs/', 'http://arxiv.org/abs/', 'arxiv:')
+
+
+class ResponseCacheMiss(RuntimeError):
+    pass
+
+
+def normalise_paper_id(engine, paper_id):
+    """Normalise the Paper ID so that equivalent IDs share cache entries
+    (e.g. DOIs are case insensitive, and may be given as URLs)"""
+    paper_id = paper_id.strip()
+    prefixes = DOI_PREFIXES if engine == SCOPUS_ENGINE else ARXIV_PREFIXES if engine == ARXIV_ENGINE else ()
+    for prefix in prefixes:
+        if paper_id.lower().startswith(prefix):
+            paper_id = paper_id[len(prefix):]
+            break
+    if engine == SCOPUS_ENGINE:
+        paper_id = paper_id.lower()
+    return paper_id
+
+
+class CachedResponse:
+    """Response (subset of `requests.Response` API) replayed from the cache"""
+
+    def __init__(self, url, status_code, text):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """On-disk cache of metadata engines responses (no-op if `directory` is None)"""
+
+    def __init__(self, directory=CRAWLER_CACHE_DIR, ttl=CRAWLER_CACHE_TTL,
+                 max_size=CRAWLER_CACHE_MAX_SIZE, offline=CRAWLER_CACHE_OFFLINE,
+                 negative_ttl=CRAWLER_CACHE_NEGATIVE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    # -------
+    # Entries
+    # -------
+
+    @staticmethod
+    def key(engine, paper_id, resource):
+        key = '{}\n{}\n{}'.format(engine, normalise_paper_id(engine, paper_id), resource)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], '{}.json'.format(key))
+
+    def _expired(self, entry):
+        ttl = self.negative_ttl if entry.get('status_code') in NEGATIVE_STATUS_CODES else self.ttl
+        return ttl is not None and time.time() - entry.get('stored_at', 0) > ttl
+
+    def get(self, key):
+        """Return the (non expired) entry of the key, if any"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if not self.offline and self._expired(entry):
+            return None
+        try:
+            os.utime(path)  # access time, for LRU eviction
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = dict(entry, stored_at=time.time())
+        # atomic replace, as entries may be written concurrently
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 1
+        if evict:
+            self.evict()
+
+    # ---------------
+    # Crawler Lookups
+    # ---------------
+
+    def get_response(self, engine, paper_id, resource, fetch):
+        """Return the cached response of the lookup, or call `fetch` (returning
+        a `requests.Response`) and cache its response"""
+        key = self.key(engine, paper_id, resource)
+        entry = self.get(key)
+        if entry is not None:
+            return CachedResponse(entry['url'], entry['status_code'], entry['text'])
+        if self.offline:
+            raise ResponseCacheMiss('No recorded response for {} {} ({})'.format(engine, paper_id, resource))
+        response = fetch()
+        if response is not None and response.status_code in CACHEABLE_STATUS_CODES:
+            self.set(key, {'url': response.url, 'status_code': response.status_code,
+                           'text': response.text})
+        return response
+
+    def get_data(self, engine, paper_id, resource, compute):
+        """Return the cached (JSON) data of the lookup, or call `compute` and
+        cache its result (None results are not cached)"""
+        key = self.key(engine, paper_id, resource)
+        entry = self.get(key)
+        if entry is not None:
+            return entry['data']
+        if self.offline:
+            raise ResponseCacheMiss('No recorded data for {} {} ({})'.format(engine, paper_id, resource))
+        data = compute()
+        if data is not None:
+            self.set(key, {'data': data})
+        return data
+
+    # ----------
+    # Management
+    # ----------
+
+    def _entries(self):
+        """(path, size, last access) of all the entries in the cache"""
+        entries = list()
+        if not self.enabled or not os.path.isdir(self.directory):
+            return entries
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except OSError:  # removed concurrently
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries exceeding the max size of the cache.
+        Returns the number of removed entries."""
+        if self.max_size is None:
+            return 0
+        entries = sorted(self._entries(), key=lambda e: e[2], reverse=True)
+        size, removed = 0, 0
+        for path, entry_size, _ in entries:
+            size += entry_size
+            if size > self.max_size:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def clear(self, expired_only=False):
+        """Remove all (or the expired) entries. Returns the number of removed entries."""
+        removed = 0
+        for path, _, _ in self._entries():
+            if expired_only:
+                try:
+                    with open(path, encoding='utf-8') as entry_file:
+                        entry = json.load(entry_file)
+                except (OSError, ValueError):
+                    entry = dict()
+                if not self._expired(entry):
+                    continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def size(self):
+        return sum(e[1] for e in self._entries())
+
+
+# Cache shared by all the crawlers
+RESPONSE_CACHE = ResponseCache()
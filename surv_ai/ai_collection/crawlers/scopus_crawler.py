@@ -2,13 +2,13 @@
 Paper Crawler downloading metadata information
 using Elsevier API (`elsapy` Python Module)
 """
-from ..models import Keyword, Affiliation
+from ..models import Author
 from .semantic_scholar_crawler import SemanticScholarCrawler
+from .persistence import get_or_create_affiliations, add_authors_affiliations
 
 from elsapy.elsdoc import AbsDoc
 from elsapy.elssearch import ElsSearch
 from elsapy.elsclient import ElsClient
-from requests import get as get_request
 
 
 # ====================================
@@ -86,7 +86,7 @@ class ScopusCrawler(SemanticScholarCrawler):
 
     def validate(self, paper_id):
         paper_ref = self.CROSSREF_API_VALIDATE_URL_SCHEMA.format(doi=paper_id)
-        r = get_request(paper_ref)
+        r = self._cached_get('validate', paper_ref, paper_id=paper_id)
         return (r.status_code == 200)
 
     @property
@@ -97,7 +97,7 @@ class ScopusCrawler(SemanticScholarCrawler):
 
     def retrieve_paper_metadata(self):
         metadata = super().retrieve_paper_metadata()
-        self._scopus_metadata = self._get_scopus_metadata()
+        self._scopus_metadata = self._cached_data('scopus', self._get_scopus_metadata)
         return metadata
 
     def _get_scopus_metadata(self):
@@ -126,36 +126,28 @@ class ScopusCrawler(SemanticScholarCrawler):
         doc_data = None if not data_available else doc.data
         return doc_data
 
-    def _collect_paper_data(self, paper_instance=None):
-        """"""
-        paper = super()._collect_paper_data(paper_instance=paper_instance)
-        if self.scopus_available:
-            self._complement_paper_information(paper)
-        return paper
-
-    def _complement_paper_information(self, paper):
-        """Complete Paper information as gathered from SCOPUS"""
+    def _complementary_terms(self):
+        """Paper terms (i.e. author keywords, index terms, subject areas) as gathered from SCOPUS"""
+        if not self.scopus_available:
+            return list()
         try:
-            # 1. Keywords & Terms
-            # -------------------
-            self._update_paper_terms(paper)
-
-            # 2.1. Affiliations
-            # -----------------
-            affiliations_map = self._collect_authors_affiliations()
-
-            # 2.2. Complete Authors Affiliation info
-            # ---------------------------------------
-            self._add_affiliations_to_authors(affiliations_map, paper)
+            keywords_data = self._scopus_metadata.get(self.AUTHKEYWORDS_KEY, [])
+            idx_terms_data = self._scopus_metadata.get(self.IDXTERMS_KEY, [])
+            subject_areas = self._scopus_metadata.get(self.SUBJECT_AREAS_KEY, [])
 
-            # 3. CoreData
-            # -----------
-            self._update_publication_info(paper)
+            kw_set = self._collect(keywords_data, key=self.AUTH_KEYWORD_RES_DICT_KEY)
+            idx_set = self._collect(idx_terms_data, key=self.IDX_TERM_RES_DICT_KEY)
+            area_set = self._collect(subject_areas, key=self.SUBJECT_RES_DICT_KEY)
+            paper_terms = kw_set.union(idx_set).union(area_set)
         except KeyError as e:
-            raise e
+            raise KeyError('Error in Retrieving Metadata Key for Authors: {}'.format(str(e)))
+        else:
+            return [kw.lower() for kw in sorted(paper_terms)]
 
     def _update_publication_info(self, paper):
-        """"""
+        """Complete Paper publication info as gathered from SCOPUS"""
+        if not self.scopus_available:
+            return
         scd = self._scopus_metadata.get(self.COREDATA_KEY, {})
         if len(scd):
             paper.abstract = scd.get(self.PAPER_ABSTRACT, '')
@@ -168,44 +160,49 @@ class ScopusCrawler(SemanticScholarCrawler):
             paper.volume = scd.get(self.VOLUME, '')
             paper.eid = scd.get(self.EID, '')
             paper.pubmed_id = scd.get(self.PUBMED_ID, '')
-            paper.publication_date = scd.get(self.COVER_DATE, '')
-            paper.save(update_fields=['doi', 'issn', 'page_range', 'article_type',
-                                      'aggregation_type', 'volume', 'eid', 'pubmed_id',
-                                      'publication_date', 'abstract'])
+            paper.publication_date = scd.get(self.COVER_DATE) or paper.publication_date
+
+    def _update_authors_info(self, authors_paper_list):
+        """Complete Authors info (i.e. indexed name, and affiliations) as gathered from SCOPUS"""
+        if not self.scopus_available:
+            return
+        # 1. Affiliations
+        # ---------------
+        affiliations_map = self._collect_authors_affiliations()
+
+        # 2. Complete Authors Affiliation info
+        # ------------------------------------
+        self._add_affiliations_to_authors(affiliations_map)
 
     def _collect_authors_affiliations(self):
-        """
-        """
+        """Map of Scopus Affiliation ID -> Affiliation (created in bulk, if missing)"""
         try:
             affiliation_data = self._to_list(self._scopus_metadata.get(self.AFFILIATION_KEY, []))
 
             if affiliation_data is None:
                 return dict()
 
-            affiliations = dict()
+            affiliations_info, affiliations_ids = dict(), dict()
             for entry in affiliation_data:
-                aff_id = entry.get(self.AFFILIATION_ID, '')
-                aff_city = entry.get(self.AFFILIATION_CITY, '')
-                aff_country = entry.get(self.AFFILIATION_COUNTRY, '')
                 aff_name = entry.get(self.AFFILIATION_NAME, '')
-                affiliation, created = Affiliation.objects.get_or_create(name=aff_name)
-                if created:
-                    affiliation.city = aff_city
-                    affiliation.country = aff_country
-                    affiliation.save()
-                affiliations[aff_id] = affiliation
-            return affiliations
+                affiliations_info.setdefault(aff_name, (entry.get(self.AFFILIATION_CITY, ''),
+                                                        entry.get(self.AFFILIATION_COUNTRY, '')))
+                affiliations_ids[entry.get(self.AFFILIATION_ID, '')] = aff_name
         except KeyError as e:
             raise KeyError('Error in Retrieving Metadata Key for Affiliations: {}'.format(str(e)))
+        else:
+            affiliations = get_or_create_affiliations(affiliations_info)
+            return {aff_id: affiliations[name] for aff_id, name in affiliations_ids.items()
+                    if name in affiliations}
 
-    def _add_affiliations_to_authors(self, affiliations_map, paper):
-        """"""
-        authors_map = dict()
+    def _add_affiliations_to_authors(self, affiliations_map):
+        """Set the indexed name of the Authors, and link them to their Affiliations (in bulk)"""
+        authors, links = list(), list()
         try:
             authors_data = self._scopus_metadata.get(self.AUTHORS_KEYS, dict())
 
             if authors_data is None or not len(authors_data):
-                return dict()
+                return
 
             authors_data = self._to_list(authors_data.get(self.AUTHORS_RES_DICT_KEY, None))
             for auth_data in authors_data:
@@ -219,29 +216,24 @@ class ScopusCrawler(SemanticScholarCrawler):
                 if author_info is None:
                     continue
 
-                author = author_info.author
-                author.indexed_name = indexed_name
-                author.save(update_fields=['indexed_name'])
+                author_info.author.indexed_name = indexed_name
+                authors.append(author_info.author)
 
                 # add affiliation
-                if affiliations_map and len(affiliations_map):
-                    affiliation_ref = self._to_list(auth_data.get(self.AUTHOR_AFFILIATION))
-                    _aff_added = False
-                    if affiliation_ref is None:
-                        continue
-                    for aff_info in affiliation_ref:
-                        aff_id = aff_info.get(self.AUTHOR_AFFILIATION_ID, '')
-                        try:
-                            affiliation_instance = affiliations_map.get(aff_id, None)
-                        except KeyError:
-                            raise KeyError('AffiliationID {} not found in MAP'.format(aff_id))
-                        else:
-                            author_info.affiliations.add(affiliation_instance)
-                            _aff_added = True
-                    if _aff_added:
-                        author_info.save()
+                affiliation_ref = self._to_list(auth_data.get(self.AUTHOR_AFFILIATION))
+                if not affiliations_map or affiliation_ref is None:
+                    continue
+                for aff_info in affiliation_ref:
+                    affiliation = affiliations_map.get(aff_info.get(self.AUTHOR_AFFILIATION_ID, ''))
+                    if affiliation is not None:
+                        links.append((author_info, affiliation))
         except KeyError as e:
             raise KeyError('Error in Retrieving Metadata Key for Authors: {}'.format(str(e)))
+        else:
+            if authors:
+                Author.objects.bulk_update(authors, ['indexed_name'])
+            if links:
+                add_authors_affiliations(links)
 
     def _fetch_author_paper(self, author_name):
         if self._authors_paper_list is None:
@@ -251,32 +243,6 @@ class ScopusCrawler(SemanticScholarCrawler):
                 return author_paper
         return None
 
-    def _update_paper_terms(self, paper):
-        """
-        """
-        try:
-            keywords_data = self._scopus_metadata.get(self.AUTHKEYWORDS_KEY, [])
-            idx_terms_data = self._scopus_metadata.get(self.IDXTERMS_KEY, [])
-            subject_areas = self._scopus_metadata.get(self.SUBJECT_AREAS_KEY, [])
-
-            kw_set = self._collect(keywords_data, key=self.AUTH_KEYWORD_RES_DICT_KEY)
-            idx_set = self._collect(idx_terms_data, key=self.IDX_TERM_RES_DICT_KEY)
-            area_set = self._collect(subject_areas, key=self.SUBJECT_RES_DICT_KEY)
-            paper_terms = kw_set.union(idx_set).union(area_set)
-            terms_collection = []
-            for kw in paper_terms:
-                kw_instance, created = Keyword.objects.get_or_create(name=kw.lower())
-                if created:
-                    kw_instance.save()
-                terms_collection.append(kw_instance)
-
-        except KeyError as e:
-            raise KeyError('Error in Retrieving Metadata Key for Authors: {}'.format(str(e)))
-        else:
-            for term in terms_collection:
-                paper.terms.add(term)
-            paper.save()
-
     def _collect(self, keywords_data, key):
         """"""
         if keywords_data is None:
@@ -1,7 +1,8 @@
 from .base import MetadataCrawler
 from ..models import ARXIV_ENGINE, SCOPUS_ENGINE, SEMANTIC_SCHOLAR_ENGINE
-from ..models import Keyword, Author, Paper, AuthorPaper
-import requests
+from ..models import Paper
+from ..search import PAPERS_SEARCH
+from .persistence import get_or_create_keywords, get_or_create_authors, add_paper_authors
 from string import punctuation
 
 
@@ -24,7 +25,7 @@ class SemanticScholarCrawler(MetadataCrawler):
 
     def validate(self, paper_id):
         paper_ref = self.PAPER_URL.format(ID=paper_id)
-        r = requests.get(paper_ref)
+        r = self._cached_get('validate', paper_ref, paper_id=paper_id)
         return (r.status_code == 200)
 
     def _search_paper_by_id(self):
@@ -49,17 +50,17 @@ class SemanticScholarCrawler(MetadataCrawler):
         else:
             paper_id = self._id
         paper_reference_url = self.PAPER_URL.format(ID=paper_id)
-        return requests.get(paper_reference_url)
+        return self._cached_get('semanticscholar', paper_reference_url)
 
     def _get_by_doi(self):
         """"""
         paper_reference_url = self.PAPER_URL.format(ID=self._id)
-        return requests.get(paper_reference_url)
+        return self._cached_get('semanticscholar', paper_reference_url)
 
     def _get_by_semantic_scholar_id(self):
         """"""
-        paper_url = self.PAPERID_KEY.format(ID=self._id)
-        return requests.get(paper_url)
+        paper_url = self.PAPER_URL.format(ID=self._id)
+        return self._cached_get('semanticscholar', paper_url)
 
     def _fetch_metadata(self, article):
         """
@@ -92,58 +93,39 @@ class SemanticScholarCrawler(MetadataCrawler):
         try:
             # 1. Collect Paper Terms
             # ----------------------
-            keywords = self._extract_paper_terms()
+            terms = self._extract_paper_terms()
+            terms.extend(self._complementary_terms())
 
             # 2. Extract Authors
             # ------------------
-            authors_map = self._extract_paper_authors()
+            authors = self._extract_paper_authors()
 
         except KeyError as e:
             raise e
         else:
             # 3. Create Paper
             # ---------------
-            paper = self._create_paper_entry(keywords, authors_map, paper_instance)
+            paper = self._create_paper_entry(terms, authors, paper_instance)
             return paper
 
     def _extract_paper_terms(self):
-        """"""
+        """Names of the Paper terms (i.e. Semantic Scholar topics)"""
         TERM_KEY = 'topic'
         try:
-            topic_collection = list()
-            topics = self._paper_metadata.get(self.TOPICS_KEY)
-            topics = self._to_list(topics)
-            for topic in topics:
-                term = topic.get(TERM_KEY)
-                kw_instance, created = Keyword.objects.get_or_create(name=term.lower())
-                if created:
-                    kw_instance.save()
-                topic_collection.append(kw_instance)
+            topics = self._to_list(self._paper_metadata.get(self.TOPICS_KEY)) or []
+            return [topic.get(TERM_KEY).lower() for topic in topics]
         except KeyError as e:
             raise KeyError('Error in Retrieving Metadata Key for Topics: {}'.format(str(e)))
-        else:
-            return topic_collection
 
     def _extract_paper_authors(self):
-        """"""
+        """(Sanitised) names of the Paper authors, in order"""
         AUTHOR_NAME_KEY = 'name'
 
         try:
-            authors_map = dict()
-            authors = self._paper_metadata.get(self.AUTHORS_KEY)
-            authors = self._to_list(authors)
-            for order, author in enumerate(authors):
-                name = author.get(AUTHOR_NAME_KEY)
-                name = self._sanitise_author_name(name)
-                auth_instance, created = Author.objects.get_or_create(name__iexact=name)
-                if created:
-                    auth_instance.name = name
-                    auth_instance.save()
-                authors_map[(order + 1)] = auth_instance
+            authors = self._to_list(self._paper_metadata.get(self.AUTHORS_KEY)) or []
+            return [self._sanitise_author_name(author.get(AUTHOR_NAME_KEY)) for author in authors]
         except KeyError as e:
             raise KeyError('Error in Retrieving Metadata Key for Authors: {}'.format(str(e)))
-        else:
-            return authors_map
 
     def _sanitise_author_name(self, name):
         """Sanitisation function for authors' name"""
@@ -152,9 +134,8 @@ class SemanticScholarCrawler(MetadataCrawler):
             n = n.replace(p, '')
         return n
 
-    def _create_paper_entry(self, keywords_collection, authors_map,
-                            paper_instance=None):
-        """"""
+    def _create_paper_entry(self, terms, authors, paper_instance=None):
+        """Save the Paper, along with its terms and authors (in bulk)"""
 
         if paper_instance is None:
             paper = Paper(reference_id=self._id,
@@ -172,26 +153,38 @@ class SemanticScholarCrawler(MetadataCrawler):
             paper.arxiv_id = self._paper_metadata.get(self.ARXIVID_KEY, '')
             paper.ss_url = self._paper_metadata.get(self.URL_KEY, '')
 
+            self._update_publication_info(paper)
             paper.save()
         except KeyError as e:
             raise KeyError('Error in Retrieving Metadata Key for Paper Core Data: {}'.format(str(e)))
 
         else:
-            # Add Terms
-            for kw in keywords_collection:
-                paper.terms.add(kw)
-
-            authors_paper_list = list()
-            for sequence, author in authors_map.items():
-                author_paper = AuthorPaper(paper=paper, author=author)
-                author_paper.author_order = sequence
-                author_paper.save()
-                authors_paper_list.append(author_paper)
-
+            # Add Authors
+            authors_map = get_or_create_authors(authors)
+            authors_paper_list = add_paper_authors(paper, [authors_map[a.lower()] for a in authors])
             if len(authors_paper_list):
                 self._authors_paper_list = authors_paper_list
+                self._update_authors_info(authors_paper_list)
 
-            # Update Keywords and Authors
-            paper.save()
+            # Add Terms
+            paper.terms.add(*get_or_create_keywords(terms))
 
+            # Bulk inserts send no signal: update the search document of the paper
+            PAPERS_SEARCH.update_documents([paper.pk])
             return paper
+
+    # -----------------------------------------
+    # Hooks to complement Semantic Scholar data
+    # -----------------------------------------
+
+    def _complementary_terms(self):
+        """Names of additional Paper terms (from other metadata engines)"""
+        return list()
+
+    def _update_publication_info(self, paper):
+        """Complement (in memory) the publication info of the Paper, before saving"""
+        pass
+
+    def _update_authors_info(self, authors_paper_list):
+        """Complement the information of the (saved) Paper authors"""
+        pass
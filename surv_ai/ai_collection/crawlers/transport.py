@@ -0,0 +1,177 @@
+"""
+Shared HTTP transport used by all the crawlers (and the Azure API client).
+
+A single `requests.Session` keeps a pool of keep-alive connections per host,
+so that subsequent requests to the same API (e.g. validation and metadata
+download of a Paper) re-use the same TCP/TLS connection.
+Requests have (connect, read) timeouts, are retried with exponential backoff
+on connection errors, 429 and 5xx responses (honouring `Retry-After`), and
+are throttled according to per-host rate limits.
+Latency metrics are collected per host.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts, in seconds
+HTTP_TIMEOUT = getattr(settings, 'CRAWLER_HTTP_TIMEOUT', (5, 30))
+HTTP_MAX_RETRIES = getattr(settings, 'CRAWLER_HTTP_MAX_RETRIES', 3)
+# Backoff (in seconds) before the n-th retry: factor * 2 ** (n - 1)
+HTTP_BACKOFF_FACTOR = getattr(settings, 'CRAWLER_HTTP_BACKOFF_FACTOR', 0.5)
+HTTP_MAX_BACKOFF = 60
+# Max number of keep-alive connections per host
+HTTP_POOL_SIZE = getattr(settings, 'CRAWLER_HTTP_POOL_SIZE', 10)
+# host -> max number of requests per second
+HTTP_RATE_LIMITS = getattr(settings, 'CRAWLER_RATE_LIMITS', dict())
+
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+# ===========
+# Rate Limits
+# ===========
+
+class RateLimiter:
+    """Space out (thread-safe) the requests to a host, at the given rate"""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# =======
+# Metrics
+# =======
+
+class HostMetrics:
+    """Latency metrics of the requests to a single host"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, retry=False, failed=False):
+        self.requests += 1
+        self.retries += int(retry)
+        self.failures += int(failed)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.requests if self.requests else 0.0
+
+    def __str__(self):
+        return '{} requests ({} retries, {} failures), latency mean {:.3f}s, max {:.3f}s'.format(
+            self.requests, self.retries, self.failures, self.mean_time, self.max_time)
+
+
+# =========
+# Transport
+# =========
+
+class HttpTransport:
+    """Pooled, retrying, rate-limited HTTP client"""
+
+    def __init__(self, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                 backoff_factor=HTTP_BACKOFF_FACTOR, pool_size=HTTP_POOL_SIZE,
+                 rate_limits=HTTP_RATE_LIMITS):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._rate_limiters = {host: RateLimiter(rate) for host, rate in rate_limits.items()}
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def metrics(self):
+        """Map of host -> HostMetrics"""
+        with self._lock:
+            return dict(self._metrics)
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics = dict()
+
+    def _record(self, host, elapsed, retry=False, failed=False):
+        with self._lock:
+            self._metrics.setdefault(host, HostMetrics()).record(elapsed, retry=retry, failed=failed)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), HTTP_MAX_BACKOFF)
+        return min(self.backoff_factor * (2 ** attempt), HTTP_MAX_BACKOFF)
+
+    def request(self, method, url, **kwargs):
+        """Send the request, retrying on connection errors, 429 and 5xx responses.
+
+        The last response is returned when retries are exhausted (as `requests`
+        does), whereas the last connection error is raised.
+        """
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+        rate_limiter = self._rate_limiters.get(host)
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, time.monotonic() - start, retry=attempt > 0, failed=True)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning('%s %s failed (%s): retrying', method, url, e)
+                response = None
+            else:
+                failed = response.status_code in RETRY_STATUS_CODES
+                self._record(host, time.monotonic() - start, retry=attempt > 0, failed=failed)
+                if not failed or attempt >= self.max_retries:
+                    return response
+                logger.warning('%s %s returned %d: retrying', method, url, response.status_code)
+                response.close()  # release the connection to the pool
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+# Transport shared by all the crawlers
+TRANSPORT = HttpTransport()
+
+
+def get(url, **kwargs):
+    return TRANSPORT.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return TRANSPORT.post(url, **kwargs)
@@ -0,0 +1,176 @@
+"""
+Materialised snapshot of the dashboard (i.e. index page) of the collection.
+
+The snapshot (counters, latest resources, and top-N lists) is split in
+sections, each stored in a cache entry of its own, keyed by the version
+of the section. Model signals invalidate only the sections depending on
+the changed model, by incrementing their versions (`cache.incr`, i.e. no
+read-modify-write of the snapshot): sections are re-built (lazily) at the
+next read, and sections re-built concurrently with an invalidation are
+stored under the old version, so they are never served. The index page
+costs two cache reads (versions, and sections) whenever the collection
+does not change.
+The `rebuild_dashboard` management command re-builds the whole snapshot.
+"""
+from collections import OrderedDict
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import Paper, AuthorPaper, Author, Dataset, ExperimentalStudy
+from .models import Keyword, Method, Pathology, PathologyCategory, Topic
+
+DASHBOARD_CACHE = getattr(settings, 'DASHBOARD_CACHE', 'default')
+# Upper bound to the staleness of the snapshot with non-shared caches (seconds)
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 60)
+DASHBOARD_CACHE_KEY = 'ai-collection-dashboard'
+
+LATEST_RESOURCES = 5
+TOP_RESOURCES = 10
+TOP_TAGS = 3
+
+
+# ================
+# Section Builders
+# ================
+
+def _counts():
+    return {'papers_count': Paper.objects.listed().count(),
+            'datasets_count': Dataset.objects.count(),
+            'studies_count': ExperimentalStudy.objects.count(),
+            'algorithms_count': Method.objects.count(),
+            'pathologies_count': Pathology.objects.count(),
+            'tags_count': Keyword.objects.count(),
+            'topics_count': Topic.objects.count()}
+
+
+def _latest_papers():
+    papers = Paper.objects.for_listing().order_by('-upload_date', '-id')
+    return {'latest_papers': list(papers[:LATEST_RESOURCES])}
+
+
+def _latest_datasets():
+    datasets = Dataset.objects.select_related('pathology__category', 'reference_paper')
+    return {'latest_datasets': list(datasets.order_by('-upload_date', '-id')[:LATEST_RESOURCES])}
+
+
+def _latest_studies():
+    studies = ExperimentalStudy.objects.for_listing().order_by('-upload_date', '-id')
+    return {'latest_studies': list(studies[:LATEST_RESOURCES])}
+
+
+def _top_pathologies():
+    pathologies = Pathology.objects.select_related('category')
+    pathologies = pathologies.annotate(total=F('paper_count') + F('dataset_count'))
+    return {'top_pathologies': list(pathologies.order_by('-total', 'name')[:TOP_RESOURCES])}
+
+
+def _top_methods():
+    methods = Method.objects.order_by('-study_count', 'name')
+    return {'top_methods': list(methods[:TOP_RESOURCES])}
+
+
+def _top_topics():
+    topics = Topic.objects.order_by('-paper_count', 'name')
+    return {'top_topics': list(topics[:TOP_RESOURCES])}
+
+
+def _top_tags():
+    tags = Keyword.objects.annotate(total=F('paper_count') + F('dataset_count'))
+    return {'top_tags_all': list(tags.order_by('-total', 'name')[:TOP_TAGS]),
+            'top_tags_papers': list(tags.order_by('-paper_count', 'name')[:TOP_TAGS]),
+            'top_tags_datasets': list(tags.order_by('-dataset_count', 'name')[:TOP_TAGS])}
+
+
+SECTIONS = OrderedDict([
+    ('counts', _counts),
+    ('latest_papers', _latest_papers),
+    ('latest_datasets', _latest_datasets),
+    ('latest_studies', _latest_studies),
+    ('top_pathologies', _top_pathologies),
+    ('top_methods', _top_methods),
+    ('top_topics', _top_topics),
+    ('top_tags', _top_tags),
+])
+
+# Sections of the snapshot to invalidate whenever instances of a Model change
+DEPENDENCIES = {
+    Paper: ('counts', 'latest_papers', 'latest_datasets', 'latest_studies',
+            'top_pathologies', 'top_topics', 'top_tags'),
+    AuthorPaper: ('latest_papers',),
+    Author: ('latest_papers',),
+    Dataset: ('counts', 'latest_datasets', 'latest_studies', 'top_pathologies', 'top_tags'),
+    ExperimentalStudy: ('counts', 'latest_studies', 'top_methods'),
+    Method: ('counts', 'latest_studies', 'top_methods'),
+    Pathology: ('counts', 'latest_papers', 'latest_datasets', 'latest_studies', 'top_pathologies'),
+    PathologyCategory: ('latest_papers', 'latest_datasets', 'latest_studies', 'top_pathologies'),
+    Topic: ('counts', 'latest_papers', 'top_topics'),
+    Keyword: ('counts', 'top_tags'),
+    # Tags assigned to Papers and Datasets
+    Paper.terms.through: ('top_tags',),
+    Dataset.tags.through: ('top_tags',),
+}
+
+
+# ========
+# Snapshot
+# ========
+
+def _version_key(name):
+    return '{}:{}:version'.format(DASHBOARD_CACHE_KEY, name)
+
+
+def _section_key(name, version):
+    return '{}:{}:{}'.format(DASHBOARD_CACHE_KEY, name, version)
+
+
+def _initial_version(cache, key):
+    """Set the version of a section with no version (e.g. evicted, or never set).
+    Versions start from the current time: sections stored before an eviction are never read again."""
+    cache.add(key, int(time.time() * 1000000), None)
+    return cache.get(key)
+
+
+def get_dashboard():
+    """Return the dashboard context, re-building any invalidated section"""
+    cache = caches[DASHBOARD_CACHE]
+    version_keys = {name: _version_key(name) for name in SECTIONS}
+    versions = cache.get_many(version_keys.values())
+    section_keys = dict()
+    for name, key in version_keys.items():
+        version = versions.get(key)
+        if version is None:
+            version = _initial_version(cache, key)
+        section_keys[name] = _section_key(name, version)
+
+    sections = cache.get_many(section_keys.values())
+    context, rebuilt = dict(), dict()
+    for name, build in SECTIONS.items():
+        section = sections.get(section_keys[name])
+        if section is None:
+            # stored under the version read before building (i.e. stale if invalidated meanwhile)
+            section = rebuilt[section_keys[name]] = build()
+        context.update(section)
+    if rebuilt:
+        cache.set_many(rebuilt, DASHBOARD_CACHE_TIMEOUT)
+    return context
+
+
+def invalidate_dashboard(sections=None):
+    """Invalidate the selected sections (all, by default) of the snapshot"""
+    cache = caches[DASHBOARD_CACHE]
+    for name in (SECTIONS if sections is None else sections):
+        key = _version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:  # no version yet
+            if not cache.add(key, int(time.time() * 1000000), None):
+                cache.incr(key)  # set concurrently
+
+
+def rebuild_dashboard():
+    """Re-build the whole snapshot"""
+    invalidate_dashboard()
+    return get_dashboard()
@@ -0,0 +1,147 @@
+"""
+Delivery of (large) files, i.e. Data Archives and Paper files.
+
+Responses support conditional requests (ETag, and Last-Modified), and single
+byte ranges (Range, and If-Range), so that interrupted downloads are resumed.
+
+With `DOWNLOAD_ACCEL` set, the transfer is handed off to the front-end server:
+- `X-Accel-Redirect` (nginx): files are served from the internal location
+  `DOWNLOAD_ACCEL_PREFIX`, aliased to MEDIA_ROOT, e.g.
+  `location /protected/ { internal; alias /path/to/media/; }`;
+- `X-Sendfile` (Apache mod_xsendfile, or lighttpd): files are served from their path.
+Otherwise, files are streamed by `FileResponse` (with the `wsgi.file_wrapper`
+of the server, i.e. `sendfile`, for whole files).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DOWNLOAD_ACCEL = getattr(settings, 'DOWNLOAD_ACCEL', None)
+DOWNLOAD_ACCEL_PREFIX = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/protected/')
+
+COMPRESSED_TYPES = {'gzip': 'application/gzip', 'bzip2': 'application/x-bzip2', 'xz': 'application/x-xz'}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(ValueError):
+    pass
+
+
+class RangeFile:
+    """Read-only view of a byte range of an (open) file"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """First and last byte of the (single) range of the Range header.
+    Returns None if the whole file is to be served (i.e. no valid range,
+    or multiple ranges), and raises UnsatisfiableRange if out of the file."""
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # suffix range: last bytes of the file
+        if int(last) == 0:
+            raise UnsatisfiableRange(header)
+        return max(0, size - int(last)), size - 1
+    first, last = int(first), int(last) if last else max(int(first), size - 1)
+    if last < first:
+        return None  # invalid range
+    if first >= size:
+        raise UnsatisfiableRange(header)
+    return first, min(last, size - 1)
+
+
+def file_etag(stat):
+    """Strong ETag of the file (from its size, and modification time)"""
+    return '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag  # strong comparison
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_file(request, field_file, filename=None):
+    """Response delivering the file of the FileField (as an attachment named filename)"""
+    if not field_file:
+        raise Http404('No file')
+    path = field_file.path
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('File not found')
+    filename = filename or os.path.basename(path)
+    etag, last_modified = file_etag(stat), int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:  # Not Modified, or Precondition Failed
+        response['ETag'] = etag
+        return response
+
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding:
+        # compressed archives are sent as they are (no Content-Encoding)
+        content_type = COMPRESSED_TYPES.get(encoding)
+    content_type = content_type or 'application/octet-stream'
+    if DOWNLOAD_ACCEL:
+        # ranges, and conditional requests are handled by the front-end server, as well
+        response = HttpResponse(content_type=content_type)
+        if DOWNLOAD_ACCEL == 'X-Accel-Redirect':
+            relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+            response['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative_path)
+        else:
+            response[DOWNLOAD_ACCEL] = path
+    else:
+        byte_range = None
+        if request.method == 'GET' and _if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+            except UnsatisfiableRange:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+                return response
+        file = open(path, 'rb')
+        if byte_range is None:
+            # whole file: sent with the file wrapper of the server (i.e. sendfile), if any
+            response = FileResponse(file, content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            first, last = byte_range
+            response = FileResponse(RangeFile(file, first, last - first + 1), status=206,
+                                    content_type=content_type)
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, stat.st_size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = "attachment; filename*=UTF-8''{}".format(quote(filename))
+    return response
@@ -1,9 +1,10 @@
 from django import forms
 from .models import Paper
 from .models import (ARXIV_ENGINE, SCOPUS_ENGINE, SEMANTIC_SCHOLAR_ENGINE,
-                     MANUAL_ENTRY, DEFAULT_MANUAL_PAPER_ENTRY)
+                     MANUAL_ENTRY, DEFAULT_MANUAL_PAPER_ENTRY, PAPER_METADATA_REFERENCE)
 from django.core.exceptions import ValidationError
 from .crawlers import PaperIDNotFoundError, ArticleMetadataError, instantiate_crawler
+from .crawlers.bulk_import import parse_import_entries
 
 
 # =================================
@@ -84,23 +85,22 @@ class PaperCreationForm(forms.ModelForm):
         super()._post_clean()
         # Validate the password after self.instance is updated with form data
         # by super().
-        engine = self.cleaned_data.get('metadata_reference')
         reference_id = self.cleaned_data.get('reference_id')
         if reference_id and reference_id != DEFAULT_MANUAL_PAPER_ENTRY:
-            try:
-                _ = Paper.objects.get(reference_id=reference_id)
-            except Paper.DoesNotExist:
-                engine = self.cleaned_data['metadata_reference']
-                if not engine == MANUAL_ENTRY:
-                    try:
-                        crawler = self.crawler
-                        if crawler is not None:
-                            self._paper_metadata = crawler.retrieve_paper_metadata()
-                    except (PaperIDNotFoundError, ArticleMetadataError) as e:
-                        self.add_error('reference_id', ValueError(str(e)))
-            else:
+            if Paper.objects.filter(reference_id=reference_id).exists():
                 self.add_error('reference_id',
                                ValueError(self.error_messages['paper_existing']))
+                return
+            engine = self.cleaned_data['metadata_reference']
+            if not engine == MANUAL_ENTRY:
+                # The paper must exist in the Metadata Engine: the lookup is stored in the
+                # response cache, and reused when the paper is crawled in background
+                try:
+                    crawler = self.crawler
+                    if crawler is not None:
+                        self._paper_metadata = crawler.retrieve_paper_metadata()
+                except (PaperIDNotFoundError, ArticleMetadataError) as e:
+                    self.add_error('reference_id', ValueError(str(e)))
 
     class Meta:
         model = Paper
@@ -108,6 +108,36 @@ class PaperCreationForm(forms.ModelForm):
                   "reference_id")
 
 
+class PaperImportForm(forms.Form):
+    """Bulk import of Papers from a list of (Metadata Engine, Paper ID) pairs"""
+
+    engine = forms.ChoiceField(label='Default Metadata Engine',
+                               choices=[(e, l) for e, l in PAPER_METADATA_REFERENCE if e != MANUAL_ENTRY],
+                               help_text='Metadata Engine of the entries with the Paper ID only')
+    import_file = forms.FileField(label='File', required=False,
+                                  help_text='Text file with one entry per line (e.g. "arxiv 1706.03762")')
+    entries = forms.CharField(label='Papers', required=False, widget=forms.Textarea(attrs={'rows': 10}),
+                              help_text='One entry per line: Metadata Engine (i.e. scopus, arxiv, '
+                                        'or semanticscholar), and Paper ID (e.g. DOI, or ArXiv ID)')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        lines = (cleaned_data.get('entries') or '').splitlines()
+        import_file = cleaned_data.get('import_file')
+        if import_file:
+            try:
+                lines.extend(import_file.read().decode('utf-8').splitlines())
+            except UnicodeDecodeError:
+                raise ValidationError('The import file must be a UTF-8 text file')
+        entries, errors = parse_import_entries(lines, default_engine=cleaned_data.get('engine'))
+        if errors:
+            raise ValidationError(['Line {}: {}'.format(line_no, error) for line_no, error in errors])
+        if not entries:
+            raise ValidationError('Please enter (or upload) at least one Paper to import')
+        cleaned_data['import_entries'] = entries
+        return cleaned_data
+
+
 class BadgeClassForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
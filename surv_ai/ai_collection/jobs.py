@@ -0,0 +1,264 @@
+"""
+Lightweight background job queue, backed by the `Job` table (no external broker).
+
+Tasks are plain functions registered with the `@task` decorator, and are
+enqueued with `enqueue(task_name, label, **kwargs)` (kwargs must be JSON
+serialisable). Jobs are run by the `run_jobs` management command (worker),
+with one or more threads: each job is claimed with a conditional UPDATE,
+so that multiple workers can safely poll the same table.
+Failed jobs are retried with exponential backoff, up to `max_attempts` times.
+
+With `BACKGROUND_JOBS = False`, jobs are run synchronously, as soon as the
+enqueuing transaction commits (e.g. in development, with no worker running).
+"""
+import json
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Paper, Dataset, DataArchive, Job, JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from .models import CRAWL_DONE, CRAWL_FAILED
+from .keyphrases import update_azurekeys
+from .archives import index_archive
+from .search import DATASETS_SEARCH
+from .crawlers import instantiate_crawler
+from .crawlers.bulk_import import BulkPaperImporter, ImportEntry, IMPORT_BATCH_SIZE
+from django_resumable.cleanup import collect_stale_uploads, get_chunks_storages
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOBS = getattr(settings, 'BACKGROUND_JOBS', True)
+JOB_WORKERS = getattr(settings, 'JOB_WORKERS', 2)
+# Seconds between two polls of the queue, when no job is pending
+JOB_POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 5)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+# Delay (in seconds) before the n-th retry of a failed job: backoff * 2 ** (n - 1)
+JOB_RETRY_BACKOFF = getattr(settings, 'JOB_RETRY_BACKOFF', 60)
+# Running jobs older than this (in seconds) are considered lost (e.g. worker killed)
+JOB_TIMEOUT = getattr(settings, 'JOB_TIMEOUT', 60 * 60)
+# Seconds between two collections of the abandoned uploads by the workers (None: never)
+RESUMABLE_GC_INTERVAL = getattr(settings, 'RESUMABLE_GC_INTERVAL', None)
+
+# Max number of pending jobs considered at each claim attempt
+CLAIM_CANDIDATES = 10
+
+TASKS = dict()
+
+
+class UnknownTask(LookupError):
+    pass
+
+
+class PaperImportFailed(Exception):
+    pass
+
+
+def task(name):
+    """Register the decorated function as the task `name`"""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def worker_name(index=0):
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), index)
+
+
+# =====
+# Queue
+# =====
+
+def enqueue(task_name, label='', max_attempts=JOB_MAX_ATTEMPTS, delay=0, **kwargs):
+    """Queue the task (to be run in `delay` seconds), unless the same task
+    (with the same arguments) is already pending. Returns the Job."""
+    if task_name not in TASKS:
+        raise UnknownTask('Task "{}" is not registered'.format(task_name))
+    payload = json.dumps(kwargs, sort_keys=True)
+    job = Job.objects.filter(task=task_name, payload=payload, status=JOB_PENDING).first()
+    if job is not None:
+        return job
+    job = Job.objects.create(task=task_name, payload=payload, label=label[:300],
+                             max_attempts=max_attempts, run_after=timezone.now() + timedelta(seconds=delay))
+    if not BACKGROUND_JOBS and not delay:
+        transaction.on_commit(lambda: _run_inline(job.pk))
+    return job
+
+
+def _run_inline(pk):
+    job = _claim(pk, worker='inline')
+    if job is not None:
+        run_job(job)
+
+
+def _claim(pk, worker):
+    """Mark the pending job as running, if no other worker got it first"""
+    claimed = Job.objects.filter(pk=pk, status=JOB_PENDING).update(
+        status=JOB_RUNNING, worker=worker, started_at=timezone.now(),
+        finished_at=None, attempts=F('attempts') + 1)
+    return Job.objects.get(pk=pk) if claimed else None
+
+
+def claim_job(worker, tasks=None):
+    """Claim the next pending job (if any) for the worker"""
+    pending = Job.objects.filter(status=JOB_PENDING, run_after__lte=timezone.now())
+    if tasks:
+        pending = pending.filter(task__in=tasks)
+    for pk in pending.order_by('run_after', 'pk').values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+        job = _claim(pk, worker)
+        if job is not None:
+            return job
+    return None
+
+
+def run_job(job):
+    """Run the (claimed) job, and record its outcome"""
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise UnknownTask('Task "{}" is not registered'.format(job.task))
+        func(**json.loads(job.payload or '{}'))
+    except Exception:
+        logger.exception('Job %s (%s) failed', job.pk, job.task)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = JOB_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            job.status = JOB_FAILED
+    else:
+        job.status = JOB_DONE
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'run_after', 'finished_at'])
+    return job
+
+
+def requeue_stale_jobs(timeout=JOB_TIMEOUT):
+    """Put back in the queue the running jobs lost by their worker.
+    Returns the number of requeued jobs."""
+    started_before = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status=JOB_RUNNING, started_at__lt=started_before).update(
+        status=JOB_PENDING, run_after=timezone.now(), error='Requeued: worker lost')
+
+
+def retry_jobs(queryset):
+    """Queue the (failed) jobs again, resetting their attempts"""
+    return queryset.exclude(status=JOB_RUNNING).update(status=JOB_PENDING, attempts=0, error='',
+                                                       run_after=timezone.now(), finished_at=None)
+
+
+def run_worker(name, stop_event, tasks=None, burst=False, poll_interval=JOB_POLL_INTERVAL, progress=None):
+    """Run jobs until `stop_event` is set (or until the queue is empty, in `burst` mode).
+    `progress` (optional) is called with each completed job."""
+    try:
+        while not stop_event.is_set():
+            job = claim_job(name, tasks=tasks)
+            if job is None:
+                if burst:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job)
+            if progress is not None:
+                progress(job)
+    finally:
+        connection.close()
+
+
+# =====
+# Tasks
+# =====
+
+@task('crawl_paper')
+def crawl_paper(paper_id):
+    """Download (again) the metadata of the paper from its Metadata Engine"""
+    paper = Paper.objects.filter(pk=paper_id).first()
+    if paper is None:
+        return  # deleted in the meantime
+    downloaded = paper.crawl_status == CRAWL_DONE
+    try:
+        crawler = instantiate_crawler(paper.reference_id, paper.metadata_reference)
+        crawler.retrieve_paper_metadata()
+        with transaction.atomic():
+            paper.authors_info.all().delete()
+            paper.crawl_status, paper.crawl_error = CRAWL_DONE, ''
+            crawler.crawl_paper(paper_instance=paper)
+    except Exception as e:
+        # Papers never downloaded are kept out of the collection (and the error shown in the Admin)
+        Paper.objects.filter(pk=paper.pk).update(crawl_status=CRAWL_DONE if downloaded else CRAWL_FAILED,
+                                                 crawl_error='{}: {}'.format(type(e).__name__, e))
+        raise
+    if paper.update_azure_keys:
+        enqueue('extract_azure_keys', label=paper.title, paper_id=paper.pk)
+
+
+@task('import_papers')
+def import_papers(entries):
+    """Import a batch of Papers, i.e. (Metadata Engine, Paper ID) pairs, fetching their metadata concurrently.
+    Failed entries are reported in the error of the job (Papers already imported are skipped when retried)"""
+    results = BulkPaperImporter().run([ImportEntry(*entry) for entry in entries])
+    failed = [str(result) for result in results if not result.succeeded]
+    if failed:
+        raise PaperImportFailed('{} of {} Papers not imported:\n{}'.format(len(failed), len(results),
+                                                                           '\n'.join(failed)))
+
+
+def enqueue_paper_import(entries, batch_size=IMPORT_BATCH_SIZE):
+    """Queue the import of the entries, one job per batch of batch_size entries. Returns the Jobs."""
+    jobs = list()
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        label = '{} Papers ({} {}{})'.format(len(batch), batch[0].engine, batch[0].reference_id,
+                                             ', ...' if len(batch) > 1 else '')
+        jobs.append(enqueue('import_papers', label=label, entries=[list(entry) for entry in batch]))
+    return jobs
+
+
+@task('extract_azure_keys')
+def extract_azure_keys(paper_id=None, dataset_id=None):
+    """Add the keyphrases of the abstract (or dataset description) to the Azure keys"""
+    if dataset_id is not None:
+        instance = Dataset.objects.select_related('reference_paper').filter(pk=dataset_id).first()
+    else:
+        instance = Paper.objects.filter(pk=paper_id).first()
+    if instance is None:
+        return
+    update_azurekeys(instance)
+
+
+@task('index_archive')
+def index_data_archive(archive_id):
+    """List the contents of the Data Archive (and make them searchable)"""
+    archive = DataArchive.objects.filter(pk=archive_id).first()
+    if archive is None or not archive.archive_file:
+        return
+    index_archive(archive)
+    DATASETS_SEARCH.update_documents([archive.dataset_id])
+
+
+@task('clear_stale_uploads')
+def clear_stale_uploads():
+    """Remove the chunks of the abandoned uploads (and schedule the next collection)"""
+    try:
+        for storage in get_chunks_storages():
+            deleted, reclaimed = 0, 0
+            for n_uploads, n_bytes in collect_stale_uploads(storage):
+                deleted += n_uploads
+                reclaimed += n_bytes
+            logger.info('%s abandoned uploads deleted from %s (%s bytes)', deleted, storage.location, reclaimed)
+    finally:
+        schedule_stale_uploads_collection()
+
+
+def schedule_stale_uploads_collection():
+    """Queue the next collection of the abandoned uploads, if periodic (RESUMABLE_GC_INTERVAL)"""
+    if RESUMABLE_GC_INTERVAL:
+        enqueue('clear_stale_uploads', label='Abandoned uploads', delay=RESUMABLE_GC_INTERVAL)
@@ -0,0 +1,263 @@
+"""
+Pluggable keyphrase extraction backends, used to tag Papers and Datasets
+with `AzureKey`s.
+
+The backend is selected by the `KEYPHRASE_BACKEND` setting:
+- `azure` (default): Azure Text Analytics (see `ai_collection.azure_api`);
+- `local`: offline extractor, with no network access. Candidate phrases are
+  the runs of words between stopwords and punctuation (as in RAKE), scored
+  by TF-IDF over the corpus of abstracts (vectorised with NumPy);
+- the dotted path of a `KeyphraseBackend` subclass.
+"""
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import AzureKey, Paper, Dataset
+from . import azure_api
+
+KEYPHRASE_BACKEND = getattr(settings, 'KEYPHRASE_BACKEND', 'azure')
+# Max number of key phrases per document (local backend)
+KEYPHRASE_LOCAL_TOP_K = getattr(settings, 'KEYPHRASE_LOCAL_TOP_K', 10)
+# Seconds after which the corpus statistics of the local backend are computed again
+KEYPHRASE_CORPUS_TTL = getattr(settings, 'KEYPHRASE_CORPUS_TTL', 24 * 60 * 60)
+
+# Max length of an AzureKey name
+MAX_KEY_LENGTH = 50
+
+
+# ========
+# Backends
+# ========
+
+class KeyphraseExtractionError(RuntimeError):
+    pass
+
+
+class KeyphraseBackend:
+    """Extract the key phrases of documents"""
+
+    name = None
+
+    def fit(self, texts):
+        """Learn corpus statistics (if any) from the input texts"""
+        pass
+
+    def extract(self, documents):
+        """Key phrases of the documents (map of id -> text).
+        Returns the map of id -> key phrases (documents in error are missing)."""
+        raise NotImplementedError
+
+
+class AzureKeyphraseBackend(KeyphraseBackend):
+    """Azure Text Analytics keyPhrases API"""
+
+    name = 'azure'
+
+    def __init__(self, max_documents=azure_api.AZURE_MAX_DOCUMENTS, workers=azure_api.AZURE_WORKERS,
+                 url=None, use_cache=True):
+        self.max_documents = max_documents
+        self.workers = workers
+        self.url = url
+        self.use_cache = use_cache
+
+    def extract(self, documents):
+        return azure_api.get_azurekeys_batch(documents, max_documents=self.max_documents,
+                                             workers=self.workers, url=self.url, use_cache=self.use_cache)
+
+
+# -------------
+# Local Backend
+# -------------
+
+STOPWORDS = frozenset('''
+a about above across after again against all almost along also although always am among an and another
+any are around as at based be because been before being below between both but by can cannot could
+did do does doing done down due during each either et etc few for from further had has have having he
+her here hers him his how however i if in into is it its itself just least less many may might more
+most much must my neither no nor not of off often on once one only or other our ours out over own
+per rather same several she should show shown shows since so some such than that the their them then
+there therefore these they this those through thus to too two under until up upon us use used uses
+using very via was we were what when where whether which while who whom why will with within without
+would yet you your
+paper propose proposed present presented study studies results result approach method methods
+new novel well also first second three four five high low different various significant significantly
+'''.split())
+
+MAX_PHRASE_WORDS = 4
+MIN_WORD_LENGTH = 3
+
+URL_RE = re.compile(r'https?://\S+|www\.\S+')
+# Phrase delimiters: punctuation (but hyphens), and digits only tokens
+FRAGMENT_RE = re.compile(r"[^\w\s\-']+|\b\d+\b|_")
+WORD_RE = re.compile(r"[a-z][a-z0-9\-']*[a-z0-9]|[a-z]")
+
+
+def candidate_phrases(text):
+    """Candidate key phrases of the text (with repetitions): the runs of (up to
+    MAX_PHRASE_WORDS) words which are delimited by stopwords or punctuation"""
+    phrases = list()
+    for fragment in FRAGMENT_RE.split(URL_RE.sub(' ', text.lower())):
+        run = list()
+        for word in WORD_RE.findall(fragment) + [None]:
+            if word is None or word in STOPWORDS:
+                if run and len(run) <= MAX_PHRASE_WORDS and (len(run) > 1 or len(run[0]) >= MIN_WORD_LENGTH):
+                    phrase = ' '.join(run)
+                    if len(phrase) < MAX_KEY_LENGTH:
+                        phrases.append(phrase)
+                run = list()
+            else:
+                run.append(word)
+    return phrases
+
+
+def _occurrences(texts):
+    """Vocabulary of the candidate phrases of the texts, and the arrays of
+    (text index, phrase index) of all their occurrences"""
+    vocabulary, text_idx, phrase_idx = dict(), list(), list()
+    for i, text in enumerate(texts):
+        for phrase in candidate_phrases(text):
+            text_idx.append(i)
+            phrase_idx.append(vocabulary.setdefault(phrase, len(vocabulary)))
+    return vocabulary, np.array(text_idx, dtype=np.int64), np.array(phrase_idx, dtype=np.int64)
+
+
+def _term_counts(text_idx, phrase_idx, n_phrases):
+    """Distinct (text, phrase) pairs, and their number of occurrences"""
+    pairs, counts = np.unique(text_idx * n_phrases + phrase_idx, return_counts=True)
+    texts, phrases = np.divmod(pairs, n_phrases)
+    return texts, phrases, counts
+
+
+class LocalKeyphraseBackend(KeyphraseBackend):
+    """Offline RAKE-like candidate phrases, scored by TF-IDF"""
+
+    name = 'local'
+
+    def __init__(self, top_k=KEYPHRASE_LOCAL_TOP_K, corpus_ttl=KEYPHRASE_CORPUS_TTL):
+        self.top_k = top_k
+        self.corpus_ttl = corpus_ttl
+        self._n_texts = 0
+        self._document_frequencies = None
+        self._fitted_at = None
+        self._lock = threading.Lock()
+
+    def fit(self, texts):
+        """Document frequencies of the candidate phrases in the corpus"""
+        texts = [t for t in texts if t]
+        vocabulary, text_idx, phrase_idx = _occurrences(texts)
+        frequencies = dict()
+        if len(vocabulary):
+            _, phrases, _ = _term_counts(text_idx, phrase_idx, len(vocabulary))
+            df = np.bincount(phrases, minlength=len(vocabulary))
+            frequencies = dict(zip(vocabulary, df.tolist()))
+        with self._lock:
+            self._n_texts = len(texts)
+            self._document_frequencies = frequencies
+            self._fitted_at = time.monotonic()
+
+    def _fit_catalogue(self):
+        """Fit on the catalogue (abstracts of Papers, and texts of Datasets), unless fitted already"""
+        if self._fitted_at is not None and time.monotonic() - self._fitted_at < self.corpus_ttl:
+            return
+        texts = list(Paper.objects.exclude(abstract='').values_list('abstract', flat=True))
+        texts.extend(dataset_text(d) for d in Dataset.objects.select_related('reference_paper'))
+        self.fit(texts)
+
+    def extract(self, documents):
+        self._fit_catalogue()
+        doc_ids = [doc_id for doc_id, text in documents.items() if text and text.strip()]
+        vocabulary, text_idx, phrase_idx = _occurrences([documents[doc_id] for doc_id in doc_ids])
+        key_phrases = {str(doc_id): list() for doc_id in doc_ids}
+        if not len(vocabulary):
+            return key_phrases
+
+        texts, phrases, counts = _term_counts(text_idx, phrase_idx, len(vocabulary))
+        # Smoothed IDF: phrases unknown to the corpus count the documents they appear in
+        with self._lock:
+            n_texts, corpus_df = self._n_texts, self._document_frequencies
+        names = list(vocabulary)
+        df = np.bincount(phrases, minlength=len(vocabulary))
+        df = np.maximum(df, np.array([corpus_df.get(p, 0) for p in names], dtype=np.int64))
+        idf = np.log((1 + max(n_texts, len(doc_ids))) / (1 + df)) + 1
+        # Longer phrases are more specific (as the degree of RAKE)
+        n_words = np.array([p.count(' ') + 1 for p in names], dtype=np.float64)
+        scores = counts * idf[phrases] * np.sqrt(n_words[phrases])
+
+        # Top-k phrases per text: sort by text, then by decreasing score
+        order = np.lexsort((phrases, -scores, texts))
+        texts, phrases = texts[order], phrases[order]
+        ranks = np.arange(len(texts)) - np.searchsorted(texts, texts, side='left')
+        keep = ranks < self.top_k
+        for text, phrase in zip(texts[keep].tolist(), phrases[keep].tolist()):
+            key_phrases[str(doc_ids[text])].append(names[phrase])
+        return key_phrases
+
+
+BACKENDS = {
+    AzureKeyphraseBackend.name: AzureKeyphraseBackend,
+    LocalKeyphraseBackend.name: LocalKeyphraseBackend,
+}
+
+_backends = dict()
+
+
+def get_keyphrase_backend(name=None):
+    """The (shared) instance of the keyphrase backend, `KEYPHRASE_BACKEND` by default"""
+    name = name or KEYPHRASE_BACKEND
+    if name not in _backends:
+        backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+        _backends[name] = backend_class()
+    return _backends[name]
+
+
+# =========
+# AzureKeys
+# =========
+
+def get_or_create_azurekeys(keys):
+    """AzureKeys of the key phrases, created (in bulk) if missing"""
+    names = {AzureKey.normalise_name(key) for key in keys if len(key) < MAX_KEY_LENGTH}
+    if not names:
+        return list()
+    existing = list(AzureKey.objects.filter(name__in=names))
+    missing = names.difference(k.name for k in existing)
+    if missing:
+        # keys created concurrently (e.g. by other workers) are skipped by the unique name
+        AzureKey.objects.bulk_create([AzureKey(name=name) for name in missing], ignore_conflicts=True)
+        existing.extend(AzureKey.objects.filter(name__in=missing))
+    return existing
+
+
+def add_azurekeys(instance, keys):
+    """Add the key phrases to the Azure keys of the instance (Paper or Dataset)"""
+    azure_keys = get_or_create_azurekeys(keys)
+    if azure_keys:
+        instance.azure_keys.add(*azure_keys)  # existing links are skipped
+
+
+def dataset_text(dataset):
+    """Text describing the dataset: its description, or the abstract of its reference paper"""
+    if dataset.description:
+        return dataset.description
+    if dataset.reference_paper is not None:
+        return dataset.reference_paper.abstract
+    return ''
+
+
+def update_azurekeys(instance, backend=None):
+    """Add the keyphrases extracted from the abstract (Paper) or description (Dataset)
+    to the Azure keys of the instance"""
+    text = dataset_text(instance) if isinstance(instance, Dataset) else instance.abstract
+    if not text or not text.strip():
+        return list()
+    backend = backend or get_keyphrase_backend()
+    keys = backend.extract({'1': text}).get('1')
+    if keys is None:
+        raise KeyphraseExtractionError('Key phrases of {} not available ({} backend)'.format(instance, backend.name))
+    add_azurekeys(instance, keys)
+    return keys
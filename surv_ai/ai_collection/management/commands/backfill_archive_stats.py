@@ -0,0 +1,48 @@
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from ai_collection.models import DataArchive
+
+# Number of archives updated per query
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Record the size, and modification time of the Data Archive files (e.g. uploaded before they were stored)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Update all the archives')
+
+    def handle(self, *args, **options):
+        archives = DataArchive.objects.exclude(archive_file='').order_by('pk')
+        if not options['force']:
+            archives = archives.filter(Q(file_size__isnull=True) | Q(file_mtime__isnull=True))
+
+        batch, updated, failed = list(), 0, 0
+        for archive in archives.only('pk', 'archive_file').iterator():
+            try:
+                stat = os.stat(archive.archive_file.path)
+            except OSError as e:
+                self.stdout.write(self.style.ERROR('{} ({}): {}'.format(archive, archive.pk, e)))
+                failed += 1
+                continue
+            mtime = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            archive.file_size = stat.st_size
+            archive.file_mtime = mtime if settings.USE_TZ else timezone.make_naive(mtime)
+            batch.append(archive)
+            if len(batch) >= BATCH_SIZE:
+                updated += self._update(batch)
+                batch = list()
+        updated += self._update(batch)
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style('Size recorded for {} Data Archives ({} failed)'.format(updated, failed)))
+
+    def _update(self, archives):
+        # bulk_update(): the last change of the archives is left untouched
+        DataArchive.objects.bulk_update(archives, ['file_size', 'file_mtime'])
+        return len(archives)
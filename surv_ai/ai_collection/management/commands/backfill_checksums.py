@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from ai_collection.archives import checksum_algorithms, update_checksums, CHECKSUM_ALGORITHMS, CHECKSUM_MAX_RATE
+from ai_collection.models import DataArchive
+
+
+class Command(BaseCommand):
+    help = 'Compute the missing checksums of the Data Archives (e.g. of the archives uploaded before checksums)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', action='append', dest='algorithms', choices=CHECKSUM_ALGORITHMS,
+                            help='Checksum to compute (may be repeated, default: RESUMABLE_CHECKSUMS)')
+        parser.add_argument('--max-rate', type=float, default=CHECKSUM_MAX_RATE,
+                            help='Max read bandwidth, in MB/s (default: {}, 0 for no limit)'.format(CHECKSUM_MAX_RATE))
+        parser.add_argument('--force', action='store_true', help='Compute the checksums of all the archives')
+
+    def handle(self, *args, **options):
+        algorithms = options['algorithms'] or checksum_algorithms()
+        if not algorithms:
+            raise CommandError('No checksum to compute')
+        if options['max_rate'] < 0:
+            raise CommandError('Max rate must not be negative')
+
+        archives = DataArchive.objects.exclude(archive_file='').order_by('pk')
+        if not options['force']:
+            missing = Q()
+            for algorithm in algorithms:
+                missing |= Q(**{algorithm: ''})
+            archives = archives.filter(missing)
+
+        updated, failed = 0, 0
+        for archive in archives.iterator():
+            try:
+                if update_checksums(archive, algorithms, max_rate=options['max_rate']):
+                    updated += 1
+            except OSError as e:
+                self.stdout.write(self.style.ERROR('{} ({}): {}'.format(archive, archive.pk, e)))
+                failed += 1
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style('Checksums computed for {} Data Archives ({} failed)'.format(updated, failed)))
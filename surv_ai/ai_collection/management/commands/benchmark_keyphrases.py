@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_collection.azure_api import AZURE_MAX_DOCUMENTS, AZURE_WORKERS
+from ai_collection.keyphrases import AzureKeyphraseBackend, LocalKeyphraseBackend, dataset_text
+from ai_collection.models import Paper, Dataset
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Stand-in of the Azure keyPhrases API: replies after a fixed latency
+    (the first words of each document are returned as key phrases)"""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        documents = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['documents']
+        time.sleep(self.latency)
+        body = json.dumps({'documents': [{'id': d['id'], 'keyPhrases': d['text'].split()[:3]}
+                                         for d in documents], 'errors': []}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the local keyphrase backend against a stand-in of the Azure API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=None,
+                            help='Number of documents (default: the whole catalogue); '
+                                 'catalogue texts are repeated as needed')
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help='Latency (in seconds) of each request to the stand-in API (default: 0.2)')
+        parser.add_argument('--batch-size', type=int, default=AZURE_MAX_DOCUMENTS,
+                            help='Max number of documents per request (default: {})'.format(AZURE_MAX_DOCUMENTS))
+        parser.add_argument('--workers', type=int, default=AZURE_WORKERS,
+                            help='Max number of concurrent requests (default: {})'.format(AZURE_WORKERS))
+        parser.add_argument('--sample', type=int, default=20,
+                            help='Number of documents sent one per request (default: 20)')
+
+    def handle(self, *args, **options):
+        texts = list(Paper.objects.exclude(abstract='').values_list('abstract', flat=True))
+        texts.extend(t for t in (dataset_text(d) for d in Dataset.objects.select_related('reference_paper')) if t)
+        if not texts:
+            raise CommandError('No abstract (nor dataset description) in the catalogue')
+        n_documents = options['documents'] or len(texts)
+        # Repeated texts are made distinct (numbers are ignored by the local backend)
+        documents = {str(i): '{} {}'.format(text, i) for i, text in enumerate(islice(cycle(texts), n_documents))}
+
+        StandInHandler.latency = options['latency']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/keyPhrases'.format(server.server_port)
+        try:
+            local = LocalKeyphraseBackend()
+            self._run('Local (RAKE/TF-IDF, fit + extract)', len(documents),
+                      lambda: (local.fit(documents.values()), local.extract(documents)))
+
+            single = AzureKeyphraseBackend(max_documents=1, workers=1, url=url, use_cache=False)
+            sample = dict(islice(documents.items(), options['sample']))
+            self._run('Azure stand-in (one document per request)', len(sample),
+                      lambda: [single.extract({doc_id: text}) for doc_id, text in sample.items()])
+
+            batched = AzureKeyphraseBackend(max_documents=options['batch_size'], workers=options['workers'],
+                                            url=url, use_cache=False)
+            self._run('Azure stand-in (batched, {} workers)'.format(options['workers']), len(documents),
+                      lambda: batched.extract(documents))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _run(self, label, n_documents, func):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        throughput = n_documents / elapsed if elapsed else float('inf')
+        self.stdout.write('{:<45} {:>7} documents in {:>8.3f}s: {:>10.1f} documents/s'.format(
+            label, n_documents, elapsed, throughput))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ai_collection.crawlers.response_cache import RESPONSE_CACHE
+
+
+class Command(BaseCommand):
+    help = 'Remove the responses of the metadata engines stored in the (on-disk) crawler cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expired', action='store_true',
+                            help='Remove the expired responses only, and evict the least recently '
+                                 'used ones exceeding the max size of the cache')
+
+    def handle(self, *args, **options):
+        if not RESPONSE_CACHE.enabled:
+            self.stdout.write('The crawler cache is disabled')
+            return
+        removed = RESPONSE_CACHE.clear(expired_only=options['expired'])
+        if options['expired']:
+            removed += RESPONSE_CACHE.evict()
+        self.stdout.write(self.style.SUCCESS('{} cached responses removed ({} bytes left)'.format(
+            removed, RESPONSE_CACHE.size())))
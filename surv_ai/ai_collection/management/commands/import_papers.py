@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_collection.crawlers.bulk_import import (BulkPaperImporter, InvalidImportEntry,
+                                                parse_import_entries, normalise_engine,
+                                                IMPORT_WORKERS, IMPORT_BATCH_SIZE,
+                                                STATUS_CREATED, STATUS_EXISTING, STATUS_FAILED)
+from ai_collection.crawlers.transport import TRANSPORT
+
+
+class Command(BaseCommand):
+    help = 'Import Papers from a file of (Metadata Engine, Paper ID) pairs, one per line ' \
+           '(e.g. "arxiv 1706.03762", or "scopus, 10.1038/nature14539")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path of the file to import ("-" to read from stdin)')
+        parser.add_argument('--engine', default=None,
+                            help='Metadata Engine of the lines with the Paper ID only '
+                                 '(i.e. scopus, arxiv, or semanticscholar)')
+        parser.add_argument('--workers', type=int, default=IMPORT_WORKERS,
+                            help='Max number of concurrent requests per '
+                                 'Metadata Engine (default: {})'.format(IMPORT_WORKERS))
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Number of Papers saved per transaction '
+                                 '(default: {})'.format(IMPORT_BATCH_SIZE))
+
+    def handle(self, *args, **options):
+        try:
+            engine = normalise_engine(options['engine']) if options['engine'] else None
+        except InvalidImportEntry as e:
+            raise CommandError(str(e))
+
+        if options['file'] == '-':
+            entries, errors = parse_import_entries(sys.stdin, default_engine=engine)
+        else:
+            try:
+                with open(options['file']) as import_file:
+                    entries, errors = parse_import_entries(import_file, default_engine=engine)
+            except OSError as e:
+                raise CommandError('Error reading the import file: {}'.format(e))
+        for line_no, error in errors:
+            self.stderr.write(self.style.WARNING('Line {} skipped: {}'.format(line_no, error)))
+        if not entries:
+            raise CommandError('No Paper to import')
+
+        importer = BulkPaperImporter(workers=options['workers'], batch_size=options['batch_size'],
+                                     progress=self._report)
+        TRANSPORT.reset_metrics()
+        results = importer.run(entries)
+
+        counts = {status: len([r for r in results if r.status == status])
+                  for status in (STATUS_CREATED, STATUS_EXISTING, STATUS_FAILED)}
+        throughput = len(results) / importer.elapsed if importer.elapsed else 0
+        summary = '{} Papers: {} created, {} existing, {} failed in {:.1f}s ({:.2f} papers/s)'.format(
+            len(results), counts[STATUS_CREATED], counts[STATUS_EXISTING], counts[STATUS_FAILED],
+            importer.elapsed, throughput)
+        style = self.style.SUCCESS if not counts[STATUS_FAILED] else self.style.WARNING
+        self.stdout.write(style(summary))
+        for host, metrics in sorted(TRANSPORT.metrics.items()):
+            self.stdout.write('{}: {}'.format(host, metrics))
+
+    def _report(self, result):
+        if result.succeeded:
+            self.stdout.write(str(result))
+        else:
+            self.stdout.write(self.style.ERROR(str(result)))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from ai_collection.archives import index_archive
+from ai_collection.models import DataArchive
+from ai_collection.search import DATASETS_SEARCH
+
+
+class Command(BaseCommand):
+    help = 'List the contents (files, sizes, and extensions) of the Data Archives not indexed yet, ' \
+           'or changed since indexed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Index all the archives')
+
+    def handle(self, *args, **options):
+        archives = DataArchive.objects.exclude(archive_file='').order_by('pk')
+        if not options['force']:
+            archives = archives.filter(Q(manifest__isnull=True) | Q(file_mtime__gt=F('manifest__indexed_at')))
+
+        indexed, failed, datasets = 0, 0, set()
+        for archive in archives.iterator():
+            try:
+                manifest = index_archive(archive)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR('{} ({}): {}'.format(archive, archive.pk, e)))
+                failed += 1
+                continue
+            if manifest.error:
+                self.stdout.write(self.style.WARNING('{} ({}): {}'.format(archive, archive.pk, manifest.error)))
+            indexed += 1
+            datasets.add(archive.dataset_id)
+        DATASETS_SEARCH.update_documents(datasets)
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style('{} Data Archives indexed ({} failed)'.format(indexed, failed)))
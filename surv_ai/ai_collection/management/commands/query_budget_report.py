@@ -0,0 +1,73 @@
+import gzip
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_collection.query_budget import read_records, QUERY_BUDGET_LOG_FILE
+
+SORT_KEYS = {'db': 'db_ms', 'queries': 'queries', 'duration': 'duration_ms', 'render': 'render_ms'}
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Rank the views by their (estimated) total cost, from the logs of the QueryBudgetMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log_files', nargs='*',
+                            help='Log files (also gzipped), default: QUERY_BUDGET_LOG_FILE')
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='db',
+                            help='Rank the views by total DB time (default), queries, duration, or render time')
+        parser.add_argument('--limit', type=int, default=20, help='Number of views reported (default: 20)')
+
+    def handle(self, *args, **options):
+        log_files = options['log_files'] or ([QUERY_BUDGET_LOG_FILE] if QUERY_BUDGET_LOG_FILE else [])
+        if not log_files:
+            raise CommandError('No log file given, and QUERY_BUDGET_LOG_FILE is not set')
+
+        views = defaultdict(list)
+        for log_file in log_files:
+            opener = gzip.open if log_file.endswith('.gz') else open
+            try:
+                with opener(log_file, 'rt') as f:
+                    for record in read_records(f):
+                        views[record['view']].append(record)
+            except OSError as e:
+                raise CommandError('{}: {}'.format(log_file, e))
+        if not views:
+            self.stdout.write(self.style.WARNING('No request recorded'))
+            return
+
+        key = SORT_KEYS[options['sort']]
+        # sampled requests stand for 1 / sample_rate requests each
+        totals = {view: sum(r[key] / (r.get('sample_rate') or 1) for r in records)
+                  for view, records in views.items()}
+        ranking = sorted(totals, key=totals.get, reverse=True)[:options['limit']]
+
+        self.stdout.write('{:<50} {:>8} {:>12} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+            'View', 'Requests', 'Total ' + options['sort'], 'Queries', 'p95', 'Max', 'DB ms', 'Render ms',
+            'Total ms'))
+        for view in ranking:
+            records = views[view]
+            queries = [r['queries'] for r in records]
+            self.stdout.write('{:<50} {:>8} {:>12.0f} {:>8.1f} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                view[:50], len(records), totals[view], sum(queries) / len(records),
+                _percentile(queries, 95), max(queries),
+                sum(r['db_ms'] for r in records) / len(records),
+                sum(r['render_ms'] for r in records) / len(records),
+                sum(r['duration_ms'] for r in records) / len(records)))
+
+        self.stdout.write('\nRepeated queries (N+1):')
+        for view in ranking:
+            signatures, statements = Counter(), dict()
+            for record in views[view]:
+                for duplicate in record.get('duplicates', ()):
+                    signatures[duplicate['signature']] += 1
+                    statements[duplicate['signature']] = (duplicate['count'], duplicate['sql'])
+            for signature, n_requests in signatures.most_common(3):
+                count, sql = statements[signature]
+                self.stdout.write('  {} [{}] in {} requests (x{}): {}'.format(view, signature, n_requests,
+                                                                              count, sql))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ai_collection.dashboard import rebuild_dashboard
+
+
+class Command(BaseCommand):
+    help = 'Re-build the (cached) snapshot of counters and top-N lists shown in the dashboard'
+
+    def handle(self, *args, **options):
+        snapshot = rebuild_dashboard()
+        self.stdout.write(self.style.SUCCESS('Dashboard snapshot re-built: {} Papers, {} Datasets, '
+                                             '{} Experimental Studies'.format(snapshot['papers_count'],
+                                                                              snapshot['datasets_count'],
+                                                                              snapshot['studies_count'])))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_collection.search import full_text_search_available, SEARCH_ENGINES
+
+
+class Command(BaseCommand):
+    help = 'Re-build the full-text search document of all the resources ' \
+           '(Papers, Datasets, Experimental Studies) in the collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of resources processed per batch (default: 500)')
+
+    def handle(self, *args, **options):
+        if not full_text_search_available():
+            raise CommandError('Full-text search documents require a PostgreSQL database')
+        batch_size = options['batch_size']
+        for engine in SEARCH_ENGINES:
+            ids = list(engine.model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                engine.update_documents(ids[start:start + batch_size])
+            self.stdout.write(self.style.SUCCESS('Search documents updated for {} {}'.format(
+                len(ids), engine.model._meta.verbose_name_plural)))
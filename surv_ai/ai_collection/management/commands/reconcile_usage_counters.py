@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from ai_collection.counters import refresh_all_counters
+
+
+class Command(BaseCommand):
+    help = 'Re-compute the usage counters (Papers, Datasets, Experimental Studies) ' \
+           'of Tags, Azure Keyphrases, Pathologies, Topics, and Methods'
+
+    def handle(self, *args, **options):
+        for model_name, n_tags in refresh_all_counters().items():
+            self.stdout.write(self.style.SUCCESS('Usage counters re-computed for {} {}'.format(n_tags, model_name)))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ai_collection.azure_api import AZURE_MAX_DOCUMENTS, AZURE_WORKERS
+from ai_collection.keyphrases import (add_azurekeys, dataset_text, get_keyphrase_backend,
+                                      AzureKeyphraseBackend, KEYPHRASE_BACKEND)
+from ai_collection.models import Paper, Dataset
+
+# Number of records whose key phrases are requested (and saved) together
+CHUNK_SIZE = 5000
+
+
+def _paper_documents(papers):
+    return {'paper-{}'.format(p.pk): (p, p.abstract) for p in papers}
+
+
+def _dataset_documents(datasets):
+    return {'dataset-{}'.format(d.pk): (d, dataset_text(d)) for d in datasets}
+
+
+class Command(BaseCommand):
+    help = 'Refresh the Azure keyphrases of all the Papers and Datasets flagged with "Update Azure keys"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', action='store_true', help='Refresh Papers only')
+        parser.add_argument('--datasets', action='store_true', help='Refresh Datasets only')
+        parser.add_argument('--backend', default=KEYPHRASE_BACKEND,
+                            help='Keyphrase backend, i.e. azure, or local (default: {})'.format(KEYPHRASE_BACKEND))
+        parser.add_argument('--batch-size', type=int, default=AZURE_MAX_DOCUMENTS,
+                            help='Max number of documents per Azure request (default: {})'.format(AZURE_MAX_DOCUMENTS))
+        parser.add_argument('--workers', type=int, default=AZURE_WORKERS,
+                            help='Max number of concurrent Azure requests (default: {})'.format(AZURE_WORKERS))
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive')
+        if options['backend'] == AzureKeyphraseBackend.name:
+            backend = AzureKeyphraseBackend(max_documents=options['batch_size'], workers=options['workers'])
+        else:
+            try:
+                backend = get_keyphrase_backend(options['backend'])
+            except ImportError as e:
+                raise CommandError('Keyphrase backend not found: {}'.format(e))
+        both = not options['papers'] and not options['datasets']
+        if options['papers'] or both:
+            papers = Paper.objects.filter(update_azure_keys=True).exclude(abstract='').order_by('pk')
+            self._refresh('Papers', papers, _paper_documents, backend)
+        if options['datasets'] or both:
+            datasets = Dataset.objects.filter(update_azure_keys=True).select_related('reference_paper').order_by('pk')
+            self._refresh('Datasets', datasets, _dataset_documents, backend)
+
+    def _refresh(self, label, queryset, documents_of, backend):
+        total, updated = 0, 0
+        for start in range(0, queryset.count(), CHUNK_SIZE):
+            documents = documents_of(queryset[start:start + CHUNK_SIZE])
+            key_phrases = backend.extract({doc_id: text for doc_id, (_, text) in documents.items()})
+            with transaction.atomic():
+                for doc_id, keys in key_phrases.items():
+                    add_azurekeys(documents[doc_id][0], keys)
+            total += len(documents)
+            updated += len(key_phrases)
+        style = self.style.SUCCESS if updated == total else self.style.WARNING
+        self.stdout.write(style('{}: {} of {} refreshed'.format(label, updated, total)))
@@ -0,0 +1,59 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_collection.jobs import (run_worker, requeue_stale_jobs, schedule_stale_uploads_collection,
+                                worker_name, TASKS, JOB_WORKERS, JOB_POLL_INTERVAL)
+from ai_collection.models import JOB_DONE, JOB_FAILED
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs (i.e. metadata download, and keyphrases extraction)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=JOB_WORKERS,
+                            help='Number of concurrent jobs (default: {})'.format(JOB_WORKERS))
+        parser.add_argument('--task', action='append', dest='tasks', choices=sorted(TASKS),
+                            help='Run the given task only (may be repeated)')
+        parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL,
+                            help='Seconds between two checks of the queue, '
+                                 'when no job is pending (default: {})'.format(JOB_POLL_INTERVAL))
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once there is no pending job')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is required')
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING('{} stale Jobs queued again'.format(requeued)))
+        schedule_stale_uploads_collection()
+
+        stop = threading.Event()
+        threads = [threading.Thread(target=run_worker, name=worker_name(i),
+                                    args=(worker_name(i), stop),
+                                    kwargs={'tasks': options['tasks'], 'burst': options['burst'],
+                                            'poll_interval': options['poll_interval'],
+                                            'progress': self._report})
+                   for i in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write('{} workers started'.format(len(threads)))
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping: waiting for the running jobs to complete')
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _report(self, job):
+        message = '[{}] {} {} ({})'.format(job.get_status_display(), job.task, job.label, job.worker)
+        if job.status == JOB_DONE:
+            self.stdout.write(self.style.SUCCESS(message))
+        elif job.status == JOB_FAILED:
+            self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.WARNING('{}: retry scheduled'.format(message)))
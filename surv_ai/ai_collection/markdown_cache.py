@@ -0,0 +1,67 @@
+"""
+Cache of the HTML rendering of Markdown contents (i.e. `MarkdownxField`s).
+
+Rendered HTML (and its truncated preview, as shown in collection pages)
+is stored in the Django cache, keyed by a hash of the Markdown source:
+contents are rendered only once, and again only when the source changes.
+The cache alias can be configured via the `MARKDOWN_CACHE` setting
+(a shared cache, e.g. memcached or the database cache, is recommended
+in production so that all the workers benefit from it).
+"""
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.text import Truncator
+from markdownx.models import MarkdownxField
+from markdownx.utils import markdownify
+
+MARKDOWN_CACHE = getattr(settings, 'MARKDOWN_CACHE', 'default')
+# Rendered contents never expire: keys change with the Markdown source
+MARKDOWN_CACHE_TIMEOUT = getattr(settings, 'MARKDOWN_CACHE_TIMEOUT', None)
+MARKDOWN_CACHE_PREFIX = 'markdown-html'
+PREVIEW_WORDS = 100
+
+
+def _cache_key(text, variant):
+    digest = sha256(text.encode('utf-8')).hexdigest()
+    return '{}:{}:{}'.format(MARKDOWN_CACHE_PREFIX, variant, digest)
+
+
+def render_markdown(text):
+    """Return the HTML of the input Markdown text"""
+    if not text:
+        return ''
+    cache = caches[MARKDOWN_CACHE]
+    key = _cache_key(text, 'full')
+    html = cache.get(key)
+    if html is None:
+        html = markdownify(text)
+        cache.set(key, html, MARKDOWN_CACHE_TIMEOUT)
+    return html
+
+
+def render_markdown_preview(text, words=PREVIEW_WORDS):
+    """Return the HTML of the input Markdown text, truncated to `words` words"""
+    if not text:
+        return ''
+    cache = caches[MARKDOWN_CACHE]
+    key = _cache_key(text, 'preview-{}'.format(words))
+    html = cache.get(key)
+    if html is None:
+        html = Truncator(render_markdown(text)).words(words, html=True)
+        cache.set(key, html, MARKDOWN_CACHE_TIMEOUT)
+    return html
+
+
+def markdown_fields(model):
+    """Return the names of the Markdown fields of the input model"""
+    return [f.name for f in model._meta.fields if isinstance(f, MarkdownxField)]
+
+
+def warm_markdown_cache(instance):
+    """Render (and cache) all the Markdown contents of the input model instance"""
+    for name in markdown_fields(instance.__class__):
+        text = getattr(instance, name)
+        render_markdown(text)
+        render_markdown_preview(text)
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0011_auto_20190704_0948'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='paper_search_gin'),
+        ),
+    ]
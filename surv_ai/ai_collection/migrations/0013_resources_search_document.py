@@ -0,0 +1,33 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:19
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0012_paper_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='experimentalstudy',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='dataset_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='experimentalstudy',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='study_search_gin'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0013_resources_search_document'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['-upload_date', '-id'], name='dataset_upload_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='experimentalstudy',
+            index=models.Index(fields=['-upload_date', '-id'], name='study_upload_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['-upload_date', '-id'], name='paper_upload_keyset_idx'),
+        ),
+    ]
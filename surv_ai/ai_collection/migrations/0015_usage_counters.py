@@ -0,0 +1,69 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    from ai_collection.counters import refresh_all_counters
+    refresh_all_counters(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0014_upload_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='azurekey',
+            name='dataset_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Datasets'),
+        ),
+        migrations.AddField(
+            model_name='azurekey',
+            name='paper_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Papers'),
+        ),
+        migrations.AddField(
+            model_name='keyword',
+            name='dataset_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Datasets'),
+        ),
+        migrations.AddField(
+            model_name='keyword',
+            name='paper_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Papers'),
+        ),
+        migrations.AddField(
+            model_name='method',
+            name='dataset_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Datasets'),
+        ),
+        migrations.AddField(
+            model_name='method',
+            name='paper_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Papers'),
+        ),
+        migrations.AddField(
+            model_name='method',
+            name='study_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Experimental Studies'),
+        ),
+        migrations.AddField(
+            model_name='pathology',
+            name='dataset_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Datasets'),
+        ),
+        migrations.AddField(
+            model_name='pathology',
+            name='paper_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Papers'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='paper_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Papers'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0015_usage_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(db_index=True, max_length=100, verbose_name='Task')),
+                ('payload', models.TextField(blank=True, default='{}', help_text='Keyword arguments of the task (JSON)', verbose_name='Arguments')),
+                ('label', models.CharField(blank=True, help_text='Short description of the target of the task', max_length=300, verbose_name='Label')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=7, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='Max Attempts')),
+                ('error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('run_after', models.DateTimeField(verbose_name='Scheduled')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+            ],
+            options={
+                'verbose_name': 'Background Job',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_after'], name='job_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+def merge_duplicate_keys(apps, schema_editor):
+    """Merge Azure keys with the same (normalised) name into the oldest one"""
+    from ai_collection.counters import refresh_counters
+    AzureKey = apps.get_model('ai_collection', 'AzureKey')
+    Paper = apps.get_model('ai_collection', 'Paper')
+    Dataset = apps.get_model('ai_collection', 'Dataset')
+    relations = ((Paper.azure_keys.through, 'paper_id'), (Dataset.azure_keys.through, 'dataset_id'))
+
+    keepers, merged = dict(), set()
+    for key in AzureKey.objects.order_by('pk'):
+        name = key.name.replace('/', ' ').lower()
+        keeper = keepers.setdefault(name, key)
+        if keeper.pk == key.pk:
+            if key.name != name:
+                key.name = name
+                key.save(update_fields=['name'])
+            continue
+        for through, column in relations:
+            linked = through.objects.filter(azurekey_id=keeper.pk).values_list(column, flat=True)
+            through.objects.filter(azurekey_id=key.pk).exclude(**{column + '__in': list(linked)}).update(
+                azurekey_id=keeper.pk)
+        key.delete()
+        merged.add(keeper.pk)
+    refresh_counters('AzureKey', pks=merged, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0016_background_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_keys, migrations.RunPython.noop),
+    ]
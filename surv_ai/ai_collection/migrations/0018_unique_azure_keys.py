@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0017_merge_duplicate_azure_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='azurekey',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Azure Keyphrases'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0018_unique_azure_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataarchive',
+            name='md5',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='MD5'),
+        ),
+        migrations.AddField(
+            model_name='dataarchive',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='SHA-256'),
+        ),
+    ]
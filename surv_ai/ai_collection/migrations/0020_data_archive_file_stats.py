@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0019_data_archive_checksums'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataarchive',
+            name='file_mtime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='File modified'),
+        ),
+        migrations.AddField(
+            model_name='dataarchive',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Size (bytes)'),
+        ),
+    ]
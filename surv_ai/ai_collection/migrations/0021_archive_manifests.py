@@ -0,0 +1,33 @@
+# Generated by Django 4.2.28 on 2026-10-18 12:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0020_data_archive_file_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveManifest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archive_format', models.CharField(blank=True, help_text='Format of the archive (blank if not supported)', max_length=10, verbose_name='Format')),
+                ('n_files', models.PositiveIntegerField(default=0, verbose_name='Files')),
+                ('total_size', models.BigIntegerField(default=0, verbose_name='Uncompressed Size (bytes)')),
+                ('extensions', models.TextField(blank=True, default='{}', help_text='Number of files per extension (JSON)', verbose_name='Extensions')),
+                ('members', models.TextField(blank=True, default='[]', help_text='Names, and sizes of the (first) members (JSON)', verbose_name='Members')),
+                ('truncated', models.BooleanField(default=False, help_text='Whether some members are missing from the list', verbose_name='Truncated')),
+                ('search_text', models.TextField(blank=True, editable=False, verbose_name='Search Text')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('indexed_at', models.DateTimeField(auto_now=True, verbose_name='Indexed')),
+                ('archive', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='manifest', to='ai_collection.DataArchive')),
+            ],
+            options={
+                'verbose_name': 'Archive Manifest',
+            },
+        ),
+    ]
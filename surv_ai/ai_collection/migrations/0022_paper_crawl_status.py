@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0021_archive_manifests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='crawl_error',
+            field=models.TextField(blank=True, editable=False, verbose_name='Metadata Download Error'),
+        ),
+        migrations.AddField(
+            model_name='paper',
+            name='crawl_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('DONE', 'Downloaded'), ('FAILED', 'Failed')], db_index=True, default='DONE', max_length=7, verbose_name='Metadata Download'),
+        ),
+    ]
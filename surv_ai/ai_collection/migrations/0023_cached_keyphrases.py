@@ -0,0 +1,26 @@
+# Generated by Django 4.2.28 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_collection', '0022_paper_crawl_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedKeyphrases',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64, unique=True, verbose_name='SHA-256 of the Text')),
+                ('key_phrases', models.TextField(default='[]', help_text='List of key phrases (JSON)', verbose_name='Key Phrases')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+            ],
+            options={
+                'verbose_name': 'Cached Azure Keyphrases',
+                'verbose_name_plural': 'Cached Azure Keyphrases',
+            },
+        ),
+    ]
@@ -3,8 +3,11 @@ from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django.contrib.contenttypes.models import ContentType
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from markdownx.models import MarkdownxField
 from django_resumable.fields import ResumableFileField
+import json
 import os
 
 from  django.core.exceptions import ValidationError
@@ -32,6 +35,17 @@ PAPER_METADATA_REFERENCE = (
     (MANUAL_ENTRY, MANUAL_ENTRY)
 )
 
+# Status of the metadata download of a Paper (see `ai_collection.jobs.crawl_paper`)
+CRAWL_PENDING = 'PENDING'
+CRAWL_DONE = 'DONE'
+CRAWL_FAILED = 'FAILED'
+
+CRAWL_STATUS_CHOICES = (
+    (CRAWL_PENDING, 'Pending'),
+    (CRAWL_DONE, 'Downloaded'),
+    (CRAWL_FAILED, 'Failed'),
+)
+
 DATA_TYPES_CHOICES = (
     ('BIN', 'Binary (e.g. MatLab Files)'),
     ('IMG', 'RGB Images (e.g. JPEG, PNG)'),
@@ -122,11 +136,19 @@ class BadgeModel(models.Model):
 
 class AzureKey(models.Model):
 
-    name = models.CharField(max_length=50,verbose_name='Azure Keyphrases')
+    name = models.CharField(max_length=50,verbose_name='Azure Keyphrases', unique=True)
+
+    # Usage counters (maintained by signals, see counters.py)
+    paper_count = models.PositiveIntegerField(verbose_name='Papers', default=0, editable=False, db_index=True)
+    dataset_count = models.PositiveIntegerField(verbose_name='Datasets', default=0, editable=False, db_index=True)
+
+    @staticmethod
+    def normalise_name(name):
+        return name.replace('/', ' ').lower()
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
-        self.name = self.name.replace('/', ' ').lower()
+        self.name = self.normalise_name(self.name)
         super().save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
@@ -141,6 +163,21 @@ class AzureKey(models.Model):
         verbose_name_plural = 'Azure Keyphrases'
 
 
+class CachedKeyphrases(models.Model):
+    """Key phrases returned by Azure for a (normalised) text, by its hash (see `ai_collection.azure_api`)"""
+
+    text_hash = models.CharField(max_length=64, verbose_name='SHA-256 of the Text', unique=True)
+    key_phrases = models.TextField(verbose_name='Key Phrases', default='[]', help_text='List of key phrases (JSON)')
+    created_at = models.DateTimeField(verbose_name='Created', auto_now_add=True)
+
+    def __str__(self):
+        return self.text_hash
+
+    class Meta:
+        verbose_name = 'Cached Azure Keyphrases'
+        verbose_name_plural = 'Cached Azure Keyphrases'
+
+
 class Topic(BadgeModel):
     """Topic"""
 
@@ -148,6 +185,9 @@ class Topic(BadgeModel):
                             unique=True, primary_key=True,
                             help_text='Note: The name of the Topic will be saved as lowercase to simplify research')
 
+    # Usage counters (maintained by signals, see counters.py)
+    paper_count = models.PositiveIntegerField(verbose_name='Papers', default=0, editable=False, db_index=True)
+
     # category = models.ForeignKey(PathologyCategory, related_name='topics',
     #                             blank=True, null=True, on_delete=models.SET_NULL)
 
@@ -203,9 +243,17 @@ class Keyword(BadgeModel):
     name = models.CharField(verbose_name='Keyword', max_length=250, unique=True,
                             help_text='Note: The name of the Tag will be saved as lowercase to simplify research')
 
+    # Usage counters (maintained by signals, see counters.py)
+    paper_count = models.PositiveIntegerField(verbose_name='Papers', default=0, editable=False, db_index=True)
+    dataset_count = models.PositiveIntegerField(verbose_name='Datasets', default=0, editable=False, db_index=True)
+
+    @staticmethod
+    def normalise_name(name):
+        return name.replace('/', ' ').lower()
+
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
-        self.name = self.name.replace('/', ' ').lower()
+        self.name = self.normalise_name(self.name)
         super().save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
@@ -237,6 +285,11 @@ class Method(BadgeModel):
                             unique=True, primary_key=True,
                             help_text='Note: The name of the Method will be saved as lowercase to simplify research')
 
+    # Usage counters (maintained by signals, see counters.py)
+    paper_count = models.PositiveIntegerField(verbose_name='Papers', default=0, editable=False, db_index=True)
+    dataset_count = models.PositiveIntegerField(verbose_name='Datasets', default=0, editable=False, db_index=True)
+    study_count = models.PositiveIntegerField(verbose_name='Experimental Studies', default=0, editable=False, db_index=True)
+
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
         self.name = self.name.lower()
@@ -315,6 +368,10 @@ class Pathology(BadgeModel):
     category = models.ForeignKey(PathologyCategory, related_name='pathologies',
                                  blank=True, null=True, on_delete=models.SET_NULL)
 
+    # Usage counters (maintained by signals, see counters.py)
+    paper_count = models.PositiveIntegerField(verbose_name='Papers', default=0, editable=False, db_index=True)
+    dataset_count = models.PositiveIntegerField(verbose_name='Datasets', default=0, editable=False, db_index=True)
+
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
         self.name = self.name.lower()
@@ -342,13 +399,13 @@ class Pathology(BadgeModel):
     @property
     def papers_percent(self):
         p_count = Paper.objects.count()
-        p_perc = (self.papers.count() * 100) // p_count
+        p_perc = (self.paper_count * 100) // p_count
         return p_perc
 
     @property
     def dataset_percent(self):
         d_count = Dataset.objects.count()
-        d_perc = (self.datasets.count() * 100) // d_count
+        d_perc = (self.dataset_count * 100) // d_count
         return d_perc
 
     @property
@@ -391,6 +448,20 @@ class Author(models.Model):
         return str(self)
 
 
+class PaperQuerySet(models.QuerySet):
+
+    def listed(self):
+        """Papers shown in the collection, i.e. with their metadata downloaded"""
+        return self.filter(crawl_status=CRAWL_DONE)
+
+    def for_listing(self):
+        """Prefetch plan of related data shown in collection listings (listed Papers only)"""
+        authors_info = models.Prefetch('authors_info',
+                                       queryset=AuthorPaper.objects.select_related('author'))
+        return self.listed().select_related('pathology__category', 'topic').prefetch_related(
+            'terms', authors_info)
+
+
 class Paper(models.Model):
     """Research Paper"""
 
@@ -458,10 +529,20 @@ class Paper(models.Model):
     azure_keys = models.ManyToManyField(AzureKey,related_name='papers',verbose_name='Azure Keys',blank=True)
     update_azure_keys = models.BooleanField(default=True, verbose_name='Update Azure keys')
 
+    # Metadata download (Papers added in the Admin are crawled in background)
+    crawl_status = models.CharField(max_length=7, verbose_name='Metadata Download',
+                                    choices=CRAWL_STATUS_CHOICES, default=CRAWL_DONE, db_index=True)
+    crawl_error = models.TextField(verbose_name='Metadata Download Error', blank=True, editable=False)
+
     # Upload Statistics
     upload_date = models.DateField(editable=False, auto_now_add=True)
     last_change = models.DateTimeField(editable=False, auto_now=True)
 
+    # Weighted full-text search document (see `ai_collection.search`)
+    search_document = SearchVectorField(null=True, editable=False)
+
+    objects = PaperQuerySet.as_manager()
+
     #def save(self):
     #    if self.title is not None:
     #        super().save()
@@ -526,9 +607,12 @@ class Paper(models.Model):
 
     @property
     def authors_short(self):
-        all_authors = self.authors_info.order_by('author_order')
+        # sorting in Python makes use of (any) prefetched authors_info
+        all_authors = sorted(self.authors_info.all(), key=lambda a: a.author_order)
+        if not all_authors:
+            return ''
         first_author = all_authors[0].author
-        oths = '(et al.)' if all_authors.count() > 1 else ''
+        oths = '(et al.)' if len(all_authors) > 1 else ''
         y = self.publication_date.year if self.publication_date else ''
         return '{fa} {oths}, {year}'.format(fa=first_author.name,
                                             oths=oths, year=y)
@@ -561,7 +645,7 @@ class Paper(models.Model):
 
     @property
     def most_popular_terms(self):
-        tags = self.terms.annotate(np=models.Count('papers')).order_by('-np')
+        tags = self.terms.order_by('-paper_count')
         return tags[:5]
 
     def authors_and_affiliations(self):
@@ -608,10 +692,17 @@ class Paper(models.Model):
     def get_absolute_url(self):
         return reverse('paper_get', args=[str(self.reference_id)])
 
+    def get_file_url(self):
+        return reverse('paper_file_download', args=[self.pk])
+
     class Meta:
         verbose_name = 'Paper'
         verbose_name_plural = 'Papers'
         get_latest_by = ['-last_change']
+        # Keyset pagination of the collection pages, and full-text search
+        # (GIN on PostgreSQL, a plain index on the other backends)
+        indexes = [models.Index(fields=['-upload_date', '-id'], name='paper_upload_keyset_idx'),
+                   GinIndex(fields=['search_document'], name='paper_search_gin')]
 
 
 class AuthorPaper(models.Model):
@@ -656,6 +747,13 @@ class Affiliation(models.Model):
 # Dataset Section
 # ================
 
+class DatasetQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        """Prefetch plan of related data shown in collection listings"""
+        return self.select_related('pathology__category').prefetch_related('tags')
+
+
 class Dataset(models.Model):
     """Dataset"""
 
@@ -708,6 +806,11 @@ class Dataset(models.Model):
     azure_keys = models.ManyToManyField(AzureKey, related_name='datasets', verbose_name='Azure Keys', blank=True)
     update_azure_keys = models.BooleanField(default=True, verbose_name='Update Azure keys')
 
+    # Weighted full-text search document (see `ai_collection.search`)
+    search_document = SearchVectorField(null=True, editable=False)
+
+    objects = DatasetQuerySet.as_manager()
+
     def __str__(self):
         return self.short_name
 
@@ -756,7 +859,7 @@ class Dataset(models.Model):
 
     @property
     def most_popular_tags(self):
-        tags = self.tags.annotate(np=models.Count('datasets')).order_by('-np')
+        tags = self.tags.order_by('-dataset_count')
         return tags[:5]
 
     def get_admin_url(self):
@@ -771,6 +874,10 @@ class Dataset(models.Model):
         verbose_name = 'Dataset'
         verbose_name_plural = 'Datasets'
         get_latest_by = ['-upload_change']
+        # Keyset pagination of the collection pages, and full-text search
+        # (GIN on PostgreSQL, a plain index on the other backends)
+        indexes = [models.Index(fields=['-upload_date', '-id'], name='dataset_upload_keyset_idx'),
+                   GinIndex(fields=['search_document'], name='dataset_search_gin')]
 
 
 class DataArchive(models.Model):
@@ -793,7 +900,18 @@ class DataArchive(models.Model):
     archive_file = ResumableFileField(verbose_name='Resource File',
                                       upload_to=archive_upload_path,
                                       max_length=500,
-                                      chunks_upload_to='dataarchive_chunks/')
+                                      chunks_upload_to='dataarchive_chunks/',
+                                      checksum_fields={'sha256': 'sha256', 'md5': 'md5'},
+                                      size_field='file_size', mtime_field='file_mtime')
+
+    # Checksums, size, and modification time of the archive file
+    # (set when uploaded: these fields are declared after the archive file field)
+    sha256 = models.CharField(max_length=64, blank=True, default='', editable=False,
+                              verbose_name='SHA-256')
+    md5 = models.CharField(max_length=32, blank=True, default='', editable=False,
+                           verbose_name='MD5')
+    file_size = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='Size (bytes)')
+    file_mtime = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='File modified')
 
     notes = MarkdownxField(verbose_name='Notes', blank=True,
                            help_text='(Optional) Additional Notes')
@@ -831,12 +949,64 @@ class DataArchive(models.Model):
         _, tail = os.path.split(self.archive_file.name)
         return tail
 
+    def get_download_url(self):
+        return reverse('archive_download', args=[self.pk])
+
+    @property
+    def checksums(self):
+        """Available checksums of the archive file (algorithm -> hex digest)"""
+        return {algorithm: getattr(self, algorithm) for algorithm in ('sha256', 'md5') if getattr(self, algorithm)}
+
     class Meta:
         verbose_name = 'Attachment'
         verbose_name_plural = 'Attachments'
         get_latest_by = ['-upload_change']
 
 
+class ArchiveManifest(models.Model):
+    """Contents of a Data Archive (zip, or tar), as listed by the archive indexer
+    (see `ai_collection.archives`)"""
+
+    archive = models.OneToOneField(to=DataArchive, related_name='manifest', on_delete=models.CASCADE)
+    archive_format = models.CharField(max_length=10, verbose_name='Format', blank=True,
+                                      help_text='Format of the archive (blank if not supported)')
+    n_files = models.PositiveIntegerField(verbose_name='Files', default=0)
+    total_size = models.BigIntegerField(verbose_name='Uncompressed Size (bytes)', default=0)
+    extensions = models.TextField(verbose_name='Extensions', blank=True, default='{}',
+                                  help_text='Number of files per extension (JSON)')
+    members = models.TextField(verbose_name='Members', blank=True, default='[]',
+                               help_text='Names, and sizes of the (first) members (JSON)')
+    truncated = models.BooleanField(verbose_name='Truncated', default=False,
+                                    help_text='Whether some members are missing from the list')
+    search_text = models.TextField(verbose_name='Search Text', blank=True, editable=False)
+    error = models.TextField(verbose_name='Error', blank=True)
+    indexed_at = models.DateTimeField(verbose_name='Indexed', auto_now=True)
+
+    def __str__(self):
+        return 'Contents of {}'.format(self.archive)
+
+    @property
+    def extension_counts(self):
+        """(extension, number of files), by decreasing number of files"""
+        return sorted(json.loads(self.extensions).items(), key=lambda e: (-e[1], e[0]))
+
+    @property
+    def member_list(self):
+        """(name, size) of the (first) members"""
+        return json.loads(self.members)
+
+    class Meta:
+        verbose_name = 'Archive Manifest'
+
+
+class ExperimentalStudyQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        """Prefetch plan of related data shown in collection listings"""
+        return self.select_related('paper__pathology__category', 'dataset',
+                                   'method').prefetch_related('paper__terms')
+
+
 class ExperimentalStudy(models.Model):
     """
     An `ExperimentalStudy` connects together Papers and Datasets.
@@ -860,15 +1030,18 @@ class ExperimentalStudy(models.Model):
     upload_date = models.DateField(editable=False, auto_now_add=True)
     last_change = models.DateTimeField(editable=False, auto_now=True)
 
+    # Weighted full-text search document (see `ai_collection.search`)
+    search_document = SearchVectorField(null=True, editable=False)
+
+    objects = ExperimentalStudyQuerySet.as_manager()
+
     def __str__(self):
         return '{} on {}'.format(str(self.paper), str(self.dataset))
 
     @property
     def most_popular_terms(self):
-        paper_terms = self.paper.terms.annotate(np=models.Count('papers'))
-        dataset_tags = self.dataset.tags.annotate(nd=models.Count('datasets'))
-        tags = [(t.np, t) for t in paper_terms]
-        tags.extend([(t.nd, t) for t in dataset_tags])
+        tags = [(t.paper_count, t) for t in self.paper.terms.all()]
+        tags.extend([(t.dataset_count, t) for t in self.dataset.tags.all()])
         tags = [t[1] for t in sorted(tags, key=lambda t: t[0], reverse=True)]
         return tags[:5]
 
@@ -926,4 +1099,65 @@ class ExperimentalStudy(models.Model):
         get_latest_by = ['-upload_change']
         verbose_name = 'Experimental Study'
         verbose_name_plural = 'Experimental Studies'
+        # Keyset pagination of the collection pages, and full-text search
+        # (GIN on PostgreSQL, a plain index on the other backends)
+        indexes = [models.Index(fields=['-upload_date', '-id'], name='study_upload_keyset_idx'),
+                   GinIndex(fields=['search_document'], name='study_search_gin')]
+
+
 
+# ===============
+# Background Jobs
+# ===============
+
+JOB_PENDING = 'PENDING'
+JOB_RUNNING = 'RUNNING'
+JOB_DONE = 'DONE'
+JOB_FAILED = 'FAILED'
+
+JOB_STATUS_CHOICES = (
+    (JOB_PENDING, 'Pending'),
+    (JOB_RUNNING, 'Running'),
+    (JOB_DONE, 'Done'),
+    (JOB_FAILED, 'Failed'),
+)
+
+
+class Job(models.Model):
+    """Task queued to be run in background by the `run_jobs` worker (see `ai_collection.jobs`)"""
+
+    task = models.CharField(max_length=100, verbose_name='Task', db_index=True)
+    payload = models.TextField(verbose_name='Arguments', blank=True, default='{}',
+                               help_text='Keyword arguments of the task (JSON)')
+    label = models.CharField(max_length=300, verbose_name='Label', blank=True,
+                             help_text='Short description of the target of the task')
+    status = models.CharField(max_length=7, verbose_name='Status', choices=JOB_STATUS_CHOICES,
+                              default=JOB_PENDING)
+
+    attempts = models.PositiveSmallIntegerField(verbose_name='Attempts', default=0)
+    max_attempts = models.PositiveSmallIntegerField(verbose_name='Max Attempts', default=3)
+    error = models.TextField(verbose_name='Last Error', blank=True)
+    worker = models.CharField(max_length=100, verbose_name='Worker', blank=True)
+
+    created_at = models.DateTimeField(verbose_name='Created', auto_now_add=True)
+    run_after = models.DateTimeField(verbose_name='Scheduled')
+    started_at = models.DateTimeField(verbose_name='Started', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Finished', null=True, blank=True)
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.task, self.label, self.get_status_display())
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    class Meta:
+        verbose_name = 'Background Job'
+        ordering = ['-created_at']
+        # Polling of the pending jobs by the workers
+        indexes = [models.Index(fields=['status', 'run_after'], name='job_queue_idx')]
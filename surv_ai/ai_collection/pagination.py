@@ -0,0 +1,155 @@
+"""
+Keyset (cursor-based) pagination for the collection pages.
+
+Pages are selected by filtering on the (indexed) ordering columns of the
+resources, e.g. `(upload_date, id)`, after (or before) the position encoded
+in the `?after=` (`?before=`) cursor token. Differently from OFFSET-based
+pagination, the cost of a page does not depend on its position,
+and ordering is stable while new resources are added to the collection.
+
+A page can span multiple querysets (e.g. Datasets followed by Papers
+in tag pages), which are paginated one after the other.
+"""
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as DecodeError
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+COLLECTION_PAGE_SIZE = getattr(settings, 'COLLECTION_PAGE_SIZE', 24)
+DEFAULT_KEYSET_ORDERING = ('-upload_date', '-id')
+
+AFTER_PARAM = 'after'
+BEFORE_PARAM = 'before'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """Page of resources selected by a KeysetPaginator"""
+
+    def __init__(self, object_list, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor if has_next else None
+        self.previous_cursor = previous_cursor if has_previous else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, item):
+        return self.object_list[item]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Keyset Paginator over one (or more, in sequence) querysets.
+
+    Each queryset is sorted by the `ordering` fields, which must be
+    (possibly descending) concrete fields of the model, whose last
+    field is unique (e.g. `id`) to guarantee a total order.
+    """
+
+    def __init__(self, querysets, ordering=DEFAULT_KEYSET_ORDERING,
+                 per_page=COLLECTION_PAGE_SIZE):
+        if not isinstance(querysets, (list, tuple)):
+            querysets = [querysets]
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.querysets = [qs.order_by(*self.ordering) for qs in querysets]
+
+    # -------
+    # Cursors
+    # -------
+
+    @property
+    def _fields(self):
+        return [(f.lstrip('-'), f.startswith('-')) for f in self.ordering]
+
+    def encode_cursor(self, section, resource):
+        values = [section] + [str(getattr(resource, name)) for name, _ in self._fields]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            section, values = int(values[0]), values[1:]
+            if not 0 <= section < len(self.querysets) or len(values) != len(self._fields):
+                raise InvalidCursor(cursor)
+            opts = self.querysets[section].model._meta
+            values = [opts.get_field(name).to_python(v) for (name, _), v in zip(self._fields, values)]
+        except (DecodeError, ValueError, TypeError, IndexError, UnicodeDecodeError, ValidationError):
+            raise InvalidCursor(cursor)
+        return section, values
+
+    def _keyset_filter(self, values, forward=True):
+        """Q object selecting rows after (forward) or before the keyset values"""
+        condition = Q()
+        for i, (name, descending) in enumerate(self._fields):
+            lookup = '{}__{}'.format(name, 'lt' if descending == forward else 'gt')
+            position = Q(**{lookup: values[i]})
+            for j, (prev_name, _) in enumerate(self._fields[:i]):
+                position &= Q(**{prev_name: values[j]})
+            condition |= position
+        return condition
+
+    # -----
+    # Pages
+    # -----
+
+    def _fetch(self, sections, limit, cursor=None, forward=True):
+        results = list()
+        for section in sections:
+            queryset = self.querysets[section]
+            if not forward:
+                queryset = queryset.reverse()
+            if cursor is not None and section == cursor[0]:
+                queryset = queryset.filter(self._keyset_filter(cursor[1], forward=forward))
+            results.extend((section, r) for r in queryset[:limit - len(results)])
+            if len(results) >= limit:
+                break
+        return results
+
+    def page(self, after=None, before=None):
+        """Return the page after (or before) the input cursors.
+        No (or invalid) cursors return the first page."""
+        limit = self.per_page + 1
+        try:
+            cursor = self.decode_cursor(after or before) if (after or before) else None
+        except InvalidCursor:
+            cursor, after, before = None, None, None
+        n_sections = len(self.querysets)
+
+        if cursor is not None and not after:  # backwards
+            sections = range(cursor[0], -1, -1)
+            results = self._fetch(sections, limit, cursor, forward=False)
+            has_previous = len(results) > self.per_page
+            results = list(reversed(results[:self.per_page]))
+            has_next = bool(results)
+        else:
+            sections = range(cursor[0] if cursor else 0, n_sections)
+            results = self._fetch(sections, limit, cursor, forward=True)
+            has_next = len(results) > self.per_page
+            results = results[:self.per_page]
+            has_previous = cursor is not None
+
+        next_cursor = self.encode_cursor(*results[-1]) if results else None
+        previous_cursor = self.encode_cursor(*results[0]) if results else None
+        return KeysetPage([r for _, r in results], has_next, has_previous,
+                          next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+    def get_page(self, request):
+        """Return the page selected by the cursors in the request GET parameters"""
+        return self.page(after=request.GET.get(AFTER_PARAM),
+                         before=request.GET.get(BEFORE_PARAM))
@@ -0,0 +1,162 @@
+"""
+Query-budget instrumentation: number of SQL queries, time spent in the
+database, repeated queries (N+1 signatures), and template rendering time
+of each request, tagged by the name of the URL (e.g. `dataset_get`, or
+`admin:ai_collection_paper_changelist`).
+
+Opt-in: add `ai_collection.query_budget.QueryBudgetMiddleware` (first) to
+MIDDLEWARE. Queries are timed with `connection.execute_wrapper` (no need of
+DEBUG, and no parameter is recorded), and only a `QUERY_BUDGET_SAMPLE_RATE`
+fraction of the requests is instrumented, so that it is safe in production.
+
+Each instrumented request is logged as a JSON line by the logger
+`ai_collection.query_budget` (written to `QUERY_BUDGET_LOG_FILE`, if set),
+at WARNING level when over `QUERY_BUDGET_MAX_QUERIES`. Logs are aggregated
+into a ranked report by the `query_budget_report` management command.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from hashlib import sha1
+from logging.handlers import WatchedFileHandler
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the requests instrumented (e.g. 0.01 in production)
+QUERY_BUDGET_SAMPLE_RATE = getattr(settings, 'QUERY_BUDGET_SAMPLE_RATE', 1.0)
+# Requests with more queries than this are logged as warnings
+QUERY_BUDGET_MAX_QUERIES = getattr(settings, 'QUERY_BUDGET_MAX_QUERIES', 50)
+# Queries repeated (with different parameters) at least this many times are reported as N+1
+QUERY_BUDGET_DUPLICATES = getattr(settings, 'QUERY_BUDGET_DUPLICATES', 5)
+# File of the JSON lines (None: handled by the LOGGING settings)
+QUERY_BUDGET_LOG_FILE = getattr(settings, 'QUERY_BUDGET_LOG_FILE', None)
+
+# Max number of N+1 signatures logged per request, and length of their SQL
+MAX_DUPLICATES = 5
+MAX_SQL_LENGTH = 300
+
+IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+_local = threading.local()
+
+
+def query_signature(sql):
+    """Normalised SQL of the query (i.e. placeholders, and literals collapsed), and its hash"""
+    sql = NUMBER_RE.sub('N', IN_LIST_RE.sub('(...)', sql))
+    return sha1(sql.encode()).hexdigest()[:12], sql
+
+
+class RequestStats:
+    """Queries, and render time of a request (the execute wrapper of its connections)"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_queries = 0
+        self.rendering = False
+        self.signatures = Counter()
+        self.statements = dict()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            if self.rendering:
+                self.render_queries += 1
+            signature, statement = query_signature(sql)
+            self.signatures[signature] += 1
+            self.statements.setdefault(signature, statement)
+
+    def duplicates(self, threshold=QUERY_BUDGET_DUPLICATES):
+        return [{'signature': signature, 'count': count, 'sql': self.statements[signature][:MAX_SQL_LENGTH]}
+                for signature, count in self.signatures.most_common(MAX_DUPLICATES) if count >= threshold]
+
+
+def _timed_render(render):
+    """Template.render adding the time of the outermost templates to the stats of the request"""
+    def timed_render(self, context):
+        stats = getattr(_local, 'stats', None)
+        if stats is None or stats.rendering:  # not instrumented, or included template
+            return render(self, context)
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            stats.render_time += time.perf_counter() - start
+            stats.rendering = False
+    timed_render.query_budget = True
+    return timed_render
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(Template.render, 'query_budget', False):
+            Template.render = _timed_render(Template.render)
+        if QUERY_BUDGET_LOG_FILE and not logger.handlers:
+            handler = WatchedFileHandler(QUERY_BUDGET_LOG_FILE)  # reopened when rotated
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+    def __call__(self, request):
+        if QUERY_BUDGET_SAMPLE_RATE <= 0 or random.random() >= QUERY_BUDGET_SAMPLE_RATE:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            _local.stats = stats
+            try:
+                response = self.get_response(request)
+            finally:
+                _local.stats = None
+        duration = time.perf_counter() - start
+
+        record = {'view': view_name(request), 'method': request.method, 'status': response.status_code,
+                  'time': round(time.time(), 3), 'sample_rate': QUERY_BUDGET_SAMPLE_RATE,
+                  'duration_ms': round(duration * 1000, 2), 'queries': stats.queries,
+                  'db_ms': round(stats.db_time * 1000, 2), 'render_ms': round(stats.render_time * 1000, 2),
+                  'render_queries': stats.render_queries, 'duplicates': stats.duplicates()}
+        level = logging.WARNING if stats.queries > QUERY_BUDGET_MAX_QUERIES else logging.INFO
+        logger.log(level, json.dumps(record))
+        return response
+
+
+def read_records(lines):
+    """Iterates over the records of the log lines (i.e. the JSON object of each line,
+    whatever the prefix added by the log formatter)"""
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and 'view' in record:
+            yield record
@@ -0,0 +1,328 @@
+"""
+Full-text search over the resources in the collection (Papers, Datasets,
+and Experimental Studies).
+
+On PostgreSQL each resource keeps a weighted `tsvector` in `search_document`
+(backed by a GIN index), so searching a resource type is a single indexed
+query ranked by `ts_rank`. Other database backends (e.g. SQLite used for tests)
+fall back to a single `icontains` query, ranked by the same field weights.
+"""
+from collections import Counter
+from collections.abc import Sequence
+from functools import reduce
+from operator import add
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Case, When, Value, Count, Q, F
+from django.db.models import FloatField, TextField
+
+from .models import Paper, Dataset, ExperimentalStudy
+
+SEARCH_CONFIG = 'english'
+SEARCH_RESULTS_PER_PAGE = getattr(settings, 'SEARCH_RESULTS_PER_PAGE', 24)
+# Max number of cross-resource results that can be paged through (deeper pages are not served)
+SEARCH_MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 240)
+
+# Weights of the search document sections
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+FACET_PATHOLOGY = 'pathology'
+FACET_TOPIC = 'topic'
+FACET_METHOD = 'method'
+FACET_YEAR = 'year'
+
+
+def full_text_search_available():
+    """PostgreSQL is the only backend supporting `tsvector` documents"""
+    return connection.vendor == 'postgresql'
+
+
+# ======================
+# Resource Search Engine
+# ======================
+
+class ResourceSearchEngine:
+    """Search Engine for a single type of resource (i.e. Model class)."""
+
+    model = None
+    resource_type = ''
+    # Related objects used to compose the search document
+    select_related = ()
+    prefetch_related = ()
+    # Fields (per weight) matched by the fallback (non full-text) search
+    fallback_lookups = dict()
+    # facet name -> field (lookup) the facet counts are grouped by
+    facets = dict()
+    default_ordering = ('-upload_date', '-id')
+
+    def get_queryset(self):
+        """Resources shown in the collection"""
+        return self.model.objects.all()
+
+    # ---------------
+    # Search Document
+    # ---------------
+
+    def document_sections(self, instance):
+        """Return the map of weight -> list of texts for the input instance"""
+        raise NotImplementedError
+
+    def search_vector(self, instance):
+        """Compose the weighted search document of the input instance"""
+        vector = None
+        for weight, texts in sorted(self.document_sections(instance).items()):
+            text = ' '.join(t for t in texts if t)
+            section = SearchVector(Value(text, output_field=TextField()),
+                                   weight=weight, config=SEARCH_CONFIG)
+            vector = section if vector is None else vector + section
+        return vector
+
+    def update_documents(self, ids):
+        """Re-build the search document of the selected instances.
+
+        The update is done via `QuerySet.update` so that neither `post_save`
+        signals nor the `last_change` timestamp are triggered.
+        """
+        if not full_text_search_available():
+            return
+        instances = self.model.objects.filter(pk__in=ids)
+        instances = instances.select_related(*self.select_related)
+        instances = instances.prefetch_related(*self.prefetch_related)
+        for instance in instances:
+            vector = self.search_vector(instance)
+            self.model.objects.filter(pk=instance.pk).update(search_document=vector)
+
+    # ------
+    # Search
+    # ------
+
+    def _fallback_condition(self, lookup, query):
+        condition = Q(**{'{}__icontains'.format(lookup): query})
+        field = self.model._meta.get_field(lookup.split('__')[0])
+        if field.many_to_many or field.one_to_many:
+            # match in a sub-query to avoid duplicated rows
+            return Q(pk__in=self.model.objects.filter(condition).values('pk'))
+        return condition
+
+    def _fallback_match(self, query):
+        conditions = dict()
+        for weight, lookups in self.fallback_lookups.items():
+            weight_condition = Q()
+            for lookup in lookups:
+                weight_condition |= self._fallback_condition(lookup, query)
+            conditions[weight] = weight_condition
+        match = Q()
+        for condition in conditions.values():
+            match |= condition
+        rank = reduce(add, [Case(When(condition, then=Value(WEIGHTS[weight])), default=Value(0.0),
+                                 output_field=FloatField())
+                            for weight, condition in conditions.items()])
+        return match, rank
+
+    def _full_text_match(self, query):
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        rank = SearchRank(F('search_document'), search_query,
+                          weights=[WEIGHTS[w] for w in 'DCBA'])
+        return Q(search_document=search_query), rank
+
+    def matches(self, query, queryset=None):
+        """Return the (un-ranked) resources matching the input query"""
+        if queryset is None:
+            queryset = self.get_queryset()
+        query = query.strip()
+        if not query:
+            return queryset
+        if full_text_search_available():
+            match, _ = self._full_text_match(query)
+        else:
+            match, _ = self._fallback_match(query)
+        return queryset.filter(match)
+
+    def search(self, query, queryset=None):
+        """Return resources matching the input query, sorted by relevance.
+
+        Resources are annotated with their `rank`. An empty query returns
+        all the resources (in default order), with zero rank.
+        By default, the listing prefetch plan of the resources is used.
+        """
+        if queryset is None:
+            queryset = self.model.objects.for_listing()
+        query = query.strip()
+        if not query:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField())).order_by(
+                *self.default_ordering)
+        if full_text_search_available():
+            match, rank = self._full_text_match(query)
+        else:
+            match, rank = self._fallback_match(query)
+        queryset = queryset.filter(match).annotate(rank=rank)
+        return queryset.order_by('-rank', *self.default_ordering)
+
+    def facet_counts(self, queryset):
+        """Return the map of facet -> Counter of resources per facet value"""
+        counts = dict()
+        for facet, lookup in self.facets.items():
+            values = queryset.order_by().values_list(lookup).annotate(n=Count('pk', distinct=True))
+            counts[facet] = Counter({value: n for value, n in values if value is not None})
+        return counts
+
+
+class PaperSearchEngine(ResourceSearchEngine):
+    model = Paper
+    resource_type = 'paper'
+    prefetch_related = ('terms', 'azure_keys', 'authors')
+    fallback_lookups = {
+        'A': ('title',),
+        'B': ('terms__name', 'azure_keys__name', 'topic__name', 'pathology__name'),
+        'C': ('authors__name',),
+        'D': ('abstract',),
+    }
+    facets = {
+        FACET_PATHOLOGY: 'pathology',
+        FACET_TOPIC: 'topic',
+        FACET_METHOD: 'experimental_study__method',
+        FACET_YEAR: 'year_of_publication',
+    }
+
+    def get_queryset(self):
+        return Paper.objects.listed()
+
+    def document_sections(self, paper):
+        tags = [k.name for k in paper.terms.all()]
+        tags.extend([k.name for k in paper.azure_keys.all()])
+        tags.extend([paper.topic_id, paper.pathology_id])
+        return {'A': [paper.title],
+                'B': tags,
+                'C': [a.name for a in paper.authors.all()],
+                'D': [paper.abstract]}
+
+
+class DatasetSearchEngine(ResourceSearchEngine):
+    model = Dataset
+    resource_type = 'dataset'
+    prefetch_related = ('tags', 'azure_keys', 'data_archives__manifest')
+    fallback_lookups = {
+        'A': ('full_name', 'short_name'),
+        'B': ('tags__name', 'azure_keys__name', 'pathology__name'),
+        'C': ('data_archives__manifest__search_text',),
+        'D': ('short_description', 'description'),
+    }
+    facets = {
+        FACET_PATHOLOGY: 'pathology',
+        FACET_METHOD: 'experimental_study__method',
+        FACET_YEAR: 'release_year',
+    }
+
+    def document_sections(self, dataset):
+        tags = [k.name for k in dataset.tags.all()]
+        tags.extend([k.name for k in dataset.azure_keys.all()])
+        tags.append(dataset.pathology_id)
+        # contents of the data archives (file names, and extensions)
+        contents = [a.manifest.search_text for a in dataset.data_archives.all() if hasattr(a, 'manifest')]
+        return {'A': [dataset.full_name, dataset.short_name],
+                'B': tags,
+                'C': contents,
+                'D': [dataset.short_description, dataset.description]}
+
+
+class ExperimentalStudySearchEngine(ResourceSearchEngine):
+    model = ExperimentalStudy
+    resource_type = 'study'
+    select_related = ('paper', 'dataset')
+    fallback_lookups = {
+        'A': ('name', 'paper__title', 'dataset__full_name', 'dataset__short_name'),
+        'B': ('method__name', 'paper__pathology__name', 'paper__topic__name'),
+        'D': ('notes',),
+    }
+    facets = {
+        FACET_PATHOLOGY: 'paper__pathology',
+        FACET_TOPIC: 'paper__topic',
+        FACET_METHOD: 'method',
+        FACET_YEAR: 'paper__year_of_publication',
+    }
+
+    def document_sections(self, study):
+        return {'A': [study.name, study.paper.title,
+                      study.dataset.full_name, study.dataset.short_name],
+                'B': [study.method_id, study.paper.pathology_id, study.paper.topic_id],
+                'D': [study.notes]}
+
+
+PAPERS_SEARCH = PaperSearchEngine()
+DATASETS_SEARCH = DatasetSearchEngine()
+STUDIES_SEARCH = ExperimentalStudySearchEngine()
+
+SEARCH_ENGINES = (PAPERS_SEARCH, DATASETS_SEARCH, STUDIES_SEARCH)
+
+
+# ==============================
+# Cross-Resource (Merged) Search
+# ==============================
+
+class MergedSearchResults(Sequence):
+    """Lazy sequence of the ranked results of multiple resource types.
+
+    Results are merged by rank; ties are broken by resource type (in the order
+    of the search engines), and then by the default ordering of each type,
+    so that the merge is stable across pages. Slicing the first `n` results
+    fetches the (pk, rank) of (at most) `n` resources per type, and then the
+    resources in the slice only. The depth of the sequence is capped to
+    `max_results`, whereas `total` is the number of matching resources.
+    """
+
+    def __init__(self, querysets, max_results=SEARCH_MAX_RESULTS):
+        self._querysets = querysets
+        self.max_results = max_results
+        self._total = None
+
+    @property
+    def total(self):
+        if self._total is None:
+            self._total = sum(qs.count() for qs in self._querysets)
+        return self._total
+
+    def __len__(self):
+        return min(self.total, self.max_results)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop, _ = item.indices(len(self))
+        hits = list()
+        for type_order, queryset in enumerate(self._querysets):
+            for order, (pk, rank) in enumerate(queryset.values_list('pk', 'rank')[:stop]):
+                hits.append(((-rank, type_order, order), pk))
+        hits.sort(key=lambda h: h[0])
+        selected = [(type_order, pk) for (_, type_order, _), pk in hits[start:stop]]
+
+        resources = dict()
+        for type_order, queryset in enumerate(self._querysets):
+            pks = [pk for t, pk in selected if t == type_order]
+            if pks:
+                resources.update({(type_order, r.pk): r for r in queryset.filter(pk__in=pks)})
+        return [resources[key] for key in selected]
+
+
+def search_collection(query):
+    """Search all the resource types in the collection.
+
+    Returns the merged (lazy) sequence of ranked resources, and the
+    map of facet -> list of (value, count) of the matching resources
+    (sorted by decreasing counts).
+    """
+    results = MergedSearchResults([engine.search(query) for engine in SEARCH_ENGINES])
+    facets = dict()
+    for engine in SEARCH_ENGINES:
+        for facet, counts in engine.facet_counts(engine.matches(query)).items():
+            facets.setdefault(facet, Counter()).update(counts)
+    facets = {facet: sorted(counts.items(), key=lambda c: (-c[1], str(c[0])))
+              for facet, counts in facets.items()}
+    return results, facets
+
+
+def paginate(results, page_number, per_page=SEARCH_RESULTS_PER_PAGE):
+    """Return the requested Page of results (invalid numbers fall back to first/last)"""
+    return Paginator(results, per_page).get_page(page_number)
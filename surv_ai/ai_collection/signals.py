@@ -0,0 +1,210 @@
+"""
+Model signal handlers keeping denormalised data up to date.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Paper, AuthorPaper, Dataset, DataArchive, ExperimentalStudy
+from .search import PAPERS_SEARCH, DATASETS_SEARCH, STUDIES_SEARCH
+from .markdown_cache import warm_markdown_cache
+from .dashboard import DEPENDENCIES, invalidate_dashboard
+from .counters import COUNTERS, counted_fields, counted_relations, refresh_counters
+
+
+# ========================
+# Search Documents Updates
+# ========================
+
+def _update_tagged_documents(engine, instance, action, reverse, pk_set, related_name):
+    """Update search documents whenever tags (m2m) of resources are changed"""
+    if reverse and action == 'pre_clear':
+        # pk_set is not provided when clearing from the tag side
+        instance._cleared_resources = list(getattr(instance, related_name).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        engine.update_documents([instance.pk])
+    elif action == 'post_clear':
+        engine.update_documents(getattr(instance, '_cleared_resources', []))
+    elif pk_set:
+        engine.update_documents(pk_set)
+
+
+@receiver(post_save, sender=Paper)
+def paper_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        PAPERS_SEARCH.update_documents([instance.pk])
+        STUDIES_SEARCH.update_documents(instance.experimental_study.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Paper.terms.through)
+@receiver(m2m_changed, sender=Paper.azure_keys.through)
+def paper_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _update_tagged_documents(PAPERS_SEARCH, instance, action, reverse, pk_set, 'papers')
+
+
+@receiver(post_save, sender=AuthorPaper)
+@receiver(post_delete, sender=AuthorPaper)
+def paper_authors_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        PAPERS_SEARCH.update_documents([instance.paper_id])
+
+
+@receiver(post_save, sender=Dataset)
+def dataset_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        DATASETS_SEARCH.update_documents([instance.pk])
+        STUDIES_SEARCH.update_documents(instance.experimental_study.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Dataset.tags.through)
+@receiver(m2m_changed, sender=Dataset.azure_keys.through)
+def dataset_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _update_tagged_documents(DATASETS_SEARCH, instance, action, reverse, pk_set, 'datasets')
+
+
+@receiver(post_save, sender=ExperimentalStudy)
+def study_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        STUDIES_SEARCH.update_documents([instance.pk])
+
+
+# =======================
+# Rendered Markdown Cache
+# =======================
+
+@receiver(post_save, sender=Paper)
+@receiver(post_save, sender=Dataset)
+@receiver(post_save, sender=DataArchive)
+@receiver(post_save, sender=ExperimentalStudy)
+def markdown_contents_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        warm_markdown_cache(instance)
+
+
+# ==============
+# Usage Counters
+# ==============
+
+def _related_ids(instance, lookup):
+    field = instance._meta.get_field(lookup)
+    if field.many_to_many:
+        return set(getattr(instance, lookup).values_list('pk', flat=True))
+    value = getattr(instance, field.attname)
+    return set() if value is None else {value}
+
+
+def _counted_attnames(model):
+    """Attnames of the (FK) tags, and of the counted fields (e.g. the paper of a study) of the resource"""
+    attnames = set()
+    for (_, lookup), fields in counted_fields(model).items():
+        for name in fields | {lookup}:
+            field = model._meta.get_field(name)
+            if not field.many_to_many:
+                attnames.add(field.attname)
+    return sorted(attnames)
+
+
+def counted_resource_pre_save(sender, instance, raw=False, **kwargs):
+    """Keep the (FK) tags, and counted fields of the resource before saving, to refresh both old and new tags"""
+    if raw or instance.pk is None:
+        return
+    attnames = _counted_attnames(sender)
+    instance._counted_tags = sender.objects.filter(pk=instance.pk).values(*attnames).first() or dict()
+
+
+def counted_resource_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_counted_tags', dict())
+
+    def changed(name):
+        attname = instance._meta.get_field(name).attname
+        return previous.get(attname) != getattr(instance, attname)
+
+    for (model, lookup), fields in counted_fields(sender).items():
+        field = instance._meta.get_field(lookup)
+        # e.g. Method.paper_count changes with the paper of the study (with the same method)
+        counted_changed = created or any(changed(name) for name in fields)
+        if field.many_to_many:  # tags changes: see counted_tags_changed
+            if counted_changed and not created:
+                refresh_counters(model, _related_ids(instance, lookup))
+            continue
+        old_value, value = previous.get(field.attname), getattr(instance, field.attname)
+        if counted_changed or old_value != value:
+            refresh_counters(model, {v for v in (old_value, value) if v is not None})
+
+
+def counted_resource_pre_delete(sender, instance, **kwargs):
+    # m2m rows are deleted along with the resource, with no m2m_changed signal
+    instance._counted_tags = {(model, lookup): _related_ids(instance, lookup)
+                              for model, lookup in counted_relations(sender)}
+
+
+def counted_resource_deleted(sender, instance, **kwargs):
+    for (model, lookup), ids in getattr(instance, '_counted_tags', dict()).items():
+        refresh_counters(model, ids)
+
+
+def counted_tags_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:  # tags of a single tag changed (e.g. `keyword.papers.add()`)
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_counters(instance.__class__, [instance.pk])
+        return
+    if action == 'pre_clear':
+        # pk_set is not provided when clearing the tags of a resource
+        lookup = _M2M_LOOKUPS[sender]
+        instance._cleared_tags = _related_ids(instance, lookup)
+    elif action == 'post_clear':
+        refresh_counters(model, getattr(instance, '_cleared_tags', set()))
+    elif action in ('post_add', 'post_remove'):
+        refresh_counters(model, pk_set)
+
+
+def tag_saved(sender, instance, raw=False, **kwargs):
+    # Counters of the saved tag may have been overwritten by stale values
+    if not raw:
+        refresh_counters(sender, [instance.pk])
+
+
+# m2m intermediate Model -> name of the m2m field (on the counted resource)
+_M2M_LOOKUPS = dict()
+
+for tag_model_name in COUNTERS:
+    tag_model = apps.get_model('ai_collection', tag_model_name)
+    post_save.connect(tag_saved, sender=tag_model, dispatch_uid='usage_counters')
+
+for resource_model in (Paper, Dataset, ExperimentalStudy):
+    for _, lookup in counted_relations(resource_model):
+        field = resource_model._meta.get_field(lookup)
+        if field.many_to_many:
+            _M2M_LOOKUPS[field.remote_field.through] = lookup
+            m2m_changed.connect(counted_tags_changed, sender=field.remote_field.through,
+                                dispatch_uid='usage_counters')
+    pre_save.connect(counted_resource_pre_save, sender=resource_model, dispatch_uid='usage_counters')
+    post_save.connect(counted_resource_saved, sender=resource_model, dispatch_uid='usage_counters')
+    pre_delete.connect(counted_resource_pre_delete, sender=resource_model, dispatch_uid='usage_counters')
+    post_delete.connect(counted_resource_deleted, sender=resource_model, dispatch_uid='usage_counters')
+
+
+# ==================
+# Dashboard Snapshot
+# ==================
+
+def dashboard_changed(sender, raw=False, action=None, **kwargs):
+    if raw or (action is not None and action not in ('post_add', 'post_remove', 'post_clear')):
+        return
+    # the snapshot must not be rebuilt from uncommitted changes
+    sections = DEPENDENCIES[sender]
+    transaction.on_commit(lambda: invalidate_dashboard(sections))
+
+
+for model in DEPENDENCIES:
+    if model._meta.auto_created:  # m2m intermediate models
+        m2m_changed.connect(dashboard_changed, sender=model, dispatch_uid='dashboard')
+    else:
+        post_save.connect(dashboard_changed, sender=model, dispatch_uid='dashboard')
+        post_delete.connect(dashboard_changed, sender=model, dispatch_uid='dashboard')
@@ -1,9 +1,16 @@
 from django import template
-from markdownx.utils import markdownify
+from django.utils.safestring import mark_safe
+
+from ..markdown_cache import render_markdown, render_markdown_preview, PREVIEW_WORDS
 
 register = template.Library()
 
 
 @register.filter
 def show_markdown(text):
-    return markdownify(text)
+    return render_markdown(text)
+
+
+@register.filter
+def show_markdown_preview(text, words=PREVIEW_WORDS):
+    return mark_safe(render_markdown_preview(text, int(words)))
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test import modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Paper, Dataset, ExperimentalStudy, Keyword, Method, Pathology, Job
+from .models import Affiliation, Author, AzureKey, CachedKeyphrases, DataArchive, ArchiveManifest
+from .models import ARXIV_ENGINE, SCOPUS_ENGINE, SEMANTIC_SCHOLAR_ENGINE
+from .models import JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED, CRAWL_PENDING, CRAWL_DONE, CRAWL_FAILED
+from .forms import PaperCreationForm
+from .search import PAPERS_SEARCH, DATASETS_SEARCH, STUDIES_SEARCH, FACET_PATHOLOGY
+from .search import MergedSearchResults, search_collection, paginate
+from .pagination import KeysetPaginator, InvalidCursor
+from .markdown_cache import render_markdown, render_markdown_preview, MARKDOWN_CACHE
+from .dashboard import get_dashboard, invalidate_dashboard, SECTIONS, DASHBOARD_CACHE
+from .crawlers.base import PaperIDNotFoundError
+from .crawlers.bulk_import import parse_import_entries, ImportEntry
+from .crawlers.response_cache import ResponseCache, ResponseCacheMiss, normalise_paper_id
+from .crawlers.transport import HttpTransport
+from .crawlers.semantic_scholar_crawler import SemanticScholarCrawler
+from .crawlers.persistence import get_or_create_keywords, get_or_create_authors, add_paper_authors
+from .crawlers.persistence import get_or_create_affiliations
+from .jobs import enqueue_paper_import, import_papers, PaperImportFailed
+from .jobs import TASKS, enqueue, claim_job, run_job, retry_jobs, crawl_paper
+from .keyphrases import KeyphraseBackend, LocalKeyphraseBackend, candidate_phrases
+from .keyphrases import add_azurekeys, get_or_create_azurekeys, update_azurekeys
+from .archives import build_manifest, file_extension, UnsupportedArchive, FORMAT_TAR, FORMAT_ZIP
+from .downloads import parse_range, serve_file, UnsatisfiableRange
+from .query_budget import query_signature, read_records, RequestStats
+from .azure_api import get_azurekeys, get_azurekeys_batch, normalise_text, AZURE_MAX_DOCUMENT_SIZE
+
+
+def create_paper(title, **kwargs):
+    kwargs.setdefault('reference_id', title)
+    return Paper.objects.create(title=title, metadata_reference=ARXIV_ENGINE, **kwargs)
+
+
+class FakeCrawler:
+    """Crawler of papers with any ID, but "missing" """
+
+    def __init__(self, reference_id, engine):
+        self.reference_id = reference_id
+        self.engine = engine
+
+    def validate(self, paper_id):
+        return True
+
+    def retrieve_paper_metadata(self):
+        if self.reference_id == 'missing':
+            raise PaperIDNotFoundError()
+
+    def crawl_paper(self):
+        return Paper.objects.create(reference_id=self.reference_id, metadata_reference=self.engine,
+                                    title='Title of {}'.format(self.reference_id))
+
+
+def create_dataset(short_name, **kwargs):
+    return Dataset.objects.create(short_name=short_name, full_name=short_name.upper(),
+                                  web_url='https://example.org', **kwargs)
+
+
+# ===============
+# Fallback Search
+# ===============
+
+class FallbackSearchTests(TestCase):
+    """Ranked `icontains` search (the full-text search needs PostgreSQL)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_title = create_paper('Deep Learning for MRI')
+        cls.in_keywords = create_paper('Brain segmentation')
+        cls.in_keywords.terms.add(Keyword.objects.create(name='mri'), Keyword.objects.create(name='mri scans'))
+        cls.in_abstract = create_paper('Survival prediction', abstract='Features extracted from MRI scans')
+        cls.in_title_abstract = create_paper('MRI synthesis', abstract='MRI to CT')
+        cls.unrelated = create_paper('Chest x-ray classification')
+
+    def test_ranking(self):
+        results = list(PAPERS_SEARCH.search('mri'))
+        self.assertEqual(results, [self.in_title_abstract, self.in_title, self.in_keywords, self.in_abstract])
+        self.assertEqual([round(r.rank, 2) for r in results], [1.1, 1.0, 0.4, 0.1])
+
+    def test_empty_query(self):
+        results = list(PAPERS_SEARCH.search('  '))
+        self.assertEqual(len(results), Paper.objects.count())
+        self.assertTrue(all(r.rank == 0 for r in results))
+
+
+# =====================
+# Cross-Resource Search
+# =====================
+
+class MergedSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        glioma = Pathology.objects.create(name='glioma')
+        cls.paper = create_paper('Deep Learning for MRI', pathology=glioma)
+        cls.dataset = create_dataset('mri', pathology=glioma)
+        cls.paper_abstract = create_paper('Survival prediction', abstract='Features extracted from MRI')
+        cls.dataset_description = create_dataset('brats', description='MRI scans of brain tumours')
+        create_paper('Chest x-ray classification', pathology=glioma)
+
+    def test_merged_ranking(self):
+        results, _ = search_collection('mri')
+        # same rank: papers first
+        expected = [self.paper, self.dataset, self.paper_abstract, self.dataset_description]
+        self.assertEqual(list(results), expected)
+        self.assertEqual(results[1:3], expected[1:3])
+        self.assertEqual(results[3], expected[3])
+
+    def test_max_results(self):
+        results = MergedSearchResults([engine.search('mri') for engine in
+                                       (PAPERS_SEARCH, DATASETS_SEARCH, STUDIES_SEARCH)], max_results=3)
+        self.assertEqual((len(results), results.total), (3, 4))
+        # deeper pages are not served
+        page = paginate(results, 3, per_page=2)
+        self.assertEqual(page.number, 2)
+        self.assertEqual(list(page), [self.paper_abstract])
+
+    def test_facets(self):
+        results, facets = search_collection('mri')
+        self.assertEqual(len(results), 4)
+        # the unrelated paper (with the same pathology) is not counted
+        self.assertEqual(facets[FACET_PATHOLOGY], [('glioma', 2)])
+
+    def test_json_results(self):
+        response = self.client.get(reverse('search'), {'q': 'mri', 'format': 'json'})
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([hit['title'] for hit in data['results']][:2], [str(self.paper), str(self.dataset)])
+        self.assertEqual(data['facets'][FACET_PATHOLOGY], [['glioma', 2]])
+
+
+# =================
+# Keyset Pagination
+# =================
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.papers = [create_paper('Paper {}'.format(i)) for i in range(7)]
+        cls.datasets = [create_dataset('ds{}'.format(i)) for i in range(2)]
+
+    def test_pages_round_trip(self):
+        paginator = KeysetPaginator(Paper.objects.all(), per_page=3)
+        first = paginator.page()
+        self.assertEqual(list(first), self.papers[::-1][:3])
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+
+        second = paginator.page(after=first.next_cursor)
+        self.assertEqual(list(second), self.papers[::-1][3:6])
+        self.assertTrue(second.has_previous)
+        # back to the first page
+        self.assertEqual(list(paginator.page(before=second.previous_cursor)), list(first))
+
+        last = paginator.page(after=second.next_cursor)
+        self.assertEqual(list(last), self.papers[:1])
+        self.assertFalse(last.has_next)
+
+    def test_pages_across_querysets(self):
+        paginator = KeysetPaginator([Dataset.objects.all(), Paper.objects.all()], per_page=4)
+        seen, cursor = list(), None
+        while True:
+            page = paginator.page(after=cursor)
+            seen.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.datasets[::-1] + self.papers[::-1])
+
+    def test_tampered_cursors(self):
+        paginator = KeysetPaginator(Paper.objects.all(), per_page=3)
+        encode = lambda values: urlsafe_b64encode(json.dumps(values).encode()).decode()
+        for cursor in ('garbage', urlsafe_b64encode(b'not json').decode(),
+                       encode([1, '2020-01-01', '1']),  # no such section
+                       encode([0, '2020-01-01']),  # missing value
+                       encode([0, 'not a date', '1'])):
+            with self.assertRaises(InvalidCursor):
+                paginator.decode_cursor(cursor)
+            # invalid cursors fall back to the first page
+            page = paginator.page(after=cursor)
+            self.assertEqual(list(page), self.papers[::-1][:3])
+            self.assertFalse(page.has_previous)
+
+    def test_collection_page(self):
+        paginator = KeysetPaginator(Dataset.objects.all(), per_page=1)
+        response = self.client.get(reverse('datasets_all'), {'after': paginator.page().next_cursor})
+        self.assertEqual(list(response.context['resources']), self.datasets[:1])
+        response = self.client.get(reverse('datasets_all'), {'after': 'garbage'})
+        self.assertEqual(list(response.context['resources']), self.datasets[::-1])
+
+
+# ==============
+# Markdown Cache
+# ==============
+
+class MarkdownCacheTests(TestCase):
+
+    def setUp(self):
+        caches[MARKDOWN_CACHE].clear()
+        self.addCleanup(caches[MARKDOWN_CACHE].clear)
+        markdownify = mock.patch('ai_collection.markdown_cache.markdownify',
+                                 side_effect=lambda text: '<p>{}</p>'.format(text))
+        self.markdownify = markdownify.start()
+        self.addCleanup(markdownify.stop)
+
+    def test_rendered_once(self):
+        self.assertEqual(render_markdown('Some **text**'), '<p>Some **text**</p>')
+        self.assertEqual(render_markdown('Some **text**'), '<p>Some **text**</p>')
+        self.assertEqual(self.markdownify.call_count, 1)
+        render_markdown('Other text')  # source changed
+        self.assertEqual(self.markdownify.call_count, 2)
+        self.assertEqual(render_markdown(''), '')
+
+    def test_preview(self):
+        text = ' '.join('word{}'.format(i) for i in range(5))
+        # tags are closed by the truncation
+        self.assertEqual(render_markdown_preview(text, words=2), '<p>word0 word1…</p>')
+        template = Template('{% load markdown %}{{ text|show_markdown_preview:2 }}')
+        self.assertEqual(template.render(Context({'text': text})), '<p>word0 word1…</p>')
+        self.assertEqual(self.markdownify.call_count, 1)
+
+    def test_warmed_on_save(self):
+        create_paper('Paper', abstract='Abstract of the paper')
+        self.assertEqual(self.markdownify.call_count, 1)
+        render_markdown('Abstract of the paper')
+        render_markdown_preview('Abstract of the paper')
+        self.assertEqual(self.markdownify.call_count, 1)
+
+
+# =========
+# Dashboard
+# =========
+
+class DashboardTests(TransactionTestCase):
+    """Sections are invalidated once changes are committed"""
+
+    def setUp(self):
+        caches[DASHBOARD_CACHE].clear()
+        self.addCleanup(caches[DASHBOARD_CACHE].clear)
+
+    def test_snapshot(self):
+        self.assertEqual(get_dashboard()['papers_count'], 0)
+        with self.assertNumQueries(0):
+            get_dashboard()
+        paper = create_paper('Paper')
+        context = get_dashboard()
+        self.assertEqual((context['papers_count'], context['latest_papers']), (1, [paper]))
+
+    def test_invalidated_sections(self):
+        get_dashboard()
+        create_dataset('brats')
+        # sections not depending on datasets are not re-built
+        with mock.patch.dict(SECTIONS, {'top_topics': mock.Mock(side_effect=AssertionError)}):
+            self.assertEqual(get_dashboard()['datasets_count'], 1)
+
+    def test_invalidated_while_building(self):
+        def invalidating_counts():
+            counts = build_counts()
+            invalidate_dashboard(['counts'])  # e.g. a paper saved concurrently
+            return counts
+
+        build_counts = SECTIONS['counts']
+        with mock.patch.dict(SECTIONS, {'counts': invalidating_counts}):
+            get_dashboard()
+        # the section built with the old version is never served
+        with self.assertNumQueries(len(SECTIONS['counts']())):
+            get_dashboard()
+
+    def test_index_page(self):
+        create_dataset('brats')
+        response = self.client.get(reverse('index'), follow=True)
+        self.assertEqual(response.context['datasets_count'], 1)
+
+
+# ==============
+# Usage Counters
+# ==============
+
+class UsageCountersTests(TestCase):
+
+    def assertCounts(self, tag, **counts):
+        tag.refresh_from_db()
+        self.assertEqual({name: getattr(tag, name) for name in counts}, counts)
+
+    def test_m2m_tags(self):
+        keyword = Keyword.objects.create(name='segmentation')
+        paper, other = create_paper('A'), create_paper('B')
+        paper.terms.add(keyword)
+        self.assertCounts(keyword, paper_count=1)
+        keyword.papers.add(other)  # reverse side
+        self.assertCounts(keyword, paper_count=2)
+        paper.terms.remove(keyword)
+        self.assertCounts(keyword, paper_count=1)
+        other.terms.clear()
+        self.assertCounts(keyword, paper_count=0)
+
+        dataset = create_dataset('brats')
+        dataset.tags.add(keyword)
+        self.assertCounts(keyword, paper_count=0, dataset_count=1)
+        dataset.delete()
+        self.assertCounts(keyword, dataset_count=0)
+
+    def test_fk_tags(self):
+        glioma, covid = Pathology.objects.create(name='glioma'), Pathology.objects.create(name='covid')
+        paper = create_paper('A', pathology=glioma)
+        self.assertCounts(glioma, paper_count=1)
+        paper.pathology = covid
+        paper.save()
+        self.assertCounts(glioma, paper_count=0)
+        self.assertCounts(covid, paper_count=1)
+        paper.delete()
+        self.assertCounts(covid, paper_count=0)
+
+    def test_study_counted_fields(self):
+        method = Method.objects.create(name='cnn')
+        papers = [create_paper('A'), create_paper('B')]
+        datasets = [create_dataset('d1'), create_dataset('d2')]
+        study = ExperimentalStudy.objects.create(paper=papers[0], dataset=datasets[0], method=method)
+        ExperimentalStudy.objects.create(paper=papers[0], dataset=datasets[0], method=method)
+        self.assertCounts(method, paper_count=1, dataset_count=1, study_count=2)
+        # same method: counters depend on the paper, and dataset of the study
+        study.paper = papers[1]
+        study.save()
+        self.assertCounts(method, paper_count=2, dataset_count=1, study_count=2)
+        study.dataset = datasets[1]
+        study.save()
+        self.assertCounts(method, paper_count=2, dataset_count=2, study_count=2)
+        study.delete()
+        self.assertCounts(method, paper_count=1, dataset_count=1, study_count=1)
+
+
+# ===========
+# Bulk Import
+# ===========
+
+class BulkImportTests(TestCase):
+
+    def test_parse_entries(self):
+        lines = ['# bibliography', 'arxiv 1706.03762', 'DOI, 10.1000/xyz', '', 'semanticscholar\tabc',
+                 '1706.03762', 'arxiv 1706.03762', 'dblp 123']
+        entries, errors = parse_import_entries(lines, default_engine=ARXIV_ENGINE)
+        self.assertEqual(entries, [ImportEntry(ARXIV_ENGINE, '1706.03762'),
+                                   ImportEntry(SCOPUS_ENGINE, '10.1000/xyz'),
+                                   ImportEntry(SEMANTIC_SCHOLAR_ENGINE, 'abc')])
+        self.assertEqual(errors, [(8, 'Metadata Engine "dblp" is not supported')])
+        _, errors = parse_import_entries(['10.1000/xyz'])
+        self.assertEqual(errors, [(1, 'Metadata Engine is missing')])
+
+    def test_enqueue_batches(self):
+        entries = [ImportEntry(ARXIV_ENGINE, str(i)) for i in range(5)]
+        jobs = enqueue_paper_import(entries, batch_size=2)
+        self.assertEqual([job.label for job in jobs],
+                         ['2 Papers (ARXIV 0, ...)', '2 Papers (ARXIV 2, ...)', '1 Papers (ARXIV 4)'])
+        self.assertEqual(json.loads(jobs[-1].payload), {'entries': [[ARXIV_ENGINE, '4']]})
+
+    @mock.patch('ai_collection.crawlers.bulk_import.instantiate_crawler', FakeCrawler)
+    def test_import_job(self):
+        create_paper('Existing', reference_id='existing')
+        with self.assertRaises(PaperImportFailed) as failure:
+            import_papers(entries=[[ARXIV_ENGINE, 'new'], [ARXIV_ENGINE, 'existing'], [ARXIV_ENGINE, 'missing']])
+        self.assertTrue(str(failure.exception).startswith('1 of 3 Papers not imported:\n[failed] ARXIV missing'))
+        self.assertEqual(Paper.objects.get(reference_id='new').title, 'Title of new')
+        # papers imported are skipped when the job is retried
+        import_papers(entries=[[ARXIV_ENGINE, 'new']])
+        self.assertEqual(Paper.objects.filter(reference_id='new').count(), 1)
+
+    def test_admin_import(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.org', 'password'))
+        response = self.client.post(reverse('admin:ai_collection_paper_import'),
+                                    {'engine': ARXIV_ENGINE, 'entries': '1706.03762\nscopus 10.1000/xyz'})
+        self.assertRedirects(response, reverse('admin:ai_collection_job_changelist') + '?task=import_papers',
+                             fetch_redirect_response=False)
+        job = Job.objects.get(task='import_papers')
+        self.assertEqual(json.loads(job.payload)['entries'],
+                         [[ARXIV_ENGINE, '1706.03762'], [SCOPUS_ENGINE, '10.1000/xyz']])
+        self.assertFalse(Paper.objects.exists())  # imported in background
+
+
+# ========
+# Crawlers
+# ========
+
+@mock.patch('ai_collection.crawlers.base.RESPONSE_CACHE', ResponseCache(directory=None))
+class SemanticScholarCrawlerTests(SimpleTestCase):
+
+    def lookup_url(self, paper_id, engine):
+        with mock.patch('ai_collection.crawlers.base.transport.get') as get:
+            get.return_value.status_code = 200
+            SemanticScholarCrawler(paper_id, engine)._search_paper_by_id()
+        get.assert_called_once()
+        return get.call_args[0][0]
+
+    def test_lookup_urls(self):
+        self.assertEqual(self.lookup_url('0796f6cd7f0403a854d67d525e9b32af3b277331', SEMANTIC_SCHOLAR_ENGINE),
+                         'https://api.semanticscholar.org/v1/paper/0796f6cd7f0403a854d67d525e9b32af3b277331')
+        self.assertEqual(self.lookup_url('1706.03762', ARXIV_ENGINE),
+                         'https://api.semanticscholar.org/v1/paper/arXiv:1706.03762')
+        self.assertEqual(self.lookup_url('10.1000/xyz', SCOPUS_ENGINE),
+                         'https://api.semanticscholar.org/v1/paper/10.1000/xyz')
+
+
+class HttpTransportTests(SimpleTestCase):
+
+    @staticmethod
+    def response(status_code, headers=None):
+        return mock.Mock(status_code=status_code, headers=headers or dict())
+
+    def request(self, transport, responses):
+        with mock.patch.object(transport.session, 'request', side_effect=responses) as request, \
+                mock.patch('ai_collection.crawlers.transport.time.sleep') as sleep:
+            try:
+                return transport.get('https://api.example.org/paper/1')
+            finally:
+                self.backoffs = [c[0][0] for c in sleep.call_args_list]
+                self.assertEqual(request.call_args[1]['timeout'], transport.timeout)
+
+    def test_retries(self):
+        transport = HttpTransport(max_retries=3, backoff_factor=0.5, rate_limits=dict())
+        ok = self.response(200)
+        with self.assertLogs('ai_collection.crawlers.transport', 'WARNING'):
+            response = self.request(transport, [self.response(503, {'Retry-After': '2'}),
+                                                 requests.ConnectionError('reset'), ok])
+        self.assertIs(response, ok)
+        # Retry-After is honoured, then exponential backoff
+        self.assertEqual(self.backoffs, [2, 1.0])
+        metrics = transport.metrics['api.example.org']
+        self.assertEqual((metrics.requests, metrics.retries, metrics.failures), (3, 2, 2))
+
+    def test_retries_exhausted(self):
+        transport = HttpTransport(max_retries=1, rate_limits=dict())
+        with self.assertLogs('ai_collection.crawlers.transport', 'WARNING'):
+            response = self.request(transport, [self.response(429), self.response(429)])
+        self.assertEqual(response.status_code, 429)  # the last response is returned
+        with self.assertLogs('ai_collection.crawlers.transport', 'WARNING'):
+            with self.assertRaises(requests.ConnectionError):
+                self.request(transport, [requests.ConnectionError('reset')] * 2)
+        # client errors are not retried
+        self.assertEqual(self.request(transport, [self.response(404)]).status_code, 404)
+        self.assertEqual(self.backoffs, [])
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = ResponseCache(directory=self.directory, ttl=100, negative_ttl=10, max_size=None)
+
+    def get_response(self, paper_id, status_code=200, now=None):
+        fetch = mock.Mock(return_value=mock.Mock(url='https://example.org/' + paper_id,
+                                                 status_code=status_code, text='{"id": 1}'))
+        with mock.patch('ai_collection.crawlers.response_cache.time.time', return_value=now or time.time()):
+            response = self.cache.get_response(SCOPUS_ENGINE, paper_id, 'metadata', fetch)
+        return response, fetch.called
+
+    def test_cached_responses(self):
+        now = time.time()
+        self.get_response('10.1000/XYZ', now=now)
+        # equivalent IDs share the entry
+        response, fetched = self.get_response('https://doi.org/10.1000/xyz', now=now + 50)
+        self.assertFalse(fetched)
+        self.assertEqual((response.status_code, response.json()), (200, {'id': 1}))
+        _, fetched = self.get_response('10.1000/xyz', now=now + 150)  # expired
+        self.assertTrue(fetched)
+        self.get_response('10.1000/error', status_code=500)
+        _, fetched = self.get_response('10.1000/error', status_code=500)
+        self.assertTrue(fetched)  # errors are not cached
+
+    def test_not_found_responses(self):
+        now = time.time()
+        self.get_response('10.1000/new', status_code=404, now=now)
+        response, fetched = self.get_response('10.1000/new', now=now + 5)
+        self.assertEqual((response.status_code, fetched), (404, False))
+        # the paper may be available later
+        response, fetched = self.get_response('10.1000/new', now=now + 50)
+        self.assertEqual((response.status_code, fetched), (200, True))
+
+    def test_clear_expired(self):
+        now = time.time()
+        self.get_response('10.1000/found', now=now - 50)
+        self.get_response('10.1000/not-found', status_code=404, now=now - 50)
+        self.assertEqual(self.cache.clear(expired_only=True), 1)
+        self.assertFalse(self.get_response('10.1000/found')[1])
+
+    def test_eviction(self):
+        sizes = list()
+        for i, paper_id in enumerate(('a', 'b', 'c')):
+            self.get_response(paper_id)
+            path = self.cache._path(self.cache.key(SCOPUS_ENGINE, paper_id, 'metadata'))
+            os.utime(path, (1000 + i, 1000 + i))
+            sizes.append(os.path.getsize(path))
+        self.cache.max_size = sizes[1] + sizes[2]
+        # least recently used first
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual([self.get_response(p)[1] for p in ('c', 'b', 'a')], [False, False, True])
+
+    def test_offline(self):
+        self.get_response('10.1000/xyz')
+        self.cache.offline = True
+        self.assertFalse(self.get_response('10.1000/xyz', now=time.time() + 1000)[1])
+        with self.assertRaises(ResponseCacheMiss):
+            self.get_response('10.1000/other')
+
+    def test_normalise_paper_id(self):
+        self.assertEqual(normalise_paper_id(SCOPUS_ENGINE, ' doi:10.1000/XYZ '), '10.1000/xyz')
+        self.assertEqual(normalise_paper_id(ARXIV_ENGINE, 'https://arxiv.org/abs/1706.03762'), '1706.03762')
+        self.assertEqual(normalise_paper_id(SEMANTIC_SCHOLAR_ENGINE, 'ABC'), 'ABC')
+
+
+class CrawlerPersistenceTests(TestCase):
+
+    def test_keywords(self):
+        existing = Keyword.objects.create(name='deep learning')
+        with self.assertNumQueries(3):
+            keywords = get_or_create_keywords(['Deep Learning', 'MRI/CT', ' segmentation ', 'mri ct', ''])
+        self.assertEqual([k.name for k in keywords], ['deep learning', 'mri ct', 'segmentation'])
+        self.assertEqual(keywords[0], existing)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_or_create_keywords(['segmentation', 'MRI/CT']), [keywords[2], keywords[1]])
+
+    def test_authors(self):
+        existing = Author.objects.create(name='Ada Lovelace')
+        authors = get_or_create_authors(['ada lovelace', 'Alan Turing', 'ALAN TURING'])
+        self.assertEqual(authors['ada lovelace'], existing)
+        self.assertEqual(authors['alan turing'].name, 'Alan Turing')
+        self.assertEqual(Author.objects.count(), 2)
+
+        paper = create_paper('Paper')
+        with self.assertNumQueries(2):
+            author_papers = add_paper_authors(paper, [authors['alan turing'], existing])
+        self.assertEqual([(a.author.name, a.author_order) for a in author_papers],
+                         [('Alan Turing', 1), ('Ada Lovelace', 2)])
+
+    def test_affiliations(self):
+        Affiliation.objects.create(name='FBK', city='Trento', country='Italy')
+        affiliations = get_or_create_affiliations({'FBK': ('Povo', 'IT'), 'MIT': ('Cambridge', 'USA'), '': ('', '')})
+        self.assertEqual(sorted(affiliations), ['FBK', 'MIT'])
+        # City and Country of existing affiliations are not changed
+        self.assertEqual(affiliations['FBK'].city, 'Trento')
+        self.assertEqual(affiliations['MIT'].country, 'USA')
+
+
+# ===============
+# Background Jobs
+# ===============
+
+class BackgroundJobsTests(TestCase):
+
+    def setUp(self):
+        self.calls = list()
+        tasks = mock.patch.dict(TASKS, {'record': lambda **kwargs: self.calls.append(kwargs),
+                                        'fail': self._fail})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    @staticmethod
+    def _fail(**kwargs):
+        raise RuntimeError('Failed')
+
+    def test_enqueue_pending_once(self):
+        job = enqueue('record', value=1)
+        self.assertEqual(enqueue('record', value=1), job)
+        self.assertNotEqual(enqueue('record', value=2), job)
+
+    def test_claim_and_run(self):
+        job = enqueue('record', value=1)
+        claimed = claim_job('worker-1')
+        self.assertEqual(claimed, job)
+        self.assertEqual((claimed.status, claimed.attempts, claimed.worker), (JOB_RUNNING, 1, 'worker-1'))
+        self.assertIsNone(claim_job('worker-2'))  # claimed once
+
+        run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(self.calls, [{'value': 1}])
+
+    def test_delayed_jobs(self):
+        enqueue('record', delay=60)
+        self.assertIsNone(claim_job('worker'))
+
+    def test_retry_with_backoff(self):
+        job = enqueue('fail', max_attempts=2)
+        with self.assertLogs('ai_collection.jobs', 'ERROR'):
+            run_job(claim_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_PENDING)
+        self.assertIn('RuntimeError', job.error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(claim_job('worker'))  # backing off
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs('ai_collection.jobs', 'ERROR'):
+            run_job(claim_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JOB_FAILED, 2))
+
+        self.assertEqual(retry_jobs(Job.objects.filter(pk=job.pk)), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (JOB_PENDING, 0, ''))
+
+
+def saving_crawler(reference_id, engine):
+    """Crawler saving the paper (with no authors) as it is"""
+    crawler = mock.Mock()
+    crawler.crawl_paper.side_effect = lambda paper_instance: paper_instance.save()
+    return crawler
+
+
+class PaperCrawlTests(TestCase):
+    """Papers added in the Admin are listed once their metadata are downloaded in background"""
+
+    def setUp(self):
+        self.paper = Paper.objects.create(reference_id='10.1/xyz', title='10.1/xyz', metadata_reference=SCOPUS_ENGINE,
+                                          crawl_status=CRAWL_PENDING, update_azure_keys=False)
+
+    def test_no_authors(self):
+        self.paper.crawl_status = CRAWL_DONE
+        self.paper.save()
+        self.assertEqual(self.paper.authors_short, '')
+        for url in (reverse('papers_all'), reverse('search') + '?q=xyz'):
+            self.assertContains(self.client.get(url), '10.1/xyz')
+
+    def test_placeholders_not_listed(self):
+        create_paper('Failed', crawl_status=CRAWL_FAILED)
+        listed = create_paper('Listed')
+        self.assertEqual(list(Paper.objects.for_listing()), [listed])
+        self.assertEqual(list(PAPERS_SEARCH.search('')), [listed])
+        self.assertFalse(PAPERS_SEARCH.matches('xyz').exists())
+        self.assertEqual(self.client.get(reverse('paper_get', args=[self.paper.reference_id])).status_code, 404)
+
+    @mock.patch('ai_collection.jobs.instantiate_crawler', FakeCrawler)
+    def test_crawl_failed(self):
+        self.paper.reference_id = 'missing'
+        self.paper.save()
+        with self.assertRaises(PaperIDNotFoundError):
+            crawl_paper(paper_id=self.paper.pk)
+        self.paper.refresh_from_db()
+        self.assertEqual(self.paper.crawl_status, CRAWL_FAILED)
+        self.assertTrue(self.paper.crawl_error.startswith('PaperIDNotFoundError'))
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.org', 'password'))
+        response = self.client.get(reverse('admin:ai_collection_paper_change', args=[self.paper.pk]))
+        self.assertContains(response, 'The download of the Paper metadata failed (PaperIDNotFoundError')
+
+    @mock.patch('ai_collection.jobs.instantiate_crawler', saving_crawler)
+    def test_crawled(self):
+        Paper.objects.filter(pk=self.paper.pk).update(crawl_status=CRAWL_FAILED, crawl_error='Timeout')
+        crawl_paper(paper_id=self.paper.pk)
+        self.paper.refresh_from_db()
+        self.assertEqual((self.paper.crawl_status, self.paper.crawl_error), (CRAWL_DONE, ''))
+
+    @mock.patch('ai_collection.jobs.instantiate_crawler', FakeCrawler)
+    def test_recrawl_failed(self):
+        listed = create_paper('missing')
+        with self.assertRaises(PaperIDNotFoundError):
+            crawl_paper(paper_id=listed.pk)
+        listed.refresh_from_db()
+        # papers downloaded already stay in the collection
+        self.assertEqual(listed.crawl_status, CRAWL_DONE)
+        self.assertNotEqual(listed.crawl_error, '')
+
+    @mock.patch('ai_collection.forms.instantiate_crawler', FakeCrawler)
+    def test_creation_form(self):
+        form = PaperCreationForm({'metadata_reference': ARXIV_ENGINE, 'reference_id': 'missing'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('reference_id', form.errors)
+        form = PaperCreationForm({'metadata_reference': ARXIV_ENGINE, 'reference_id': '1706.03762'})
+        self.assertTrue(form.is_valid())
+
+
+# ====================
+# Keyphrase Extraction
+# ====================
+
+def first_words(documents, url=None):
+    """Stand-in of the keyPhrases API: the first word of each document"""
+    return {d['id']: [d['text'].split()[0]] for d in documents}
+
+
+class AzureBatchTests(SimpleTestCase):
+
+    @mock.patch('ai_collection.azure_api._post_documents', side_effect=first_words)
+    def test_batches(self, post):
+        documents = {i: 'text {} of the abstract'.format(i) for i in range(5)}
+        documents.update({'blank': '  ', 'empty': None})
+        key_phrases = get_azurekeys_batch(documents, max_documents=2, workers=2, use_cache=False)
+        self.assertEqual(key_phrases, {str(i): ['text'] for i in range(5)})
+        self.assertEqual(sorted(len(c[0][0]) for c in post.call_args_list), [1, 2, 2])
+
+    @mock.patch('ai_collection.azure_api._post_documents', side_effect=first_words)
+    def test_repeated_texts(self, post):
+        key_phrases = get_azurekeys_batch({'a': 'same  text', 'b': 'same text\n', 'c': 'other'}, use_cache=False)
+        self.assertEqual(key_phrases, {'a': ['same'], 'b': ['same'], 'c': ['other']})
+        # each distinct text is sent once, in a single request
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(sorted(d['text'] for d in post.call_args[0][0]), ['other', 'same text'])
+
+    def test_failed_requests(self):
+        def failing(documents, url=None):
+            if any(d['text'] == 'fail' for d in documents):
+                raise requests.ConnectionError('Connection refused')
+            return first_words(documents)
+
+        with mock.patch('ai_collection.azure_api._post_documents', side_effect=failing), \
+                self.assertLogs('ai_collection.azure_api', 'ERROR'):
+            key_phrases = get_azurekeys_batch({'a': 'fail', 'b': 'works'}, max_documents=1, use_cache=False)
+        # documents of the failed requests are missing
+        self.assertEqual(key_phrases, {'b': ['works']})
+
+    def test_normalise_text(self):
+        self.assertEqual(normalise_text(' a\n\tb  c '), 'a b c')
+        self.assertEqual(len(normalise_text('x' * (AZURE_MAX_DOCUMENT_SIZE + 10))), AZURE_MAX_DOCUMENT_SIZE)
+
+
+class KeyphraseCacheTests(TestCase):
+    """Key phrases are stored by hash of the text (shared by all the workers)"""
+
+    @mock.patch('ai_collection.azure_api._post_documents', side_effect=first_words)
+    def test_cached_texts(self, post):
+        self.assertEqual(get_azurekeys_batch({'a': 'first text', 'b': 'second text'}),
+                         {'a': ['first'], 'b': ['second']})
+        self.assertEqual(CachedKeyphrases.objects.count(), 2)
+        # (normalised) texts stored already are not sent again
+        key_phrases = get_azurekeys_batch({'c': 'first\ttext', 'd': 'third text'})
+        self.assertEqual(key_phrases, {'c': ['first'], 'd': ['third']})
+        self.assertEqual([d['text'] for d in post.call_args[0][0]], ['third text'])
+        self.assertEqual(get_azurekeys('second   text'), ['second'])
+        self.assertEqual(post.call_count, 2)
+
+    @mock.patch('ai_collection.azure_api._post_documents', side_effect=first_words)
+    def test_expired(self, post):
+        get_azurekeys('some text')
+        with mock.patch('ai_collection.azure_api.KEYPHRASE_CACHE_TIMEOUT', 60):
+            CachedKeyphrases.objects.update(created_at=timezone.now() - timedelta(seconds=120))
+            get_azurekeys('some text')
+        self.assertEqual(post.call_count, 2)
+        # expired entries are replaced
+        self.assertGreater(CachedKeyphrases.objects.get().created_at, timezone.now() - timedelta(seconds=60))
+
+    @mock.patch('ai_collection.azure_api._post_documents', side_effect=first_words)
+    def test_no_cache(self, post):
+        get_azurekeys_batch({'a': 'text'}, use_cache=False)
+        self.assertFalse(CachedKeyphrases.objects.exists())
+
+
+class FirstWordsBackend(KeyphraseBackend):
+    name = 'first-words'
+
+    def extract(self, documents):
+        return {str(doc_id): text.split()[:2] for doc_id, text in documents.items()}
+
+
+class AzureKeysTests(TestCase):
+    """Key phrases are added to the Azure keys with set-based queries"""
+
+    def test_get_or_create(self):
+        existing = AzureKey.objects.create(name='Deep Learning')
+        keys = get_or_create_azurekeys(['deep learning', 'MRI', 'mri', 'CT/PET', 'x' * 60])
+        self.assertEqual(sorted(k.name for k in keys), ['ct pet', 'deep learning', 'mri'])
+        self.assertIn(existing, keys)
+        self.assertEqual(AzureKey.objects.count(), 3)
+
+    def test_constant_queries(self):
+        paper = create_paper('Paper')
+        paper.azure_keys.add(AzureKey.objects.create(name='segmentation'))
+        # existing keys, missing keys (insert and select), existing links, new links, usage counters
+        with self.assertNumQueries(6):
+            add_azurekeys(paper, ['segmentation', 'mri'] + ['key {}'.format(i) for i in range(20)])
+        self.assertEqual(paper.azure_keys.count(), 22)
+
+    def test_dataset_text(self):
+        reference = create_paper('Reference', abstract='Brain tumour segmentation')
+        dataset = create_dataset('brats', reference_paper=reference)
+        self.assertEqual(update_azurekeys(dataset, backend=FirstWordsBackend()), ['Brain', 'tumour'])
+        self.assertEqual(sorted(k.name for k in dataset.azure_keys.all()), ['brain', 'tumour'])
+        dataset.description = 'Chest x-rays'
+        update_azurekeys(dataset, backend=FirstWordsBackend())
+        self.assertEqual(dataset.azure_keys.count(), 4)
+
+
+class LocalKeyphraseBackendTests(SimpleTestCase):
+
+    def test_candidate_phrases(self):
+        self.assertEqual(candidate_phrases('Deep learning for the segmentation of brain tumours '
+                                           '(https://example.org), in 2019.'),
+                         ['deep learning', 'segmentation', 'brain tumours'])
+
+    def test_extract(self):
+        backend = LocalKeyphraseBackend(top_k=2)
+        corpus = ['Deep learning for chest radiographs.', 'Deep learning for retinal images.',
+                  'Deep learning for histology slides.']
+        backend.fit(corpus)
+        key_phrases = backend.extract({'1': 'Deep learning for brain tumour segmentation. '
+                                            'Brain tumour segmentation with deep learning.',
+                                       '2': '', '3': 'Retinal images'})
+        # phrases frequent in the corpus rank lower
+        self.assertEqual(key_phrases['1'], ['brain tumour segmentation', 'deep learning'])
+        self.assertEqual(key_phrases['3'], ['retinal images'])
+        self.assertNotIn('2', key_phrases)  # empty documents
+
+
+# ===========
+# Byte Ranges
+# ===========
+
+class ParseRangeTests(SimpleTestCase):
+    size = 1000
+
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', self.size), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', self.size), (500, 999))
+        self.assertEqual(parse_range('bytes=900-5000', self.size), (900, 999))
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_range('bytes=-100', self.size), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', self.size), (0, 999))
+        with self.assertRaises(UnsatisfiableRange):
+            parse_range('bytes=-0', self.size)
+
+    def test_whole_file(self):
+        for header in (None, '', 'bytes=0-1,5-6', 'bytes=5-2', 'bytes=-', 'items=0-1'):
+            self.assertIsNone(parse_range(header, self.size), header)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=1000-', 'bytes=1000-1200'):
+            with self.assertRaises(UnsatisfiableRange):
+                parse_range(header, self.size)
+
+
+class ServeFileTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.field_file = mock.Mock(path=os.path.join(directory, 'data.tar.gz'))
+        with open(self.field_file.path, 'wb') as f:
+            f.write(bytes(range(100)))
+
+    def get(self, **headers):
+        response = serve_file(RequestFactory().get('/download', **headers), self.field_file)
+        self.addCleanup(response.close)
+        return response
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=90-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 90-99/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(90, 100)))
+        self.assertEqual(self.get(HTTP_RANGE='bytes=100-').status_code, 416)
+
+    def test_conditional_requests(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the range is ignored if the file was modified
+        self.assertEqual(self.get(HTTP_RANGE='bytes=90-', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=90-', HTTP_IF_RANGE='"other"').status_code, 200)
+
+
+# ==================
+# Data Archive Files
+# ==================
+
+class DataArchiveStatsTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        self.dataset = create_dataset('brats')
+
+    def uploaded_file(self, name, size):
+        """URL of a file assembled in the chunks folder (as set by the upload widget)"""
+        os.makedirs(os.path.join(self.media_root, 'dataarchive_chunks'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'dataarchive_chunks', name), 'wb') as f:
+            f.write(b'x' * size)
+        return '/media/dataarchive_chunks/' + name
+
+    def test_stored_on_upload(self):
+        archive = DataArchive.objects.create(dataset=self.dataset, archive_type='MED',
+                                             archive_file=self.uploaded_file('1000_data.zip', 1000))
+        archive.refresh_from_db()
+        self.assertEqual(archive.archive_file.name, 'datasets/brats/1000_data.zip')
+        stat = os.stat(archive.archive_file.path)
+        self.assertEqual(archive.file_size, 1000)
+        self.assertAlmostEqual(archive.file_mtime.timestamp(), stat.st_mtime, places=3)
+        # unchanged when the archive is saved again
+        os.truncate(archive.archive_file.path, 10)
+        archive.save()
+        archive.refresh_from_db()
+        self.assertEqual(archive.file_size, 1000)
+
+    def test_listed_from_database(self):
+        archive = DataArchive.objects.create(dataset=self.dataset, archive_type='MED',
+                                             archive_file=self.uploaded_file('1000_data.zip', 2048))
+        os.remove(archive.archive_file.path)  # the storage is never read
+        response = self.client.get(self.dataset.get_absolute_url())
+        self.assertContains(response, '2.0 KB')
+
+    def test_backfill(self):
+        archive = DataArchive.objects.create(dataset=self.dataset, archive_type='MED',
+                                             archive_file=self.uploaded_file('1000_data.zip', 1000))
+        missing = DataArchive.objects.create(dataset=self.dataset, archive_type='MED',
+                                             archive_file=self.uploaded_file('2000_data.zip', 10))
+        DataArchive.objects.update(file_size=None, file_mtime=None)
+        os.remove(missing.archive_file.path)
+        output = io.StringIO()
+        call_command('backfill_archive_stats', stdout=output)
+        self.assertIn('Size recorded for 1 Data Archives (1 failed)', output.getvalue())
+        archive.refresh_from_db()
+        self.assertEqual(archive.file_size, 1000)
+        self.assertIsNotNone(archive.file_mtime)
+        call_command('backfill_archive_stats', stdout=output)
+        self.assertIn('Size recorded for 0 Data Archives (1 failed)', output.getvalue())
+
+
+# =================
+# Archive Manifests
+# =================
+
+class ArchiveManifestTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_zip(self):
+        with zipfile.ZipFile(self.path('data.zip'), 'w') as archive:
+            archive.writestr('subjects/', '')
+            for i in range(3):
+                archive.writestr('subjects/sub-{}_T1w.nii.gz'.format(i), b'x' * 100)
+            archive.writestr('participants.tsv', 'id\tage')
+            archive.comment = b'zip comment'
+        manifest = build_manifest(self.path('data.zip'))
+        self.assertEqual(manifest['archive_format'], FORMAT_ZIP)
+        self.assertEqual((manifest['n_files'], manifest['total_size']), (4, 306))
+        self.assertEqual(manifest['extensions'], {'nii.gz': 3, 'tsv': 1})
+        self.assertEqual(manifest['members'][:2], [('subjects/', 0), ('subjects/sub-0_T1w.nii.gz', 100)])
+        self.assertFalse(manifest['truncated'])
+
+    def test_compressed_tar(self):
+        with tarfile.open(self.path('data.tar.gz'), 'w:gz') as archive:
+            for name in ('scans/001.dcm', 'scans/002.dcm', 'README'):
+                info = tarfile.TarInfo(name)
+                info.size = 3
+                archive.addfile(info, io.BytesIO(b'abc'))
+        manifest = build_manifest(self.path('data.tar.gz'), max_members=2)
+        self.assertEqual(manifest['archive_format'], FORMAT_TAR)
+        # all the members are counted, the first max_members only are listed
+        self.assertEqual((manifest['n_files'], manifest['total_size']), (3, 9))
+        self.assertEqual(manifest['extensions'], {'dcm': 2, '': 1})
+        self.assertEqual(manifest['members'], [('scans/001.dcm', 3), ('scans/002.dcm', 3)])
+        self.assertTrue(manifest['truncated'])
+
+    def test_unsupported_archive(self):
+        with open(self.path('data.bin'), 'wb') as f:
+            f.write(b'PK\x05\x06 not really a zip' * 10)
+        with self.assertRaises(UnsupportedArchive):
+            build_manifest(self.path('data.bin'))
+
+    def test_file_extension(self):
+        self.assertEqual(file_extension('a/b/scan.NII.GZ'), 'nii.gz')
+        self.assertEqual(file_extension('notes.txt'), 'txt')
+        self.assertEqual(file_extension('archive.v2.tar'), 'tar')
+        self.assertEqual(file_extension('Makefile'), '')
+
+
+class DatasetArchivesPageTests(TestCase):
+
+    def setUp(self):
+        self.dataset = create_dataset('brats')
+
+    def add_archive(self, name):
+        archive = DataArchive.objects.create(dataset=self.dataset, archive_type='MED', file_size=100,
+                                             archive_file='datasets/brats/' + name)
+        ArchiveManifest.objects.create(archive=archive, archive_format=FORMAT_ZIP, n_files=1,
+                                       extensions=json.dumps({'nii': 1}),
+                                       members=json.dumps([(name + '.nii', 100)]))
+
+    def get_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.dataset.get_absolute_url())
+        return response, len(queries)
+
+    def test_queries(self):
+        self.add_archive('t1.zip')
+        response, n_queries = self.get_page()
+        self.assertContains(response, 't1.zip.nii')
+        self.assertContains(response, 'SHA256SUMS')
+        for name in ('t2.zip', 'flair.zip'):
+            self.add_archive(name)
+        response, more_queries = self.get_page()
+        self.assertContains(response, 'flair.zip.nii')
+        # archives, and their manifests are prefetched (and counted in Python)
+        self.assertEqual(more_queries, n_queries)
+
+    def test_no_archives(self):
+        response, _ = self.get_page()
+        self.assertNotContains(response, 'SHA256SUMS')
+
+
+# ============
+# Query Budget
+# ============
+
+@modify_settings(MIDDLEWARE={'prepend': 'ai_collection.query_budget.QueryBudgetMiddleware'})
+class QueryBudgetMiddlewareTests(TestCase):
+
+    def get_record(self, url, level='INFO'):
+        with self.assertLogs('ai_collection.query_budget', level) as logs:
+            self.client.get(url)
+        self.assertEqual(logs.records[-1].levelname, level)
+        return json.loads(logs.records[-1].getMessage())
+
+    def test_record(self):
+        dataset = create_dataset('brats')
+        record = self.get_record(dataset.get_absolute_url())
+        self.assertEqual((record['view'], record['method'], record['status']), ('dataset_get', 'GET', 200))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['render_ms'], 0)
+        self.assertLessEqual(record['render_queries'], record['queries'])
+        self.assertNotIn('brats', json.dumps(record))  # no query parameter is logged
+
+    def test_over_budget(self):
+        with mock.patch('ai_collection.query_budget.QUERY_BUDGET_MAX_QUERIES', 0):
+            record = self.get_record(create_dataset('brats').get_absolute_url(), level='WARNING')
+        self.assertGreater(record['queries'], 0)
+
+    def test_not_sampled(self):
+        with mock.patch('ai_collection.query_budget.QUERY_BUDGET_SAMPLE_RATE', 0), \
+                mock.patch('ai_collection.query_budget.logger.log') as log:
+            self.client.get(create_dataset('brats').get_absolute_url())
+        log.assert_not_called()
+
+
+class QueryStatsTests(SimpleTestCase):
+
+    def test_signature(self):
+        signature, sql = query_signature('SELECT * FROM paper WHERE id IN (%s, %s, %s) LIMIT 21')
+        self.assertEqual(sql, 'SELECT * FROM paper WHERE id IN (...) LIMIT N')
+        self.assertEqual(query_signature('SELECT * FROM paper WHERE id IN (%s, %s) LIMIT 10')[0], signature)
+
+    def test_duplicates(self):
+        stats = RequestStats()
+        execute = mock.Mock(return_value=None)
+        for pk in range(5):
+            stats(execute, 'SELECT * FROM author WHERE paper_id = %s', (pk,), False, {})
+        stats(execute, 'SELECT * FROM paper', (), False, {})
+        self.assertEqual(stats.queries, 6)
+        duplicates = stats.duplicates()
+        self.assertEqual([(d['count'], d['sql']) for d in duplicates],
+                         [(5, 'SELECT * FROM author WHERE paper_id = %s')])
+        self.assertEqual(stats.duplicates(threshold=10), [])
+
+    def test_read_records(self):
+        lines = ['2026-10-18 12:00:00 INFO {"view": "papers_all", "queries": 3}\n',
+                 'not a record\n', '{"broken": \n', '{"queries": 3}\n', '{"view": "datasets_all"}']
+        self.assertEqual([r['view'] for r in read_records(lines)], ['papers_all', 'datasets_all'])
+
+
+class QueryBudgetReportTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_log(self, name, records):
+        path = os.path.join(self.directory, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt') as f:
+            for record in records:
+                f.write(json.dumps(dict({'render_ms': 1.0, 'duration_ms': 10.0, 'duplicates': []},
+                                        **record)) + '\n')
+        return path
+
+    def report(self, *args):
+        output = io.StringIO()
+        call_command('query_budget_report', *args, stdout=output)
+        return output.getvalue()
+
+    def test_ranking(self):
+        duplicate = {'signature': 'abc', 'count': 20, 'sql': 'SELECT * FROM author WHERE id = %s'}
+        log_file = self.write_log('query_budget.log', [
+            {'view': 'papers_all', 'queries': 30, 'db_ms': 20.0, 'sample_rate': 1.0, 'duplicates': [duplicate]},
+            {'view': 'dataset_get', 'queries': 5, 'db_ms': 5.0, 'sample_rate': 1.0}])
+        # sampled requests count for 1 / sample_rate requests
+        rotated = self.write_log('query_budget.log.1.gz', [
+            {'view': 'dataset_get', 'queries': 5, 'db_ms': 5.0, 'sample_rate': 0.1}])
+        lines = self.report(log_file, rotated).splitlines()
+        self.assertTrue(lines[1].startswith('dataset_get'))
+        self.assertTrue(lines[2].startswith('papers_all'))
+        self.assertIn('papers_all [abc] in 1 requests (x20)', lines[-1])
+        lines = self.report(log_file, rotated, '--sort', 'queries', '--limit', '1').splitlines()
+        self.assertTrue(lines[1].startswith('dataset_get'))  # 5 + 50
+        self.assertEqual(lines[2], '')
+
+    def test_no_records(self):
+        self.assertIn('No request recorded', self.report(self.write_log('empty.log', [])))
+        with self.assertRaises(CommandError):
+            self.report(os.path.join(self.directory, 'missing.log'))
+        with self.assertRaises(CommandError):
+            self.report()
@@ -5,25 +5,39 @@ from .views import (papers_collection,
                     tags_collection,
                     pathologies_collection,
                     methods_collection,
-                    paper_info, dataset_info,
+                    paper_info, dataset_info, dataset_checksums,
                     resources_per_tag,
                     resources_per_pathology,
                     resources_per_pathology_category,
                     study_per_method, study_info,
                     index, studies_collection,
                     topics_collection,
-                    paper_per_topic
+                    paper_per_topic, search,
+                    archive_download, paper_file_download
                     )
 
 urlpatterns = [
     path('', index, name='index'),
 
+    # Search (all resources)
+    path('search/', search, name='search'),
+
     # Datasets
     path('datasets/<str:short_name>/',
          dataset_info, name='dataset_get'),
+    path('datasets/<str:short_name>/SHA256SUMS',
+         dataset_checksums, {'algorithm': 'sha256'}, name='dataset_sha256sums'),
+    path('datasets/<str:short_name>/MD5SUMS',
+         dataset_checksums, {'algorithm': 'md5'}, name='dataset_md5sums'),
     path('datasets/', dataset_collection,
          name='datasets_all'),
 
+    # Downloads (Data Archives, and Paper files)
+    path('downloads/archives/<int:archive_id>/',
+         archive_download, name='archive_download'),
+    path('downloads/papers/<int:paper_id>/',
+         paper_file_download, name='paper_file_download'),
+
     # Papers
     path('papers/<path:reference_id>/',
          paper_info, name='paper_get'),
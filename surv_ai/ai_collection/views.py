@@ -1,107 +1,75 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count
-from itertools import chain
-from .models import Paper, Dataset, ExperimentalStudy
-from .models import Keyword, Method, Pathology, Topic
+from django.http import JsonResponse, HttpResponse
+from .models import Paper, Dataset, DataArchive, ExperimentalStudy
+from .models import Keyword, Method, Pathology, PathologyCategory, Topic
+from .pagination import KeysetPaginator
+from .dashboard import get_dashboard
+from .search import PAPERS_SEARCH, DATASETS_SEARCH, STUDIES_SEARCH
+from .search import search_collection, paginate
+from .downloads import serve_file
 
 
 def index(request):
-    datasets = Dataset.objects.all()
-    papers = Paper.objects.all()
-    methods = Method.objects.all()
-    pathologies = Pathology.objects.all()
-    studies = ExperimentalStudy.objects.all()
-    tags = Keyword.objects.all()
-    topics = Topic.objects.all()
-
-    print(topics.count())
-    context = {'papers_count': papers.count(),
-               'datasets_count': datasets.count(),
-               'studies_count': studies.count(),
-               'algorithms_count': methods.count(),
-               'pathologies_count': pathologies.count(),
-               'tags_count': tags.count(),
-               'topics_count': topics.count()}
-
-    # --- Top
-    # Latest (top 5) Papers
-    top_papers = papers.order_by('-upload_date')[:5]
-    # latest (top 5) Datasets
-    top_datasets = datasets.order_by('-upload_date')[:5]
-    # latest (top 5) Experimental Studies
-    top_studies = studies.order_by('-upload_date')[:5]
-    # latest (top 5) Topics
-    top_topics = topics.order_by('-upload_date')[:5]
-
-    context.update({'latest_papers': top_papers,
-                    'latest_datasets': top_datasets,
-                    'latest_studies': top_studies,
-                    'latest_topics': top_topics})
-
-    #---Topics
-    topic_stats = Topic.objects.all().annotate(np=Count('papers'))
-    top_topics2 = sorted(topic_stats, key=lambda topic: topic.np, reverse=True)[:10]
-    # --- Pathologies
-    p_stats = Pathology.objects.all().annotate(np=Count('papers'),
-                                               nd=Count('datasets'))
-    top_paths = sorted(p_stats, key=lambda p: p.np + p.nd, reverse=True)[:10]
-
-    # --- Algorithms
-    a_stats = Method.objects.all().annotate(np=Count('studies__paper'),
-                                            nd=Count('studies__dataset'))
-    top_algos = sorted(a_stats, key=lambda a: a.np + a.nd, reverse=True)[:10]
-
-    # --- Tags
-    t_stats = Keyword.objects.all().annotate(np=Count('papers'),
-                                             nd=Count('datasets'))
-    # Most Used Tags (Top 3)
-    top_kw_abs = sorted(t_stats, key=lambda t: t.np + t.nd, reverse=True)[:3]
-    # Most Used Tags in Papers (Top 3)
-    top_kw_papers = sorted(t_stats, key=lambda t: t.np, reverse=True)[:3]
-    # Most Used Tags in Datasets (Top 3)
-    top_kw_dsets = sorted(t_stats, key=lambda t: t.nd, reverse=True)[:3]
-
-    context.update({'top_pathologies': top_paths,
-                    'top_methods': top_algos,
-                    'top_topics': top_topics2,
-                    'top_tags_all': top_kw_abs,
-                    'top_tags_papers': top_kw_papers,
-                    'top_tags_datasets': top_kw_dsets})
-
+    # Counters and top-N lists are read from the materialised snapshot
+    context = get_dashboard()
     return render(request, 'ai_collection/index.html', context)
 
 
-def papers_collection(request):
-    query = request.GET.get('q','')
-    if query == '':
-        result = Paper.objects.all()
+def _search_collection_view(request, engine, collection_name):
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Results sorted by (computed) relevance: numbered pages
+        page = paginate(engine.search(query), request.GET.get('page'))
+        resources_count = page.paginator.count
     else:
-        q1 = Paper.objects.filter(title__contains=query)
-        q2 = Paper.objects.filter(authors__name__contains=query)
-        q3 = Paper.objects.filter(azure_keys__name__contains=query)
-        q4 = Paper.objects.filter(terms__name__contains=query)
-        q5 = Paper.objects.filter(topic__name__contains=query)
-        q6 = Paper.objects.filter(pathology__name__contains=query)
-        result = set(list(chain(q1,q2,q3,q4,q5,q6)))
-
-    context = {'resources': result,
-               'collection_name': "Papers", }
+        resources = engine.model.objects.all()
+        page = KeysetPaginator(resources.for_listing()).get_page(request)
+        resources_count = resources.count()
+
+    context = {'resources': page,
+               'resources_count': resources_count,
+               'page_obj': page,
+               'query': query,
+               'collection_name': collection_name, }
     return render(request, 'ai_collection/collections.html', context)
 
 
+def papers_collection(request):
+    return _search_collection_view(request, PAPERS_SEARCH, "Papers")
+
+
 def dataset_collection(request):
+    return _search_collection_view(request, DATASETS_SEARCH, "Datasets")
+
+
+def search(request):
+    """Search across Papers, Datasets, and Experimental Studies.
+
+    Results are returned as JSON (e.g. for search-as-you-type)
+    when the `format=json` parameter is provided.
+    """
     query = request.GET.get('q', '')
-    if query == '':
-        result = Dataset.objects.all()
-    else:
-        q1 = Dataset.objects.filter(full_name__contains=query)
-        q2 = Dataset.objects.filter(azure_keys__name__contains=query)
-        q3 = Dataset.objects.filter(tags__name__contains=query)
-        q4 = Dataset.objects.filter(short_name__contains=query)
-        result = set(list(chain(q1,q2, q3,q4)))
-
-    context = {'resources': result,
-               'collection_name': "Datasets", }
+    results, facets = search_collection(query)
+    page = paginate(results, request.GET.get('page'))
+
+    if request.GET.get('format') == 'json':
+        hits = [{'type': r.resource_type,
+                 'title': str(r),
+                 'url': r.get_absolute_url(),
+                 'rank': r.rank} for r in page]
+        return JsonResponse({'query': query,
+                             'count': results.total,
+                             'page': page.number,
+                             'num_pages': page.paginator.num_pages,
+                             'results': hits,
+                             'facets': facets})
+
+    context = {'resources': page,
+               'resources_count': results.total,
+               'page_obj': page,
+               'query': query,
+               'facets': facets,
+               'collection_name': "Search", }
     return render(request, 'ai_collection/collections.html', context)
 
 
@@ -115,7 +83,7 @@ def dataset_info(request, short_name):
 
 
 def paper_info(request, reference_id):
-    paper = get_object_or_404(Paper, reference_id=reference_id)
+    paper = get_object_or_404(Paper.objects.listed(), reference_id=reference_id)
     context = {'paper': paper,
                'collection_name': "Papers",
                'reverse_view_name': 'papers_all',
@@ -127,9 +95,12 @@ def resources_per_tag(request, name):
     tag = get_object_or_404(Keyword, name=name)
     papers_collection = tag.papers.all()
     dataset_collection = tag.datasets.all()
-    paper_count = papers_collection.count()
-    dataset_count = dataset_collection.count()
-    context = {'resources': list(chain(dataset_collection, papers_collection)),
+    paper_count = tag.paper_count
+    dataset_count = tag.dataset_count
+    page = KeysetPaginator([dataset_collection.for_listing(),
+                            papers_collection.for_listing()]).get_page(request)
+    context = {'resources': page,
+               'page_obj': page,
                'tag_name': tag.name,
                'collection_name': "Tags",
                'reverse_view_name': 'tags_all',
@@ -141,15 +112,16 @@ def resources_per_tag(request, name):
 
 
 def resources_per_pathology_category(request, name):
-    papers_collection = Paper.objects.filter(pathology__category__name=name)
-    dataset_collection = Dataset.objects.filter(pathology__category__name=name)
-    tag_name = ''
+    category = get_object_or_404(PathologyCategory, name=name)
+    papers_collection = Paper.objects.filter(pathology__category=category)
+    dataset_collection = Dataset.objects.filter(pathology__category=category)
     paper_count = papers_collection.count()
     dataset_count = dataset_collection.count()
-    collection = list(chain(dataset_collection, papers_collection))
-    tag_name = str(collection[0].pathology.category)
-    context = {'resources': collection,
-               'tag_name': tag_name,
+    page = KeysetPaginator([dataset_collection.for_listing(),
+                            papers_collection.for_listing()]).get_page(request)
+    context = {'resources': page,
+               'page_obj': page,
+               'tag_name': str(category),
                'collection_name': "Pathologies",
                'reverse_view_name': 'pathologies_all',
                'paper_count': paper_count,
@@ -164,16 +136,18 @@ def resources_per_pathology(request, name, category=False):
         papers_collection = pathology.papers.all()
         dataset_collection = pathology.datasets.all()
         tag_name = pathology.name
+        paper_count = pathology.paper_count
+        dataset_count = pathology.dataset_count
     else:
-        papers_collection = Paper.objects.filter(pathology__category=name)
-        dataset_collection = Dataset.objects.filter(pathology__category=name)
-        tag_name = ''
-    paper_count = papers_collection.count()
-    dataset_count = dataset_collection.count()
-    collection = list(chain(dataset_collection, papers_collection))
-    if not tag_name:
-        tag_name = str(collection[0].pathology.category)
-    context = {'resources': collection,
+        papers_collection = Paper.objects.filter(pathology__category__name=name)
+        dataset_collection = Dataset.objects.filter(pathology__category__name=name)
+        tag_name = name
+        paper_count = papers_collection.count()
+        dataset_count = dataset_collection.count()
+    page = KeysetPaginator([dataset_collection.for_listing(),
+                            papers_collection.for_listing()]).get_page(request)
+    context = {'resources': page,
+               'page_obj': page,
                'tag_name': tag_name,
                'collection_name': "Pathologies",
                'reverse_view_name': 'pathologies_all',
@@ -186,11 +160,12 @@ def resources_per_pathology(request, name, category=False):
 
 def study_per_method(request, name):
     method = get_object_or_404(Method, name=name)
-    collection = method.studies.order_by('dataset__short_name')
+    page = KeysetPaginator(method.studies.for_listing()).get_page(request)
     tag_name = method.name
-    paper_count = method.studies.distinct('paper__title').count()
-    dataset_count = method.studies.distinct('dataset__short_name').count()
-    context = {'resources': collection,
+    paper_count = method.paper_count
+    dataset_count = method.dataset_count
+    context = {'resources': page,
+               'page_obj': page,
                'tag_name': tag_name,
                'collection_name': "Methods",
                'reverse_view_name': 'methods_all',
@@ -218,24 +193,13 @@ def study_info(request, study_id):
 
 
 def studies_collection(request):
-    query = request.GET.get('q', '')
-    if query == '':
-        result = ExperimentalStudy.objects.all()
-    else:
-        q1 = ExperimentalStudy.objects.filter(paper__title__contains=query)
-        q2 = ExperimentalStudy.objects.filter(dataset__full_name__contains=query)
-        q3 = ExperimentalStudy.objects.filter(method__name__contains=query)
-        q4 = ExperimentalStudy.objects.filter(name__contains=query)
-        q5 = ExperimentalStudy.objects.filter(pathology__contains=query)
-        result = set(list(chain(q1, q2, q3, q4, q5)))
-
-    context = {'resources': result,
-               'collection_name': "ExperimentalStudy", }
-    return render(request, 'ai_collection/collections.html', context)
+    return _search_collection_view(request, STUDIES_SEARCH, "ExperimentalStudy")
 
 
 def dataset_info(request, short_name):
-    dataset = get_object_or_404(Dataset, short_name__iexact=short_name)
+    # archives (with their manifests) are listed with a query each, not one per archive
+    datasets = Dataset.objects.prefetch_related('data_archives__manifest')
+    dataset = get_object_or_404(datasets, short_name__iexact=short_name)
     context = {'dataset': dataset,
                'collection_name': "Datasets",
                'reverse_view_name': 'datasets_all',
@@ -243,6 +207,25 @@ def dataset_info(request, short_name):
     return render(request, 'ai_collection/dataset.html', context)
 
 
+def dataset_checksums(request, short_name, algorithm):
+    """Checksums of the data archives of the dataset, as listed by `sha256sum` (or `md5sum`),
+    so that downloaded archives can be checked with `sha256sum -c SHA256SUMS`"""
+    dataset = get_object_or_404(Dataset, short_name__iexact=short_name)
+    archives = dataset.data_archives.exclude(**{algorithm: ''}).order_by('pk')
+    lines = ['{}  {}\n'.format(getattr(archive, algorithm), archive.filename) for archive in archives]
+    return HttpResponse(''.join(lines), content_type='text/plain; charset=utf-8')
+
+
+def archive_download(request, archive_id):
+    archive = get_object_or_404(DataArchive, pk=archive_id)
+    return serve_file(request, archive.archive_file, archive.filename)
+
+
+def paper_file_download(request, paper_id):
+    paper = get_object_or_404(Paper, pk=paper_id)
+    return serve_file(request, paper.paper_file)
+
+
 # Resources Collection (Keyword, Pathologies, Methods)
 
 def tags_collection(request):
@@ -276,9 +259,10 @@ def paper_per_topic(request,name):
     papers_collection = topic.papers.all()
     tag_name = topic.name
 
-    paper_count = papers_collection.count()
-    collection = list(papers_collection)
-    context = {'resources': collection,
+    paper_count = topic.paper_count
+    page = KeysetPaginator(papers_collection.for_listing()).get_page(request)
+    context = {'resources': page,
+               'page_obj': page,
                'tag_name': tag_name,
                'collection_name': "Topics",
                'reverse_view_name': 'topics_all',
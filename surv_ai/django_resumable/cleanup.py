@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Garbage collection of abandoned uploads: chunks of the uploads which have not
+received any chunk for a while (i.e. never completed) are deleted.
+
+Each chunk renews the lease of its upload (the modification time of the files
+in the directory of the upload), and uploads are deleted while holding their
+lock, so live uploads are never collected.
+"""
+import fcntl
+import os
+import re
+import shutil
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+from .files import ResumableFile, get_storage
+
+# Uploads not updated for this long (in seconds) are considered abandoned
+RESUMABLE_GC_MAX_AGE = getattr(settings, 'RESUMABLE_GC_MAX_AGE', 2 * 24 * 60 * 60)
+# Number of uploads deleted per batch
+RESUMABLE_GC_BATCH_SIZE = getattr(settings, 'RESUMABLE_GC_BATCH_SIZE', 100)
+
+UPLOAD_DIR_RE = re.compile(r'^[0-9a-f]{32}$')
+# Chunks stored in the chunks folder itself (before the directories of the uploads)
+LEGACY_CHUNK_RE = re.compile(r'_part_\d+$')
+
+
+def get_chunks_storages():
+    """Storages of the chunks of all the ResumableFileFields"""
+    from .fields import ResumableFileField
+    chunks_upload_to = {field.chunks_upload_to for model in apps.get_models()
+                        for field in model._meta.get_fields() if isinstance(field, ResumableFileField)}
+    return [get_storage(upload_to) for upload_to in sorted(chunks_upload_to)]
+
+
+def _disk_usage(stat):
+    # allocated size (preallocated files of direct writes may be sparse)
+    return stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+
+
+def _upload_stats(path):
+    """Last modification time, and disk usage of the upload directory"""
+    stat = os.stat(path)
+    last_modified, size = stat.st_mtime, 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            stat = entry.stat(follow_symlinks=False)
+            last_modified = max(last_modified, stat.st_mtime)
+            size += _disk_usage(stat)
+    return last_modified, size
+
+
+def stale_uploads(storage, max_age=RESUMABLE_GC_MAX_AGE):
+    """Iterates over the (path, size) of the uploads (and legacy chunks) not updated for max_age seconds"""
+    expired = time.time() - max_age
+    with os.scandir(storage.location) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and UPLOAD_DIR_RE.match(entry.name):
+                last_modified, size = _upload_stats(entry.path)
+                if last_modified < expired:
+                    yield entry.path, size
+            elif entry.is_file(follow_symlinks=False) and LEGACY_CHUNK_RE.search(entry.name):
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime < expired:
+                    yield entry.path, _disk_usage(stat)
+
+
+def _delete_upload(path, max_age):
+    """Deletes the upload (or legacy chunk), unless it is in use, or its lease has been renewed.
+    Returns whether the upload has been deleted."""
+    if not os.path.isdir(path):
+        if os.stat(path).st_mtime >= time.time() - max_age:
+            return False
+        os.remove(path)
+        return True
+    with open(os.path.join(path, ResumableFile.LOCK_NAME), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # a chunk is being processed
+        try:
+            if _upload_stats(path)[0] >= time.time() - max_age:
+                return False
+            shutil.rmtree(path)
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def collect_stale_uploads(storage, max_age=RESUMABLE_GC_MAX_AGE, batch_size=RESUMABLE_GC_BATCH_SIZE,
+                          dry_run=False):
+    """Deletes the abandoned uploads of the storage, batch_size at a time.
+    Iterates over the (number of uploads, reclaimed bytes) of each batch."""
+    batch = list()
+    for upload in stale_uploads(storage, max_age=max_age):
+        batch.append(upload)
+        if len(batch) >= batch_size:
+            yield _collect(batch, max_age, dry_run)
+            batch = list()
+    if batch:
+        yield _collect(batch, max_age, dry_run)
+
+
+def _collect(batch, max_age, dry_run):
+    deleted, reclaimed = 0, 0
+    for path, size in batch:
+        try:
+            if dry_run or _delete_upload(path, max_age):
+                deleted += 1
+                reclaimed += size
+        except FileNotFoundError:
+            pass  # completed (or collected) in the meantime
+    return deleted, reclaimed
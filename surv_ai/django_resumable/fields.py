@@ -2,16 +2,25 @@ from django.db.models import Field, FileField
 from django.core.files.move import file_move_safe
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 
+import os
+from datetime import datetime
 from os import path, makedirs
+from .files import pop_checksums
 from .forms import FormResumableFileField
 from .widgets import ResumableWidget
 
 
 class ResumableFileField(FileField):
     def __init__(self, verbose_name=None, name=None, upload_to='',
-                 chunks_upload_to='', **kwargs):
+                 chunks_upload_to='', checksum_fields=None, size_field=None, mtime_field=None, **kwargs):
         self.chunks_upload_to = chunks_upload_to
+        # checksum algorithm -> name of the model field storing the checksum of the uploaded file
+        # (computed while uploading, cleared when not available)
+        self.checksum_fields = checksum_fields or dict()
+        # names of the model fields storing the size, and modification time of the uploaded file
+        self.size_field, self.mtime_field = size_field, mtime_field
         super(ResumableFileField, self).__init__(verbose_name, name, upload_to, **kwargs)
 
     def pre_save(self, model_instance, add):
@@ -38,11 +47,32 @@ class ResumableFileField(FileField):
             if not file.storage.exists(basefolder):
                 makedirs(basefolder)
             file_move_safe(fpath, new_fpath)
+            self._update_checksum_fields(model_instance, fpath)
+            self._update_stat_fields(model_instance, new_fpath)
             setattr(model_instance, self.name, name)
             file._committed = True
             file.name = name
         return file
 
+    def _update_checksum_fields(self, model_instance, fpath):
+        """Copy the checksums computed while uploading the file into the checksum fields
+        (the uploaded file is never read while saving)"""
+        checksums = pop_checksums(fpath)
+        for algorithm, field_name in self.checksum_fields.items():
+            setattr(model_instance, field_name, checksums.get(algorithm, ''))
+
+    def _update_stat_fields(self, model_instance, fpath):
+        """Record the size, and modification time of the uploaded file (if any field is set),
+        so that they are never read from the storage when displayed"""
+        if not self.size_field and not self.mtime_field:
+            return
+        stat = os.stat(fpath)
+        if self.size_field:
+            setattr(model_instance, self.size_field, stat.st_size)
+        if self.mtime_field:
+            mtime = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            setattr(model_instance, self.mtime_field, mtime if settings.USE_TZ else timezone.make_naive(mtime))
+
     def _safe_media_root(self):
         if not settings.MEDIA_ROOT.endswith(path.sep):
             media_root = settings.MEDIA_ROOT + path.sep
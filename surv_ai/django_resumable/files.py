@@ -1,57 +1,173 @@
 # -*- coding: utf-8 -*-
+import errno
+import fcntl
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
 from urllib.parse import urljoin
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.storage import get_storage_class
 
+from .hashing import ResumableHash, resumable_hash_available
+
+# Size of the blocks read (and written) when chunks are not copied in kernel space
+COPY_BUFFER_SIZE = 1024 * 1024
+# Max number of bytes copied in kernel space by a single call
+MAX_KERNEL_COPY = 1024 * 1024 * 1024
+# Errors of copy_file_range/sendfile meaning that the copy is not supported
+UNSUPPORTED_COPY_ERRORS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP}
+# Suffix of the files of checksums, saved next to the complete files
+CHECKSUMS_SUFFIX = '.checksums.json'
+
 
 class ResumableFile:
+    """File uploaded in chunks (by `resumable.js`).
 
-    def __init__(self, storage, kwargs):
+    The chunks of each upload are stored in a directory of their own, along
+    with a manifest of the received chunks (number -> size) and of their total
+    size, updated at each chunk: checking a chunk (or the whole upload) never
+    lists, nor stats, the stored chunks.
+
+    Checksums (see `RESUMABLE_CHECKSUMS`) are computed as the chunks are
+    received: chunks are hashed in order, and the state of the hashes is
+    kept in the manifest, so the complete file is never read again.
+    """
+    MANIFEST_NAME = 'manifest.json'
+    LOCK_NAME = '.lock'
+
+    def __init__(self, storage, kwargs, owner=None):
         self.storage = storage
         self.kwargs = kwargs
+        self.owner = owner
         self.chunk_suffix = "_part_"
 
+    @property
+    def upload_dir(self):
+        """Directory of the chunks of the upload (unique per owner, and file)"""
+        key = '{}\n{}\n{}\n{}'.format(self.owner, self.kwargs.get('resumableIdentifier', ''),
+                                       self.kwargs.get('resumableTotalSize'), self.filename)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
     @property
     def chunk_exists(self):
         """Checks if the requested chunk exists.
         """
-        return self.storage.exists(self.current_chunk_name) and \
-               self.storage.size(self.current_chunk_name) == int(self.kwargs.get('resumableCurrentChunkSize'))
+        if self._assembled(self.manifest) is not None:
+            return True
+        size = self.manifest['chunks'].get(self.current_chunk_number)
+        return size is not None and size == int(self.kwargs.get('resumableCurrentChunkSize'))
 
     @property
     def chunk_names(self):
         """Iterates over all stored chunks.
         """
-        chunks = []
-        files = sorted(self.storage.listdir('')[1])
-        for f in files:
-            if f.startswith('{}{}'.format(
-                    self.filename, self.chunk_suffix)):
-                chunks.append(f)
-        return chunks
+        return [self._chunk_name(number) for number in sorted(self.manifest['chunks'], key=int)]
+
+    @property
+    def current_chunk_number(self):
+        return str(int(self.kwargs.get('resumableChunkNumber')))
 
     @property
     def current_chunk_name(self):
-        return "%s%s%s" % (
-            self.filename,
-            self.chunk_suffix,
-            self.kwargs.get('resumableChunkNumber').zfill(4)
-        )
+        return self._chunk_name(self.current_chunk_number)
 
-    def chunks(self):
-        """Iterates over all stored chunks.
+    def _chunk_name(self, number):
+        return os.path.join(self.upload_dir, "%s%s" % (self.chunk_suffix.lstrip('_'), number.zfill(4)))
+
+    def chunks(self, chunk_size=COPY_BUFFER_SIZE):
+        """Iterates over the content of all stored chunks (in blocks of at most chunk_size bytes).
+        """
+        for f in self.chunk_names:
+            with self.storage.open(f, 'rb') as chunk:
+                for block in iter(lambda: chunk.read(chunk_size), b''):
+                    yield block
+
+    def assemble(self):
+        """Writes the complete file in the storage, and returns its name.
+
+        Chunks are copied in kernel space (`copy_file_range`, or `sendfile`)
+        when available, so the content of the file is never held in memory.
         """
-        files = sorted(self.storage.listdir('')[1])
-        for f in files:
-            if f.startswith('{}{}'.format(
-                    self.filename, self.chunk_suffix)):
-                yield self.storage.open(f, 'rb').read()
+        if not self.is_complete:
+            raise Exception('Chunk(s) still missing')
+        try:
+            self.storage.path(self.filename)
+        except NotImplementedError:
+            # not a filesystem storage: the chunks are streamed (in blocks)
+            return self.storage.save(self.filename, self)
+
+        name, fd = self._create_file(self.filename)
+        try:
+            for number in sorted(self.manifest['chunks'], key=int):
+                with open(self.storage.path(self._chunk_name(number)), 'rb') as chunk:
+                    copy_fd(chunk.fileno(), fd, self.manifest['chunks'][number])
+        except Exception:
+            os.close(fd)
+            self.storage.delete(name)
+            raise
+        os.close(fd)
+        self._finalise(name)
+        return name
+
+    def complete(self):
+        """Assembles the complete file (once all chunks are stored), and returns its name,
+        or None if chunk(s) are still missing.
+
+        Completion is claimed under the lock of the upload: when the last chunks
+        arrive concurrently, a single request assembles the file (and deletes the
+        chunks), and the others get the name of the file it assembled.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            name = self._assembled(manifest)
+            if name is not None:
+                return name  # completed by a concurrent request
+            self._manifest = manifest
+            if not self.is_complete:
+                return None
+            name = self.assemble()
+            self._save_checksums(name, manifest)
+            self._delete_parts()
+            # the (empty) manifest keeps the name of the file for the concurrent requests
+            self._manifest = {'filename': self.filename, 'chunks': {}, 'size': 0, 'assembled': name}
+            self._write_manifest(self._manifest)
+        return name
+
+    def _assembled(self, manifest):
+        """Name of the file assembled from the chunks, unless it has been moved since (e.g. saved in a model)"""
+        name = manifest.get('assembled')
+        return name if name is not None and self.storage.exists(name) else None
+
+    def _delete_parts(self):
+        """Deletes the stored chunks (the manifest, and the lock of the upload are kept)"""
+        for name in self.chunk_names:
+            self.storage.delete(name)
+
+    def _finalise(self, name):
+        """Sets the permissions of the complete file"""
+        permissions = getattr(self.storage, 'file_permissions_mode', None)
+        if permissions is not None:
+            os.chmod(self.storage.path(name), permissions)
+
+    def _create_file(self, name):
+        """Creates an empty file, with an available name (as the storage does when saving files)"""
+        while True:
+            name = self.storage.get_available_name(name)
+            path = self.storage.path(name)
+            ensure_dir(path)
+            try:
+                return name, os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            except FileExistsError:
+                continue  # created concurrently: look for another name
 
     def delete_chunks(self):
-        [self.storage.delete(chunk) for chunk in self.chunk_names]
+        shutil.rmtree(self.storage.path(self.upload_dir), ignore_errors=True)
 
     @property
     def file(self):
@@ -76,23 +192,423 @@ class ResumableFile:
     def is_complete(self):
         """Checks if all chunks are already stored.
         """
-        print("resumableTotalSize", int(self.kwargs.get('resumableTotalSize')), ": size", self.size)
         return int(self.kwargs.get('resumableTotalSize')) == self.size
 
+    @property
+    def total_chunks(self):
+        return int(self.kwargs.get('resumableTotalChunks'))
+
     def process_chunk(self, file):
-        if self.storage.exists(self.current_chunk_name):
-            self.storage.delete(self.current_chunk_name)
-        self.storage.save(self.current_chunk_name, file)
+        """Stores the chunk. The chunk is written to a temporary file with no lock held
+        (chunks of the same upload are written concurrently): the lock of the upload is
+        taken only to move it in place, and to update the manifest."""
+        tmp_path = self._write_temporary(file)
+        try:
+            with self._locked():
+                manifest = self._read_manifest()
+                if 'assembled' in manifest:
+                    if self._assembled(manifest) is not None:
+                        self._manifest = manifest
+                        return  # chunk of an upload already completed
+                    # a new upload of a file already assembled (and moved)
+                    manifest = {'filename': self.filename, 'chunks': {}, 'size': 0}
+                os.replace(tmp_path, self.storage.path(self.current_chunk_name))
+                chunks = manifest['chunks']
+                manifest['size'] += file.size - chunks.get(self.current_chunk_number, 0)
+                chunks[self.current_chunk_number] = file.size
+                self._update_hashes(manifest, file, received=lambda number: str(number) in chunks)
+                self._write_manifest(manifest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._manifest = manifest
+
+    def _write_temporary(self, file):
+        """Writes the chunk to a temporary file (with a unique name) in the directory of the upload"""
+        directory = self.storage.path(self.upload_dir)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.current_chunk_name) + '.',
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for block in file.chunks():
+                    tmp_file.write(block)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        permissions = getattr(self.storage, 'file_permissions_mode', None)
+        if permissions is not None:
+            os.chmod(tmp_path, permissions)
+        return tmp_path
+
+    @property
+    def size(self):
+        """Gets chunks size.
+        """
+        return self.manifest['size']
+
+    # ---------
+    # Checksums
+    # ---------
+
+    def _read_chunk(self, number):
+        """Iterates over the content of the (stored) chunk"""
+        with self.storage.open(self._chunk_name(str(number)), 'rb') as chunk:
+            for block in iter(lambda: chunk.read(COPY_BUFFER_SIZE), b''):
+                yield block
+
+    def _update_hashes(self, manifest, file, received):
+        """Hashes the current chunk (file) if it follows the chunks hashed so far, along with the
+        chunks received after it (called with the lock of the upload held). `received` tells whether
+        the chunk with the given number has been received: chunks received out of order are read back
+        once the chunks before them are hashed."""
+        algorithms = [a for a in get_checksum_algorithms() if resumable_hash_available(a)]
+        hashes = manifest.setdefault('hashes', {'chunks': 0, 'states': {}})
+        if not algorithms or (hashes['chunks'] and sorted(hashes['states']) != sorted(algorithms)):
+            return  # checksums changed in the middle of the upload
+        number, current = hashes['chunks'] + 1, int(self.current_chunk_number)
+        if number != current:
+            return
+        hashers = [ResumableHash(algorithm, hashes['states'].get(algorithm)) for algorithm in algorithms]
+        while number <= self.total_chunks and received(number):
+            for block in (file.chunks() if number == current else self._read_chunk(number)):
+                for hasher in hashers:
+                    hasher.update(block)
+            number += 1
+        hashes['chunks'] = number - 1
+        hashes['states'] = {hasher.name: hasher.state for hasher in hashers}
+
+    def _save_checksums(self, name, manifest):
+        """Saves the checksums of the complete file next to it (if all its chunks have been hashed)"""
+        hashes = manifest.get('hashes')
+        if not hashes or hashes['chunks'] != self.total_chunks or not hashes['states']:
+            return
+        try:
+            path = self.storage.path(name)
+        except NotImplementedError:
+            return
+        write_checksums(path, {algorithm: ResumableHash(algorithm, state).hexdigest()
+                               for algorithm, state in hashes['states'].items()})
+
+    # --------
+    # Manifest
+    # --------
+
+    @property
+    def manifest(self):
+        """Received chunks (number -> size), and their total size"""
+        if getattr(self, '_manifest', None) is None:
+            self._manifest = self._read_manifest()
+        return self._manifest
+
+    def _manifest_path(self):
+        return self.storage.path(os.path.join(self.upload_dir, self.MANIFEST_NAME))
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {'filename': self.filename, 'chunks': {}, 'size': 0}
+
+    def _write_manifest(self, manifest):
+        path = self._manifest_path()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(tmp_path, path)  # readers never see a partial manifest
+
+    @contextmanager
+    def _locked(self):
+        """Serialise the updates of the manifest (chunks are uploaded concurrently).
+        Renews the lease of the upload (see `django_resumable.cleanup`)."""
+        directory = self.storage.path(self.upload_dir)
+        lock_path = os.path.join(directory, self.LOCK_NAME)
+        while True:
+            os.makedirs(directory, exist_ok=True)
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    if not _is_current(lock_file, lock_path):
+                        continue  # the upload has been collected while waiting for the lock
+                    os.utime(lock_path)
+                    yield
+                    return
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class DirectResumableFile(ResumableFile):
+    """File uploaded in chunks, each written in place in the complete file.
+
+    The file is preallocated (from `resumableTotalSize`) in the directory of
+    the upload, and each chunk is written at its offset with positional
+    writes, so chunks uploaded concurrently never wait for each other.
+    Received chunks are tracked in a bitmap (one bit per chunk): the complete
+    file is moved in the storage, with no concatenation.
+    """
+    DATA_NAME = 'data'
+    BITMAP_NAME = 'bitmap'
+
+    @property
+    def chunk_exists(self):
+        """Checks if the requested chunk exists.
+        """
+        if self._assembled(self.manifest) is not None:
+            return True
+        number = int(self.current_chunk_number) - 1
+        bitmap = self._read_bitmap()
+        return number // 8 < len(bitmap) and bool(bitmap[number // 8] & (1 << number % 8))
+
+    @property
+    def chunk_names(self):
+        return [os.path.join(self.upload_dir, self.DATA_NAME)]
+
+    @property
+    def is_complete(self):
+        """Checks if all chunks are already stored.
+        """
+        return self._received_chunks() == self.total_chunks
 
     @property
     def size(self):
         """Gets chunks size.
         """
-        size = 0
-        for chunk in self.chunk_names:
-            size += self.storage.size(chunk)
+        received = self._read_bitmap()
+        size = self._received_chunks(received) * self.chunk_size
+        last = self.total_chunks - 1
+        if received and received[last // 8] & (1 << last % 8):
+            size += self._chunk_size(self.total_chunks) - self.chunk_size
         return size
 
+    @property
+    def chunk_size(self):
+        return int(self.kwargs.get('resumableChunkSize'))
+
+    def _chunk_size(self, number):
+        """Expected size of the chunk (the last one gets the remaining bytes)"""
+        if number == self.total_chunks:
+            return int(self.kwargs.get('resumableTotalSize')) - (number - 1) * self.chunk_size
+        return self.chunk_size
+
+    def process_chunk(self, file):
+        number = int(self.current_chunk_number)
+        if not 1 <= number <= self.total_chunks or file.size != self._chunk_size(number):
+            raise Exception('Invalid chunk')
+        data_path = self.storage.path(os.path.join(self.upload_dir, self.DATA_NAME))
+        with self._locked():
+            manifest = self._read_manifest()
+            if 'assembled' in manifest:
+                if self._assembled(manifest) is not None:
+                    self._manifest = manifest
+                    return  # chunk of an upload already completed
+                os.remove(self._manifest_path())  # a new upload of a file already assembled (and moved)
+            if not os.path.exists(data_path):
+                self._preallocate(data_path)
+
+        fd = os.open(data_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            offset = (number - 1) * self.chunk_size
+            for block in file.chunks():
+                view = memoryview(block)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    offset += written
+                    view = view[written:]
+        finally:
+            os.close(fd)
+
+        # the chunk is marked as received once written (and hashed, if it is the next one)
+        with self._locked():
+            manifest = self._read_manifest()
+            if self._assembled(manifest) is not None:
+                return  # same chunk received twice, and the upload completed meanwhile
+            fd = os.open(self._bitmap_path(), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+            try:
+                position = (number - 1) // 8
+                byte = os.pread(fd, 1, position)[0]
+                os.pwrite(fd, bytes([byte | 1 << (number - 1) % 8]), position)
+            finally:
+                os.close(fd)
+            bitmap = self._read_bitmap()
+            self._update_hashes(manifest, file, received=lambda n: bool(bitmap[(n - 1) // 8] & 1 << (n - 1) % 8))
+            self._write_manifest(manifest)
+
+    def assemble(self):
+        """Moves the complete file in the storage, and returns its name.
+        """
+        if not self.is_complete:
+            raise Exception('Chunk(s) still missing')
+        name, fd = self._create_file(self.filename)
+        os.close(fd)
+        try:
+            os.replace(self.storage.path(self.chunk_names[0]), self.storage.path(name))
+        except OSError:
+            self.storage.delete(name)  # no empty file is left behind
+            raise
+        self._finalise(name)
+        return name
+
+    def _read_chunk(self, number):
+        """Iterates over the content of the chunk (read at its offset in the file)"""
+        fd = os.open(self.storage.path(self.chunk_names[0]), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            offset = (number - 1) * self.chunk_size
+            end = offset + self._chunk_size(number)
+            while offset < end:
+                block = os.pread(fd, min(end - offset, COPY_BUFFER_SIZE), offset)
+                if not block:
+                    raise IOError('Unexpected end of file')
+                offset += len(block)
+                yield block
+        finally:
+            os.close(fd)
+
+    def _delete_parts(self):
+        """Deletes the bitmap of the received chunks (the file has been moved)"""
+        try:
+            os.remove(self._bitmap_path())
+        except FileNotFoundError:
+            pass
+
+    # ------
+    # Bitmap
+    # ------
+
+    def _bitmap_path(self):
+        return self.storage.path(os.path.join(self.upload_dir, self.BITMAP_NAME))
+
+    def _read_bitmap(self):
+        try:
+            with open(self._bitmap_path(), 'rb') as bitmap_file:
+                return bitmap_file.read()
+        except OSError:
+            return b''
+
+    def _received_chunks(self, bitmap=None):
+        bitmap = self._read_bitmap() if bitmap is None else bitmap
+        return bin(int.from_bytes(bitmap, 'little')).count('1')
+
+    def _preallocate(self, data_path):
+        """Creates the (empty) bitmap, and the file with its final size"""
+        with open(self._bitmap_path(), 'wb') as bitmap_file:
+            bitmap_file.write(bytes((self.total_chunks + 7) // 8))
+        fd = os.open(data_path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            total_size = int(self.kwargs.get('resumableTotalSize'))
+            try:
+                os.posix_fallocate(fd, 0, total_size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, total_size)  # sparse file, where allocation is not supported
+        finally:
+            os.close(fd)
+        os.replace(data_path + '.tmp', data_path)
+
+
+def get_resumable_file_class():
+    """
+    Looks at the RESUMABLE_DIRECT_WRITES setting and returns the class of the
+    uploaded files: chunks are written in place in the complete file
+    (filesystem storages only), or stored in files of their own (default).
+    """
+    if getattr(settings, 'RESUMABLE_DIRECT_WRITES', False):
+        return DirectResumableFile
+    return ResumableFile
+
+
+def _is_current(lock_file, lock_path):
+    """Checks if the (open) lock file is still the one at lock_path"""
+    try:
+        return os.path.samestat(os.fstat(lock_file.fileno()), os.stat(lock_path))
+    except FileNotFoundError:
+        return False
+
+
+def _kernel_copies():
+    if hasattr(os, 'copy_file_range'):
+        yield lambda src, dst, count: os.copy_file_range(src, dst, count)
+    if hasattr(os, 'sendfile'):
+        yield lambda src, dst, count: os.sendfile(dst, src, None, count)
+
+
+def copy_fd(src, dst, count):
+    """Copies count bytes from the src to the dst file descriptor (from their current offsets).
+
+    Bytes are copied in kernel space when possible: the next copy function is
+    tried if one is not supported (e.g. by the filesystem), and read/write (in
+    blocks of COPY_BUFFER_SIZE bytes) is the last resort.
+    """
+    for kernel_copy in _kernel_copies():
+        try:
+            while count > 0:
+                copied = kernel_copy(src, dst, min(count, MAX_KERNEL_COPY))
+                if not copied:
+                    raise IOError('Unexpected end of file')
+                count -= copied
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_COPY_ERRORS:
+                raise
+    while count > 0:
+        block = os.read(src, min(count, COPY_BUFFER_SIZE))
+        if not block:
+            raise IOError('Unexpected end of file')
+        view = memoryview(block)
+        while view:
+            view = view[os.write(dst, view):]
+        count -= len(block)
+
+
+# =========
+# Checksums
+# =========
+
+def get_checksum_algorithms():
+    """Algorithms (`hashlib` names) of the checksums of the uploaded files (RESUMABLE_CHECKSUMS setting).
+    Checksums are computed as the chunks are received (algorithms supported by `django_resumable.hashing`):
+    uploads never read the complete file, which is copied (or moved) in kernel space."""
+    return list(getattr(settings, 'RESUMABLE_CHECKSUMS', ['sha256']))
+
+
+def file_checksums(path, algorithms, max_rate=None):
+    """Hashers of the content of the file (read in blocks of COPY_BUFFER_SIZE bytes).
+    Reads are throttled to max_rate bytes per second, if given."""
+    hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+    if not hashers:
+        return hashers
+    start, read = time.monotonic(), 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            for hasher in hashers:
+                hasher.update(block)
+            read += len(block)
+            if max_rate:
+                delay = read / max_rate - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+    return hashers
+
+
+def checksums_path(path):
+    return path + CHECKSUMS_SUFFIX
+
+
+def write_checksums(path, checksums):
+    """Saves the checksums (algorithm -> hex digest) of the file next to it"""
+    with open(checksums_path(path), 'w', encoding='utf-8') as checksums_file:
+        json.dump(checksums, checksums_file)
+
+
+def pop_checksums(path):
+    """Checksums saved next to the file (if any), which are deleted"""
+    try:
+        with open(checksums_path(path), encoding='utf-8') as checksums_file:
+            checksums = json.load(checksums_file)
+    except (OSError, ValueError):
+        return dict()
+    os.remove(checksums_path(path))
+    return checksums
+
 
 def ensure_dir(f):
     d = os.path.dirname(f)
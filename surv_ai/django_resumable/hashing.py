@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Hashes whose state can be saved, and restored later (e.g. by the request of
+the next chunk of an upload, possibly served by another process).
+
+`hashlib` objects cannot be serialised: the low-level digest functions of
+OpenSSL (libcrypto, loaded with ctypes) are used instead, as their context is
+a plain struct, saved as bytes. Resumable hashes are not available when
+libcrypto cannot be loaded (or does not behave as expected).
+"""
+import base64
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# algorithm -> prefix of the libcrypto functions, and digest size
+ALGORITHMS = {
+    'sha256': ('SHA256', 32),
+    'md5': ('MD5', 16),
+}
+# Size of the buffers of the contexts (SHA256_CTX and MD5_CTX are 112, and 92 bytes)
+CONTEXT_SIZE = 128
+
+
+def _load_libcrypto():
+    """The libcrypto library, if available and consistent with hashlib"""
+    name = ctypes.util.find_library('crypto')
+    if name is None:
+        return None
+    try:
+        libcrypto = ctypes.CDLL(name)
+        for prefix, _ in ALGORITHMS.values():
+            getattr(libcrypto, prefix + '_Init').argtypes = [ctypes.c_void_p]
+            getattr(libcrypto, prefix + '_Update').argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+            getattr(libcrypto, prefix + '_Final').argtypes = [ctypes.c_char_p, ctypes.c_void_p]
+    except (OSError, AttributeError) as e:
+        logger.warning('Resumable hashes not available: %s', e)
+        return None
+    return libcrypto
+
+
+_libcrypto = _load_libcrypto()
+
+
+def resumable_hash_available(algorithm):
+    return _libcrypto is not None and algorithm in ALGORITHMS
+
+
+class ResumableHash:
+    """Hash (as `hashlib` ones) whose state can be saved, and restored"""
+
+    def __init__(self, algorithm, state=None):
+        if not resumable_hash_available(algorithm):
+            raise ValueError('Resumable {} hashes are not available'.format(algorithm))
+        self.name = algorithm
+        self._prefix, self.digest_size = ALGORITHMS[algorithm]
+        if state is None:
+            self._context = ctypes.create_string_buffer(CONTEXT_SIZE)
+            self._function('Init')(self._context)
+        else:
+            context = base64.b64decode(state)
+            if len(context) != CONTEXT_SIZE:
+                raise ValueError('Invalid {} hash state'.format(algorithm))
+            self._context = ctypes.create_string_buffer(context, CONTEXT_SIZE)
+
+    def _function(self, name):
+        return getattr(_libcrypto, '{}_{}'.format(self._prefix, name))
+
+    def update(self, data):
+        data = bytes(data)
+        self._function('Update')(self._context, data, len(data))
+
+    @property
+    def state(self):
+        """The state of the hash (as an ASCII string)"""
+        return base64.b64encode(self._context.raw).decode('ascii')
+
+    def digest(self):
+        context = ctypes.create_string_buffer(self._context.raw, CONTEXT_SIZE)
+        digest = ctypes.create_string_buffer(self.digest_size)
+        self._function('Final')(digest, context)  # on a copy: more data can be added
+        return digest.raw
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+def _consistent():
+    """Checks the (restored) resumable hashes against hashlib"""
+    data = bytes(range(256)) * 5
+    for algorithm in ALGORITHMS:
+        resumable = ResumableHash(algorithm)
+        resumable.update(data[:100])
+        resumable = ResumableHash(algorithm, state=resumable.state)
+        resumable.update(data[100:])
+        if resumable.hexdigest() != hashlib.new(algorithm, data).hexdigest():
+            return False
+    return True
+
+
+if _libcrypto is not None and not _consistent():
+    logger.warning('Resumable hashes not available: unexpected libcrypto digests')
+    _libcrypto = None
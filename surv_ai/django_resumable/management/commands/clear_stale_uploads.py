@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from django_resumable.cleanup import (collect_stale_uploads, get_chunks_storages,
+                                      RESUMABLE_GC_MAX_AGE, RESUMABLE_GC_BATCH_SIZE)
+
+
+class Command(BaseCommand):
+    help = 'Remove the chunks of abandoned (i.e. incomplete, and no longer updated) resumable uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=RESUMABLE_GC_MAX_AGE,
+                            help='Seconds since the last chunk after which uploads are considered '
+                                 'abandoned (default: {})'.format(RESUMABLE_GC_MAX_AGE))
+        parser.add_argument('--batch-size', type=int, default=RESUMABLE_GC_BATCH_SIZE,
+                            help='Number of uploads deleted per batch (default: {})'.format(RESUMABLE_GC_BATCH_SIZE))
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the abandoned uploads, without deleting them')
+
+    def handle(self, *args, **options):
+        if options['max_age'] < 0 or options['batch_size'] < 1:
+            raise CommandError('Max age must not be negative, and batch size must be positive')
+        deleted, reclaimed = 0, 0
+        for storage in get_chunks_storages():
+            for n_uploads, n_bytes in collect_stale_uploads(storage, max_age=options['max_age'],
+                                                            batch_size=options['batch_size'],
+                                                            dry_run=options['dry_run']):
+                deleted += n_uploads
+                reclaimed += n_bytes
+                self.stdout.write('{}: {} uploads ({})'.format(storage.location, n_uploads, filesizeformat(n_bytes)))
+        action = 'to be deleted' if options['dry_run'] else 'deleted'
+        self.stdout.write(self.style.SUCCESS('{} abandoned uploads {} ({} reclaimed)'.format(
+            deleted, action, filesizeformat(reclaimed))))
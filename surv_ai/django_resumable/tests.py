@@ -1,3 +1,348 @@
-from django.test import TestCase
+import errno
+import hashlib
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+
+from .files import ResumableFile, DirectResumableFile, get_storage, copy_fd, pop_checksums
+from .cleanup import collect_stale_uploads, stale_uploads, _collect
+from .hashing import ResumableHash, resumable_hash_available
+
+CHUNK_SIZE = 1000
+
+
+class ResumableUploadTestCase(SimpleTestCase):
+    """Uploads of `data` in chunks of CHUNK_SIZE bytes (in a temporary MEDIA_ROOT)"""
+    resumable_class = ResumableFile
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = get_storage('chunks/')
+        self.data = os.urandom(CHUNK_SIZE * 7 + 5)
+        self.total_chunks = (len(self.data) + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+    def chunk(self, number):
+        return self.data[(number - 1) * CHUNK_SIZE:number * CHUNK_SIZE]
+
+    def resumable_file(self, number, owner=1):
+        kwargs = {'resumableIdentifier': 'identifier', 'resumableFilename': 'archive.zip',
+                  'resumableChunkNumber': str(number), 'resumableChunkSize': str(CHUNK_SIZE),
+                  'resumableCurrentChunkSize': str(len(self.chunk(number))),
+                  'resumableTotalSize': str(len(self.data)), 'resumableTotalChunks': str(self.total_chunks)}
+        return self.resumable_class(self.storage, kwargs, owner=owner)
+
+    def upload(self, number):
+        r = self.resumable_file(number)
+        if not r.chunk_exists:
+            r.process_chunk(SimpleUploadedFile('blob', self.chunk(number)))
+        return r
+
+    def stored_files(self):
+        return sorted(name for name in os.listdir(self.storage.location)
+                      if os.path.isfile(self.storage.path(name)))
+
+
+class OutOfOrderChunksTests(ResumableUploadTestCase):
+
+    def test_out_of_order_chunks(self):
+        order = [5, 1, 8, 3, 2, 7, 4, 6]
+        received = set()
+        for number in order:
+            self.assertFalse(self.resumable_file(number).is_complete)
+            self.upload(number)
+            received.add(number)
+            r = self.resumable_file(number)
+            self.assertEqual(r.size, sum(len(self.chunk(n)) for n in received))
+            self.assertEqual([self.resumable_file(n).chunk_exists for n in order],
+                             [n in received for n in order])
+        self.assertTrue(self.resumable_file(1).is_complete)
+
+        r = self.resumable_file(1)
+        name = r.complete()
+        self.assertTrue(name.endswith('archive.zip'))
+        with open(self.storage.path(name), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # the chunks are deleted (only the manifest, and its lock are left)
+        self.assertEqual(sorted(os.listdir(self.storage.path(r.upload_dir))), ['.lock', r.MANIFEST_NAME])
+
+    def test_chunk_sent_twice(self):
+        self.upload(3)
+        self.resumable_file(3).process_chunk(SimpleUploadedFile('blob', self.chunk(3)))
+        self.assertEqual(self.resumable_file(3).size, CHUNK_SIZE)
+        self.assertIsNone(self.resumable_file(3).complete())
+
+    def test_chunk_written_unlocked(self):
+        r = self.resumable_file(2)
+        lock_path = os.path.join(self.storage.path(r.upload_dir), r.LOCK_NAME)
+        test = self
+
+        class LockCheckingFile(SimpleUploadedFile):
+            def chunks(self, chunk_size=None):
+                # other chunks of the upload can take the lock meanwhile
+                with open(lock_path, 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                test.written = True
+                return super().chunks(chunk_size)
+
+        r.process_chunk(LockCheckingFile('blob', self.chunk(2)))
+        self.assertTrue(self.written)
+        self.assertTrue(self.resumable_file(2).chunk_exists)
+        # no temporary file is left
+        self.assertFalse([name for name in os.listdir(self.storage.path(r.upload_dir)) if name.endswith('.tmp')])
+
+    def test_uploads_of_owners(self):
+        self.upload(1)
+        self.assertTrue(self.resumable_file(1).chunk_exists)
+        self.assertFalse(self.resumable_file(1, owner=2).chunk_exists)
+
+
+class DirectOutOfOrderChunksTests(OutOfOrderChunksTests):
+    resumable_class = DirectResumableFile
+
+    def test_invalid_chunks(self):
+        r = self.resumable_file(1)
+        with self.assertRaises(Exception):
+            r.process_chunk(SimpleUploadedFile('blob', self.chunk(1)[:-1]))
+        r = self.resumable_file(self.total_chunks + 1)
+        with self.assertRaises(Exception):
+            r.process_chunk(SimpleUploadedFile('blob', self.chunk(1)))
+        self.assertEqual(self.resumable_file(1).size, 0)
+
+
+class ConcurrentCompletionTests(ResumableUploadTestCase):
+
+    def test_last_chunks_completed_concurrently(self):
+        last_chunks = range(self.total_chunks - 3, self.total_chunks + 1)
+        for number in range(1, last_chunks[0]):
+            self.upload(number)
+        barrier = threading.Barrier(len(last_chunks))
+
+        def upload_last(number):
+            r = self.upload(number)
+            barrier.wait()
+            return r.complete()
+
+        with ThreadPoolExecutor(len(last_chunks)) as executor:
+            names = list(executor.map(upload_last, last_chunks))
+
+        # assembled once: every request gets the same file
+        self.assertEqual(len(set(names)), 1)
+        self.assertEqual([name for name in self.stored_files() if not name.endswith('.json')], [names[0]])
+        with open(self.storage.path(names[0]), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # chunks sent again (e.g. retried) get the file as well
+        self.assertTrue(self.resumable_file(1).chunk_exists)
+        self.assertEqual(self.upload(1).complete(), names[0])
+
+    def test_upload_again_once_moved(self):
+        for number in range(1, self.total_chunks + 1):
+            self.upload(number)
+        name = self.resumable_file(1).complete()
+        os.remove(self.storage.path(name))  # e.g. moved when saved in a model
+
+        r = self.resumable_file(1)
+        self.assertFalse(r.chunk_exists)
+        self.upload(1)
+        self.assertIsNone(self.resumable_file(1).complete())
+
+
+class DirectConcurrentCompletionTests(ConcurrentCompletionTests):
+    resumable_class = DirectResumableFile
+
+
+class CopyFdTests(SimpleTestCase):
+    """Chunks are assembled with kernel copies (read/write being the last resort)"""
+
+    def setUp(self):
+        self.data = os.urandom(10000)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.src_path, self.dst_path = os.path.join(directory, 'src'), os.path.join(directory, 'dst')
+        with open(self.src_path, 'wb') as f:
+            f.write(self.data)
+
+    def copy(self, count, offset=0):
+        # (copy_file_range does not support files opened in append mode)
+        with open(self.src_path, 'rb') as src, open(self.dst_path, 'r+b' if offset else 'wb') as dst:
+            src.seek(offset)
+            dst.seek(offset)
+            copy_fd(src.fileno(), dst.fileno(), count)
+        with open(self.dst_path, 'rb') as f:
+            return f.read()
+
+    def test_copy(self):
+        self.assertEqual(self.copy(4000), self.data[:4000])
+        # from the current offsets
+        self.assertEqual(self.copy(6000, offset=4000), self.data)
+
+    def test_unsupported_kernel_copy(self):
+        def unsupported(src, dst, count):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        with mock.patch('django_resumable.files._kernel_copies', return_value=[unsupported]), \
+                mock.patch('django_resumable.files.COPY_BUFFER_SIZE', 1024):
+            self.assertEqual(self.copy(len(self.data)), self.data)
+
+    def test_unexpected_end_of_file(self):
+        with self.assertRaises(IOError):
+            self.copy(len(self.data) + 1)
+
+    def test_errors(self):
+        def failing(src, dst, count):
+            raise OSError(errno.ENOSPC, 'No space left on device')
+
+        with mock.patch('django_resumable.files._kernel_copies', return_value=[failing]):
+            with self.assertRaises(OSError):
+                self.copy(10)
+
+
+@override_settings(RESUMABLE_CHECKSUMS=['sha256', 'md5'])
+class UploadChecksumsTests(ResumableUploadTestCase):
+    """Checksums are computed as the chunks are received (the complete file is never read)"""
+
+    def setUp(self):
+        if not resumable_hash_available('sha256'):
+            self.skipTest('libcrypto not available')
+        super().setUp()
+
+    def upload_all(self, order):
+        for number in order:
+            self.upload(number)
+        return self.storage.path(self.resumable_file(1).complete())
+
+    def assertChecksums(self, path):
+        self.assertEqual(pop_checksums(path), {'sha256': hashlib.sha256(self.data).hexdigest(),
+                                               'md5': hashlib.md5(self.data).hexdigest()})
+        self.assertEqual(pop_checksums(path), {})  # deleted once read
+
+    def test_in_order(self):
+        with mock.patch.object(self.resumable_class, '_read_chunk', side_effect=AssertionError):
+            path = self.upload_all(range(1, self.total_chunks + 1))
+        self.assertChecksums(path)
+
+    def test_out_of_order(self):
+        read = list()
+        read_chunk = self.resumable_class._read_chunk
+
+        def reading(resumable, number):
+            read.append(number)
+            return read_chunk(resumable, number)
+
+        with mock.patch.object(self.resumable_class, '_read_chunk', reading):
+            path = self.upload_all([2, 1, 3, 5, 6, 4, 8, 7])
+        self.assertChecksums(path)
+        # only the chunks received ahead of the hashed ones are read back
+        self.assertEqual(read, [2, 5, 6, 8])
+
+    def test_chunk_sent_twice(self):
+        self.upload(1)
+        self.resumable_file(1).process_chunk(SimpleUploadedFile('blob', self.chunk(1)))
+        self.assertChecksums(self.upload_all(range(2, self.total_chunks + 1)))
+
+    def test_checksums_changed(self):
+        self.upload(1)
+        with override_settings(RESUMABLE_CHECKSUMS=['sha256']):
+            path = self.upload_all(range(2, self.total_chunks + 1))
+        self.assertEqual(pop_checksums(path), {})
+
+
+class DirectUploadChecksumsTests(UploadChecksumsTests):
+    resumable_class = DirectResumableFile
+
+
+class ResumableHashTests(SimpleTestCase):
+
+    def setUp(self):
+        if not resumable_hash_available('sha256'):
+            self.skipTest('libcrypto not available')
+
+    def test_restored_state(self):
+        data = os.urandom(5000)
+        for algorithm in ('sha256', 'md5'):
+            resumable = ResumableHash(algorithm)
+            resumable.update(data[:1234])
+            self.assertEqual(resumable.hexdigest(), hashlib.new(algorithm, data[:1234]).hexdigest())
+            restored = ResumableHash(algorithm, state=resumable.state)
+            restored.update(memoryview(data)[1234:])
+            self.assertEqual(restored.hexdigest(), hashlib.new(algorithm, data).hexdigest())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            ResumableHash('sha1')
+        with self.assertRaises(ValueError):
+            ResumableHash('sha256', state='YWJj')
+
+
+class StaleUploadsTests(ResumableUploadTestCase):
+    """Abandoned uploads are collected, unless their lease is renewed (or they are in use)"""
+    max_age = 60
+
+    def abandon(self, path, age=120):
+        """Set the modification time of the upload (and of its files) age seconds ago"""
+        past = time.time() - age
+        for name in os.listdir(path):
+            os.utime(os.path.join(path, name), (past, past))
+        os.utime(path, (past, past))
+
+    def collect(self, **kwargs):
+        results = list(collect_stale_uploads(self.storage, max_age=self.max_age, **kwargs))
+        return sum(n for n, _ in results), sum(size for _, size in results)
+
+    def test_collected(self):
+        self.upload(1)
+        path = self.storage.path(self.resumable_file(1).upload_dir)
+        self.abandon(path)
+        deleted, reclaimed = self.collect(dry_run=True)
+        self.assertEqual(deleted, 1)
+        self.assertGreaterEqual(reclaimed, CHUNK_SIZE)
+        self.assertTrue(os.path.exists(path))  # dry run
+        self.assertEqual(self.collect()[0], 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_live_uploads(self):
+        self.upload(1)
+        self.assertEqual(self.collect(), (0, 0))
+        self.assertTrue(self.resumable_file(1).chunk_exists)
+
+    def test_lease_renewed(self):
+        self.upload(1)
+        path = self.storage.path(self.resumable_file(1).upload_dir)
+        self.abandon(path)
+        uploads = list(stale_uploads(self.storage, max_age=self.max_age))
+        self.assertEqual([upload for upload, _ in uploads], [path])
+        self.upload(2)  # after the scan, before the deletion
+        self.assertEqual(_collect(uploads, self.max_age, dry_run=False), (0, 0))
+        self.assertEqual(self.resumable_file(1).size, 2 * CHUNK_SIZE)
+
+    def test_locked_upload(self):
+        self.upload(1)
+        r = self.resumable_file(1)
+        path = self.storage.path(r.upload_dir)
+        self.abandon(path)
+        with open(os.path.join(path, r.LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # a chunk is being processed
+            self.assertEqual(self.collect(), (0, 0))
+        self.assertTrue(os.path.exists(path))
+
+    def test_legacy_chunks(self):
+        legacy = self.storage.path('1000_archive.zip_part_0001')
+        with open(legacy, 'wb') as f:
+            f.write(self.chunk(1))
+        self.assertEqual(self.collect()[0], 0)
+        past = time.time() - 120
+        os.utime(legacy, (past, past))
+        self.assertEqual(self.collect()[0], 1)
+        self.assertFalse(os.path.exists(legacy))
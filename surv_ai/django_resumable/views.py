@@ -1,26 +1,25 @@
 from django.http import HttpResponse
-from .files import ResumableFile, get_storage, get_chunks_upload_to
+from .files import get_resumable_file_class, get_storage, get_chunks_upload_to
 
 
 def resumable_upload(request):
     upload_to = get_chunks_upload_to(request)
     storage = get_storage(upload_to)
+    resumable_file = get_resumable_file_class()
     if request.method == 'POST':
         chunk = request.FILES.get('file')
-        r = ResumableFile(storage, request.POST)
+        r = resumable_file(storage, request.POST, owner=request.user.pk)
         if not r.chunk_exists:
             r.process_chunk(chunk)
-        if r.is_complete:
-            actual_filename = storage.save(r.filename, r.file)
-            r.delete_chunks()
+        actual_filename = r.complete()
+        if actual_filename is not None:
             return HttpResponse(storage.url(actual_filename), status=201)
         return HttpResponse('chunk uploaded')
     elif request.method == 'GET':
-        r = ResumableFile(storage, request.GET)
+        r = resumable_file(storage, request.GET, owner=request.user.pk)
         if not r.chunk_exists:
             return HttpResponse('chunk not found', status=404)
-        if r.is_complete:
-            actual_filename = storage.save(r.filename, r.file)
-            r.delete_chunks()
+        actual_filename = r.complete()
+        if actual_filename is not None:
             return HttpResponse(storage.url(actual_filename), status=201)
         return HttpResponse('chunk exists', status=200)